@@ -0,0 +1,126 @@
+import os
+import json
+import math
+import numpy as np
+
+INDEX_TYPES = ["flat", "ivf", "hnsw", "ivfpq"]
+ANN_META_FILE = "ann.json"
+IVF_DATA_FILE = "index.ivfdata"
+
+
+def default_nlist(ntotal: int) -> int:
+    # ~4 * sqrt(n) lists, keeping at least 39 training points per list as faiss recommends
+    return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+def iter_vectors(flat_index, batch_size=65536):
+    for start in range(0, flat_index.ntotal, batch_size):
+        yield flat_index.reconstruct_n(start, min(batch_size, flat_index.ntotal - start))
+
+def build_ann_index(flat_index, index_type: str, nlist: int = None, hnsw_m: int = 32,
+                    pq_m: int = 16, train_size: int = 100_000):
+    """
+    Build an approximate index over the vectors of `flat_index`, keeping positions
+    identical so the vectorstore's index_to_docstore_id mapping still applies.
+    IVF variants are trained on a random sample of at most `train_size` vectors.
+    """
+    import faiss
+
+    d, ntotal, metric = flat_index.d, flat_index.ntotal, flat_index.metric_type
+    nlist = nlist or default_nlist(ntotal)
+
+    if index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlat(d, metric), d, nlist, metric)
+    elif index_type == "ivfpq":
+        if d % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {d}")
+        index = faiss.IndexIVFPQ(faiss.IndexFlat(d, metric), d, nlist, pq_m, 8, metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, metric)
+        index.hnsw.efConstruction = 200
+    else:
+        raise ValueError(f"Unsupported index type: {index_type}")
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(ntotal, size=min(train_size, ntotal), replace=False))
+        index.train(np.vstack([flat_index.reconstruct(int(i)) for i in sample]).astype(np.float32))
+
+    for vectors in iter_vectors(flat_index):
+        index.add(vectors)
+    return index, {"type": index_type, "nlist": nlist, "hnsw_m": hnsw_m, "pq_m": pq_m, "ntotal": ntotal}
+
+def move_invlists_to_disk(index, path: str):
+    """
+    Store the inverted lists of an IVF index in a separate file that faiss memory-maps
+    on load, so server workers share them through the page cache.
+    """
+    import faiss
+
+    ivf = faiss.extract_index_ivf(index)
+    ondisk = faiss.OnDiskInvertedLists(ivf.nlist, ivf.code_size, path)
+    invlists = faiss.InvertedListsPtrVector()
+    invlists.push_back(ivf.invlists)
+    ondisk.merge_from_multiple(invlists.data(), invlists.size())
+    ivf.replace_invlists(ondisk, True)
+    ondisk.this.disown()
+
+def save_ann_index(flat_index, index_path: str, index_type: str, **options):
+    import faiss
+
+    index, meta = build_ann_index(flat_index, index_type, **options)
+    if index_type in ("ivf", "ivfpq"):
+        move_invlists_to_disk(index, os.path.join(index_path, IVF_DATA_FILE))
+    faiss.write_index(index, os.path.join(index_path, f"index.{index_type}.faiss"))
+    with open(os.path.join(index_path, ANN_META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def set_search_params(index, nprobe: int = 16, ef_search: int = 64):
+    import faiss
+
+    if hasattr(index, "nprobe"):
+        index.nprobe = nprobe
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+def search_parameters(index, positions):
+    """
+    Search parameters restricting `index` to the given sorted positions, keeping its
+    nprobe / efSearch. Flat indexes only visit the listed vectors, so a selective
+    filter is cheaper than an unfiltered search.
+    """
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexFlat):
+        return faiss.SearchParameters(sel=faiss.IDSelectorArray(positions))
+    selector = faiss.IDSelectorBatch(positions)
+    if hasattr(index, "nprobe"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def load_ann_index(index_path: str, ntotal: int, nprobe: int = 16, ef_search: int = 64, mmap: bool = False):
+    """
+    Load the approximate index written by build_kb.py, or None when there is none or
+    it no longer matches the flat index (e.g. an interrupted build). With `mmap` the
+    HNSW vectors are memory-mapped too; IVF lists always are.
+    """
+    import faiss
+
+    meta_path = os.path.join(index_path, ANN_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta["ntotal"] != ntotal:
+        print(f"⚠️ Ignoring stale {meta['type']} index: {meta['ntotal']} vectors, expected {ntotal}")
+        return None
+    # The index directory is renamed when a build swaps it in, so resolve index.ivfdata next to the index
+    flags = faiss.IO_FLAG_ONDISK_SAME_DIR
+    if mmap:
+        flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(os.path.join(index_path, f"index.{meta['type']}.faiss"), flags)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
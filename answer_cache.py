@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def index_fingerprint(index_path: str):
+    """Changes whenever build_kb.py saves a new index (the directory is swapped on save)."""
+    try:
+        folder = os.stat(index_path)
+        index = os.stat(os.path.join(index_path, "index.faiss"))
+    except FileNotFoundError:
+        return None
+    return (folder.st_ino, folder.st_mtime_ns, index.st_mtime_ns, index.st_size)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on question embeddings. A lookup hits when a cached question
+    has cosine similarity >= `threshold` with the new one, the same `scope` (the
+    product and release the question names) and is younger than `ttl` seconds. Least recently used entries are evicted beyond `max_entries`, and the
+    whole cache is dropped when the FAISS index on disk changes.
+    """
+
+    def __init__(self, index_path: str, threshold: float = 0.95, ttl: float = 3600,
+                 max_entries: int = 1000, check_interval: float = 10):
+        self.index_path = index_path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.next_key = 0
+        self.fingerprint = index_fingerprint(index_path)
+        self.last_check = time.monotonic()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @staticmethod
+    def normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def check_index(self):
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        fingerprint = index_fingerprint(self.index_path)
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.entries.clear()
+            self.invalidations += 1
+
+    def lookup(self, vector, scope=None):
+        vector = self.normalize(vector)
+        with self.lock:
+            self.check_index()
+            now = time.monotonic()
+            for key in [key for key, (_, _, created, _) in self.entries.items() if now - created > self.ttl]:
+                del self.entries[key]
+
+            # Questions about another product or release embed almost alike
+            keys = [key for key, entry in self.entries.items() if entry[3] == scope]
+            if keys:
+                scores = np.stack([self.entries[key][0] for key in keys]) @ vector
+                best = int(scores.argmax())
+                if scores[best] >= self.threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self.entries[keys[best]][1]
+            self.misses += 1
+            return None
+
+    def store(self, vector, payload, scope=None):
+        with self.lock:
+            self.entries[self.next_key] = (self.normalize(vector), payload, time.monotonic(), scope)
+            self.next_key += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,900 @@
+"""
+Benchmarks for the knowledge base builder and the chat server.
+
+    python benchmark.py classify --folders "YOUR-PATH-TO-REPOSITORIES" --limit 200
+    python benchmark.py startup
+    python benchmark.py stream --question "How to configure OSPF?"
+    python benchmark.py loadtest --requests 200 --concurrency 50
+    python benchmark.py intent
+    python benchmark.py ann --k 20
+    python benchmark.py retrieval --top-n 5
+    python benchmark.py filter --filter "only AOS 8.9 guides"
+    python benchmark.py memory --pages 500 3000 --rows 20000 200000
+    python benchmark.py sheets --rows 10000 100000
+    python benchmark.py formats --sections 200 2000
+    python benchmark.py embeddings --backends torch onnx onnx-int8
+    python benchmark.py batching --concurrency 1 8 32
+    python benchmark.py convert --interfaces 10 100 1000 10000
+
+Server benchmarks can run offline against the stub LLM: AIOPS_STUB_LLM=1 uvicorn chatbot:app
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+
+def bench_classify(args):
+    """Throughput of each document type classifier and how often they agree."""
+    from build_kb import iter_supported_files
+    from utilities import process_file, infer_document_types, set_classifier, CLASSIFIERS
+
+    heads = []
+    for file in iter_supported_files(args.folders):
+        try:
+            _, _, _, pages = process_file(file, classify=False)
+            first = next(pages, None) if pages else None
+            if first:
+                heads.append(first["text"])
+        except Exception as e:
+            print(f"❌ Skipping {file}: {e}")
+        if len(heads) >= args.limit:
+            break
+    if not heads:
+        print("No documents found.")
+        return
+
+    predictions = {}
+    for name in CLASSIFIERS:
+        set_classifier(name)
+        infer_document_types(heads[:1], use_cache=False)  # Load the model outside the timing
+        start = time.perf_counter()
+        predictions[name] = infer_document_types(heads, batch_size=args.batch_size, use_cache=False)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10} {len(heads):>6} docs  {elapsed:8.2f}s  {len(heads) / elapsed:8.1f} docs/s")
+
+    baseline = predictions[CLASSIFIERS[0]]
+    for name in CLASSIFIERS[1:]:
+        agreement = sum(a == b for a, b in zip(baseline, predictions[name])) / len(heads)
+        print(f"Label agreement {CLASSIFIERS[0]} vs {name}: {agreement:.1%}")
+
+STARTUP_PROBE = """
+import json, time, resource
+start = time.perf_counter()
+import {module}
+{target}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+def bench_startup(args):
+    """
+    Cold import time and peak memory, each measured in a fresh interpreter. The server
+    targets run once per index layout: unpickled index.pkl vs memory-mapped vectors
+    with chunks read from docstore.sqlite.
+    """
+    layouts = {"pickle": {"AIOPS_MMAP_INDEX": "0"}, "mmap": {"AIOPS_MMAP_INDEX": "1"}}
+    targets = [("import utilities", "utilities", "", {})]
+    for layout, env in layouts.items():
+        targets += [
+            (f"import search [{layout}]", "search", "", env),
+            (f"chatbot:app [{layout}]", "chatbot", "chatbot.app", env),
+            (f"first query [{layout}]", "search", f"search.retriever.invoke({args.question!r})", env),
+        ]
+    for label, module, target, env in targets:
+        runs = []
+        for _ in range(args.repeat):
+            probe = STARTUP_PROBE.format(module=module, target=target)
+            output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                    env=dict(os.environ, **env))
+            if output.returncode != 0:
+                print(f"{label:<24} failed: {output.stderr.strip().splitlines()[-1]}")
+                break
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        if runs:
+            best = min(runs, key=lambda run: run["seconds"])
+            print(f"{label:<24} {best['seconds']:8.2f}s  {best['max_rss_mb']:8.0f} MB")
+
+def bench_stream(args):
+    """Client-side time to first token and total time of the streaming endpoint."""
+    ttfts, totals = [], []
+    for _ in range(args.repeat):
+        request = urllib.request.Request(
+            f"{args.url}/process_input/stream",
+            data=json.dumps({"user_input": args.question}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        start = time.perf_counter()
+        first_token = None
+        with urllib.request.urlopen(request) as response:
+            for line in response:
+                event = json.loads(line)
+                if event["event"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif event["event"] == "error":
+                    print(f"❌ Server error: {event['error']}")
+                    return
+        totals.append(time.perf_counter() - start)
+        if first_token is not None:
+            ttfts.append(first_token)
+
+    if ttfts:
+        print(f"Time to first token  median {statistics.median(ttfts) * 1000:8.0f} ms")
+    print(f"Total response time  median {statistics.median(totals) * 1000:8.0f} ms")
+
+def fake_openai_app(delay: float, token_delay: float):
+    """OpenAI-compatible /v1/chat/completions that sleeps instead of generating."""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+    answer = "OSPF is configured with ip load ospf and ip ospf admin-state enable."
+
+    def reply(body):
+        system = body["messages"][0]["content"]
+        if "classify user input" in system:
+            result = [{"domain": "external_knowledge", "sub_intent": "specification", "feature": "", "entities": {}}]
+            return json.dumps({"result": json.dumps(result)})
+        return answer
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        content = reply(body)
+        await asyncio.sleep(delay)
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "gpt-4o")}
+
+        if not body.get("stream"):
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(content.split()), "total_tokens": 100 + len(content.split())},
+            }
+
+        async def events():
+            for i, word in enumerate(content.split(" ")):
+                await asyncio.sleep(token_delay)
+                delta = {"role": "assistant", "content": word} if i == 0 else {"content": f" {word}"}
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def wait_for_server(url, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2)
+            return True
+        except Exception:
+            time.sleep(0.5)
+    return False
+
+async def fire_requests(url, path, total, concurrency):
+    import httpx
+
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker(client):
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post(f"{url}{path}", json={"user_input": "How to configure OSPF?"})
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, sorted(latencies), statuses
+
+def bench_loadtest(args):
+    """Throughput of the chat server against a local fake OpenAI server with fixed latency."""
+    import uvicorn
+
+    fake = uvicorn.Server(uvicorn.Config(
+        fake_openai_app(args.llm_delay, args.token_delay), port=args.fake_port, log_level="warning"
+    ))
+    threading.Thread(target=fake.run, daemon=True).start()
+
+    env = dict(os.environ, OPENAI_BASE_URL=f"http://127.0.0.1:{args.fake_port}/v1", OPENAI_API_KEY="fake")
+    env.pop("AIOPS_STUB_LLM", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "chatbot:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_for_server(f"{url}/"):
+            print("❌ Chat server did not start.")
+            return
+        for path in ["/process_input", "/process_input/stream"]:
+            elapsed, latencies, statuses = asyncio.run(fire_requests(url, path, args.requests, args.concurrency))
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(
+                f"{path:<24} {args.requests / elapsed:7.1f} req/s  p50 {p50 * 1000:7.0f} ms  "
+                f"p99 {p99 * 1000:7.0f} ms  status {statuses}"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+        fake.should_exit = True
+
+# Held-out questions for the intent router, none of them appear in INTENT_EXAMPLES
+INTENT_TEST_SET = [
+    ("Add VLAN 30 named Guests to the core switches.", "live_network", "config_vlan"),
+    ("Set the description of port 1/1/3 on sw-access-2 to printer.", "live_network", "config"),
+    ("What is the temperature of the chassis on switch 10.0.0.5 right now?", "live_network", "monitoring"),
+    ("Users on floor 3 cannot get an IP address, troubleshoot the access switch.", "live_network", "troubleshooting"),
+    ("How many MAC addresses does the OmniSwitch 6360 support?", "external_knowledge", "specification"),
+    ("What is the switching capacity of the OS6900-X72?", "external_knowledge", "specification"),
+    ("How do I configure a static route on AOS?", "external_knowledge", "configuration_guide"),
+    ("Steps to configure VRRP between two OmniSwitches", "external_knowledge", "configuration_guide"),
+    ("What is the command to show the OSPF neighbors?", "external_knowledge", "configuration_guide"),
+    ("What is MVRP used for?", "external_knowledge", "concept"),
+    ("Convert this Cisco config to AOS: vlan 5 name Voice", "external_knowledge", "convert_configuration"),
+    ("Can you translate my Cisco switch configuration into Alcatel-Lucent syntax?", "external_knowledge", "convert_configuration"),
+    ("Check that all switches use NTP server 10.0.0.1 as required by our policy.", "hybrid_intelligence", "compliance"),
+    ("Find the switches whose configuration deviates from the golden template.", "hybrid_intelligence", "audit"),
+    ("Recommend how to rebalance traffic across the aggregation uplinks.", "hybrid_intelligence", "optimization"),
+    ("Every Sunday, back up all switch configurations to the TFTP server.", "automation", "backup"),
+    ("Roll out AOS 8.10 to every campus switch, one building at a time.", "automation", "firmware"),
+]
+
+def bench_intent(args):
+    """Accuracy, coverage and latency of the local intent router, optionally with the LLM for comparison."""
+    from models import get_embeddings
+    from intent_router import IntentRouter
+
+    router = IntentRouter(get_embeddings(), threshold=args.threshold)
+    router.route("warm up")
+
+    latencies, routed, correct_domain, correct = [], 0, 0, 0
+    for question, domain, sub_intent in INTENT_TEST_SET:
+        start = time.perf_counter()
+        intent, confidence = router.route(question)
+        latencies.append(time.perf_counter() - start)
+        if intent is None:
+            continue
+        routed += 1
+        correct_domain += intent["domain"] == domain
+        correct += intent["domain"] == domain and intent["sub_intent"] == sub_intent
+
+    total = len(INTENT_TEST_SET)
+    print(f"Router coverage      {routed / total:7.1%}  ({routed}/{total} answered locally)")
+    if routed:
+        print(f"Domain accuracy      {correct_domain / routed:7.1%}  (of routed)")
+        print(f"Sub-intent accuracy  {correct / routed:7.1%}  (of routed)")
+    latencies.sort()
+    print(f"Router latency       p50 {latencies[total // 2] * 1000:6.1f} ms  max {latencies[-1] * 1000:6.1f} ms")
+
+    if args.with_llm:
+        from search import get_intent_chain
+        from chatbot import parse_intent
+
+        latencies, correct_domain = [], 0
+        for question, domain, _ in INTENT_TEST_SET:
+            start = time.perf_counter()
+            intent = parse_intent(get_intent_chain.invoke({"question": question}).content)
+            latencies.append(time.perf_counter() - start)
+            correct_domain += intent["domain"] == domain
+        latencies.sort()
+        print(f"LLM domain accuracy  {correct_domain / total:7.1%}")
+        print(f"LLM latency          p50 {latencies[total // 2] * 1000:6.0f} ms  max {latencies[-1] * 1000:6.0f} ms")
+
+def bench_ann(args):
+    """Recall@k, per-query latency and index size of each index type against the flat baseline."""
+    import faiss
+    import numpy as np
+    from ann_index import build_ann_index, set_search_params
+
+    flat = faiss.read_index(os.path.join(args.index_path, "index.faiss"))
+    rng = np.random.default_rng(0)
+    # Stored vectors plus a little noise stand in for real queries
+    sample = rng.choice(flat.ntotal, size=min(args.queries, flat.ntotal), replace=False)
+    queries = np.vstack([flat.reconstruct(int(i)) for i in sample]).astype(np.float32)
+    queries += rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    _, truth = flat.search(queries, args.k)
+
+    def measure(index, label):
+        start = time.perf_counter()
+        found = [index.search(query[None, :], args.k)[1][0] for query in queries]
+        latency = (time.perf_counter() - start) / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        size_mb = faiss.serialize_index(index).nbytes / 2 ** 20
+        print(f"{label:<24} recall@{args.k} {recall:6.3f}  {latency * 1000:8.3f} ms/query  {size_mb:9.1f} MB")
+
+    print(f"{flat.ntotal} vectors, {len(queries)} queries")
+    measure(flat, "flat")
+    for index_type in ["ivf", "hnsw", "ivfpq"]:
+        start = time.perf_counter()
+        index, meta = build_ann_index(flat, index_type, train_size=args.train_size)
+        print(f"{index_type} built in {time.perf_counter() - start:.1f}s (nlist={meta['nlist']})")
+        for value in ([1, 4, 16, 64] if index_type != "hnsw" else [16, 32, 64, 128]):
+            set_search_params(index, nprobe=value, ef_search=value)
+            measure(index, f"{index_type} {'efSearch' if index_type == 'hnsw' else 'nprobe'}={value}")
+
+
+def sample_retrieval_queries(store, count: int, seed: int = 0) -> list:
+    """
+    One line from each of `count` random chunks serves as a query; the chunk's page is
+    the relevant answer. Lines with CLI commands (`->`) are preferred.
+    """
+    import random
+
+    rng = random.Random(seed)
+    positions = rng.sample(range(store.count()), min(count * 3, store.count()))
+    queries = []
+    for position, doc in store.get_documents(positions).items():
+        lines = [line.strip() for line in doc.page_content.splitlines() if len(line.split()) >= 4]
+        if not lines:
+            continue
+        commands = [line[2:] for line in lines if line.startswith("->")]
+        line = rng.choice(commands or lines)
+        queries.append({"question": " ".join(line.split()[:12]), "source": doc.metadata.get("source"), "page": doc.metadata.get("page")})
+        if len(queries) == count:
+            break
+    return queries
+
+def bench_retrieval(args):
+    """
+    Hit rate, MRR, latency and prompt size of vector, BM25, fused and reranked
+    retrieval. Queries come from --queries (JSON lines with question, source and
+    page) or are sampled from the index.
+    """
+    from mapped_store import load_mapped_vectorstore
+    from hybrid_search import HybridRetriever
+    from models import get_embeddings, get_cross_encoder
+
+    vectorstore = load_mapped_vectorstore(args.index_path, get_embeddings("thenlper/gte-small"))
+    if vectorstore is None or not vectorstore.docstore.store.has_keyword_index():
+        print(f"❌ {args.index_path} has no keyword index, rebuild it with build_kb.py")
+        return
+    store = vectorstore.docstore.store
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = sample_retrieval_queries(store, args.samples)
+
+    hybrid = HybridRetriever(embeddings=vectorstore.embedding_function, index=vectorstore.index, store=store, top_n=args.top_n)
+    reranked = hybrid.model_copy(update={"reranker": get_cross_encoder(args.reranker)})
+
+    def documents(positions):
+        found = store.get_documents(positions)
+        return [found[position] for position in positions if position in found]
+
+    methods = [
+        ("vector k=20", lambda q: documents(hybrid.vector_search(q))),
+        (f"vector top-{args.top_n}", lambda q: documents(hybrid.vector_search(q)[:args.top_n])),
+        (f"bm25 top-{args.top_n}", lambda q: documents(store.keyword_search(q, args.top_n))),
+        (f"hybrid rrf top-{args.top_n}", hybrid.invoke),
+        (f"hybrid + rerank top-{args.top_n}", reranked.invoke),
+    ]
+    print(f"{len(queries)} queries")
+    for label, search in methods:
+        hits, reciprocal_ranks, latencies, sizes = 0, [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            docs = search(query["question"])
+            latencies.append(time.perf_counter() - start)
+            sizes.append(sum(len(doc.page_content) for doc in docs))
+            ranks = [
+                rank for rank, doc in enumerate(docs, start=1)
+                if doc.metadata.get("source") == query["source"] and doc.metadata.get("page") == query["page"]
+            ]
+            hits += bool(ranks)
+            reciprocal_ranks.append(1 / ranks[0] if ranks else 0)
+        print(
+            f"{label:<24} hit rate {hits / len(queries):6.3f}  MRR {statistics.mean(reciprocal_ranks):6.3f}  "
+            f"{statistics.mean(latencies) * 1000:8.1f} ms/query  ~{statistics.mean(sizes) / 4:6.0f} context tokens"
+        )
+
+
+def bench_filter(args):
+    """Latency of filtered vs unfiltered vector and hybrid search on the memory-mapped index."""
+    from mapped_store import load_mapped_vectorstore, load_flat_index
+    from hybrid_search import HybridRetriever
+    from models import get_embeddings
+    from embedding_cache import CachedEmbeddings
+
+    embeddings = CachedEmbeddings(get_embeddings("thenlper/gte-small"), "thenlper/gte-small", memory_size=args.samples)
+    vectorstore = load_mapped_vectorstore(args.index_path, embeddings)
+    if vectorstore is None or not vectorstore.docstore.store.has_filters():
+        print(f"❌ {args.index_path} has no metadata filters, rebuild it with build_kb.py")
+        return
+    store = vectorstore.docstore.store
+    hybrid = HybridRetriever(
+        embeddings=embeddings, index=vectorstore.index, store=store,
+        exact_index=load_flat_index(args.index_path)
+    )
+    selected = store.filter_positions(args.filter)
+    print(f"Filter {args.filter!r} matches {len(selected)} of {vectorstore.index.ntotal} chunks")
+    questions = [query["question"] for query in sample_retrieval_queries(store, args.samples)]
+    for question in questions:
+        embeddings.embed_query(question)  # Warm the query embedding cache, only search is timed
+
+    for label, search_filter in [("unfiltered", None), ("filtered", args.filter)]:
+        for stage, search in [("vector", hybrid.vector_search), ("hybrid", hybrid.candidates)]:
+            latencies = []
+            for question in questions:
+                start = time.perf_counter()
+                search(question, search_filter)
+                latencies.append(time.perf_counter() - start)
+            print(f"{label:<12} {stage:<8} {statistics.median(latencies) * 1000:8.2f} ms median")
+
+
+def generate_pdf(path, pages: int):
+    import fitz
+
+    doc = fitz.open()
+    lines = "\n".join(
+        f"-> ip ospf interface vlan-{i} area 0.0.0.{i % 8} admin-state enable bfd-state enable" for i in range(60)
+    )
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((36, 36), f"Page {number + 1}\n{lines}", fontsize=7)
+    doc.save(path)
+    doc.close()
+
+def generate_workbook(path, sheets: int, rows: int):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    header = ["Part Number", "Description", "Quantity", "Unit Price", "Lead Time", "Notes"]
+    for number in range(sheets):
+        sheet = workbook.create_sheet(f"BoM {number + 1}")
+        sheet.append(header)
+        for row in range(rows):
+            sheet.append([
+                f"OS6860-{row:06d}", f"OmniSwitch 6860 48 port module {row}", row % 50 + 1,
+                round(100 + row * 0.37, 2), f"{row % 12 + 1} weeks", None if row % 3 else "End of sale"
+            ])
+    workbook.save(path)
+
+MEMORY_PROBE = """
+import json, time, resource, sys
+sys.path.insert(0, {root!r})
+import build_kb
+# Only extraction and chunking are measured, not the classifier
+build_kb.infer_document_types = lambda texts, **kwargs: ["Unknown"] * len(texts)
+start = time.perf_counter()
+if {streaming}:
+    chunks = sum(len(batch) for batch in build_kb.iter_file_documents({path!r}))
+else:
+    filename, file_type, _, pages = build_kb.process_file({path!r}, classify=False)
+    chunks = len(build_kb.split_into_documents(filename, file_type, "Unknown", list(pages)))
+print(json.dumps({{"seconds": time.perf_counter() - start, "chunks": chunks,
+                   "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+def bench_memory(args):
+    """
+    Peak RSS and time to extract and chunk generated large PDFs and workbooks, all
+    pages held in memory vs streamed page by page. Each run uses a fresh interpreter.
+    """
+    import tempfile
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as folder:
+        files = []
+        for pages in args.pages:
+            path = os.path.join(folder, f"guide-{pages}.pdf")
+            generate_pdf(path, pages)
+            files.append((f"PDF {pages} pages", path))
+        for rows in args.rows:
+            path = os.path.join(folder, f"bom-{rows}.xlsx")
+            generate_workbook(path, args.sheets, rows)
+            files.append((f"Excel {args.sheets}x{rows} rows", path))
+
+        for label, path in files:
+            size_mb = os.path.getsize(path) / 2 ** 20
+            for mode, streaming in [("in memory", False), ("streamed", True)]:
+                probe = MEMORY_PROBE.format(root=root, path=path, streaming=streaming)
+                output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+                if output.returncode != 0:
+                    print(f"{label:<28} {mode:<10} failed: {output.stderr.strip().splitlines()[-1]}")
+                    continue
+                run = json.loads(output.stdout.strip().splitlines()[-1])
+                print(
+                    f"{label:<28} {size_mb:7.1f} MB  {mode:<10} {run['chunks']:8d} chunks  "
+                    f"{run['seconds']:7.1f}s  {run['max_rss_mb']:8.0f} MB peak"
+                )
+
+
+def serialize_rows_iterrows(df) -> list:
+    """The original DataFrame.iterrows serializer, kept as the reference output."""
+    import pandas as pd
+
+    return [
+        "; ".join(f"{col}: {row[col]}" for col in df.columns if pd.notna(row[col]))
+        for _, row in df.iterrows()
+    ]
+
+def bench_sheets(args):
+    """
+    Row serialisation speed of iterrows vs the column-wise serializer (checking the
+    text is identical) and end-to-end page extraction from generated workbooks.
+    """
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    from utilities import serialize_rows, iter_excel_pages
+
+    rng = np.random.default_rng(0)
+    for rows in args.rows:
+        df = pd.DataFrame({
+            "Part Number": [f"OS6860-{i:06d}" for i in range(rows)],
+            "Quantity": rng.integers(1, 50, rows),
+            "Unit Price": np.where(rng.random(rows) < 0.2, np.nan, rng.random(rows) * 1000),
+            "Notes": np.where(rng.random(rows) < 0.7, None, "End of sale"),
+            "Ship Date": pd.date_range("2024-01-01", periods=rows, freq="min"),
+        })
+        start = time.perf_counter()
+        reference = serialize_rows_iterrows(df)
+        reference_time = time.perf_counter() - start
+        start = time.perf_counter()
+        vectorised = serialize_rows(df)
+        vectorised_time = time.perf_counter() - start
+        print(
+            f"{rows:>8} rows  iterrows {reference_time:7.2f}s  column-wise {vectorised_time:7.3f}s  "
+            f"{reference_time / vectorised_time:6.1f}x  identical: {reference == vectorised}"
+        )
+
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.rows:
+            path = os.path.join(folder, f"bom-{rows}.xlsx")
+            generate_workbook(path, args.sheets, rows)
+            start = time.perf_counter()
+            pages = sum(1 for _ in iter_excel_pages(path))
+            elapsed = time.perf_counter() - start
+            print(f"{args.sheets}x{rows} row workbook  {pages:6d} pages  {elapsed:7.2f}s  {args.sheets * rows / elapsed:9.0f} rows/s")
+
+
+GUIDE_PARAGRAPH = (
+    "To enable OSPF on the interface, configure the area and bind the IP interface. "
+    "-> ip ospf interface vlan-{i} area 0.0.0.{area} admin-state enable bfd-state enable"
+)
+
+def generate_document(path, sections: int, paragraphs: int = 5):
+    """A generated guide of `sections` headed sections in the format given by the extension."""
+    ext = os.path.splitext(path)[1].lower()
+    body = [
+        (f"{number + 1}. Configuring OSPF on VLAN {number}",
+         [GUIDE_PARAGRAPH.format(i=number * paragraphs + i, area=i % 8) for i in range(paragraphs)])
+        for number in range(sections)
+    ]
+    if ext == ".pdf":
+        generate_pdf(path, sections)
+    elif ext == ".xlsx":
+        generate_workbook(path, 1, sections * paragraphs)
+    elif ext == ".txt":
+        with open(path, "w", encoding="utf-8") as f:
+            for heading, texts in body:
+                f.write(heading + "\n\n" + "\n\n".join(texts) + "\n\n")
+    elif ext == ".html":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("<html><head><title>Guide</title><style>p {margin: 0}</style></head><body>\n")
+            for heading, texts in body:
+                f.write(f"<h2>{heading}</h2>\n" + "".join(f"<p>{text}</p>\n" for text in texts))
+            f.write("</body></html>\n")
+    elif ext == ".docx":
+        from docx import Document
+        doc = Document()
+        for heading, texts in body:
+            doc.add_heading(heading, level=2)
+            for text in texts:
+                doc.add_paragraph(text)
+        doc.save(path)
+    elif ext == ".pptx":
+        from pptx import Presentation
+        presentation = Presentation()
+        for heading, texts in body:
+            slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+            slide.shapes.title.text = heading
+            slide.placeholders[1].text = "\n".join(texts)
+        presentation.save(path)
+    else:
+        raise ValueError(f"Cannot generate {ext} files")
+
+def bench_formats(args):
+    """
+    Extraction and chunking throughput per supported format, on generated guides of
+    the same content. The classifier is not run.
+    """
+    import tempfile
+    from build_kb import split_into_documents
+    from utilities import process_file
+
+    with tempfile.TemporaryDirectory() as folder:
+        for ext in args.formats:
+            for sections in args.sections:
+                label = f"{ext} {sections} sections"
+                path = os.path.join(folder, f"guide-{sections}{ext}")
+                try:
+                    generate_document(path, sections)
+                except ImportError as e:
+                    print(f"{label:<26} skipped: {e}")
+                    continue
+                size_mb = os.path.getsize(path) / 2 ** 20
+                start = time.perf_counter()
+                filename, file_type, _, pages = process_file(path, classify=False)
+                page_count, chunks = 0, 0
+                for page in pages:
+                    page_count += 1
+                    chunks += len(split_into_documents(filename, file_type, "Unknown", [page]))
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{label:<26} {size_mb:7.2f} MB  {page_count:6d} pages  {chunks:7d} chunks  {elapsed:7.2f}s  "
+                    f"{page_count / elapsed:8.0f} pages/s  {chunks / elapsed:8.0f} chunks/s  {size_mb / elapsed:6.1f} MB/s"
+                )
+
+
+def sample_chunks(index_path, count: int, seed: int = 0) -> list:
+    """Chunk texts sampled from docstore.sqlite, or generated chunks of mixed length without one."""
+    import random
+    from mapped_store import SqliteStore, DOCSTORE_FILE
+
+    rng = random.Random(seed)
+    db_path = os.path.join(index_path, DOCSTORE_FILE)
+    if os.path.exists(db_path):
+        store = SqliteStore(db_path)
+        positions = rng.sample(range(store.count()), min(count, store.count()))
+        return [doc.page_content for doc in store.get_documents(positions).values()]
+    text = " ".join(GUIDE_PARAGRAPH.format(i=i, area=i % 8) for i in range(5))
+    return [text[:rng.randint(50, 500)] for _ in range(count)]
+
+def bench_embeddings(args):
+    """
+    Chunks/s of each embedding backend on the same chunks, and how close their
+    vectors are to the first backend's (cosine similarity).
+    """
+    import numpy as np
+    from embedding_engine import EmbeddingEngine
+
+    texts = sample_chunks(args.index_path, args.chunks)
+    print(f"{len(texts)} chunks, {sum(map(len, texts)) / len(texts):.0f} characters on average")
+    reference = None
+    for backend in args.backends:
+        try:
+            engine = EmbeddingEngine(args.model, backend=backend, device=args.device,
+                                     batch_size=args.batch_size, threads=args.threads)
+        except ImportError as e:
+            print(f"{backend:<10} skipped: {e}")
+            continue
+        engine.encode(texts[:args.batch_size])  # Warm up
+        start = time.perf_counter()
+        vectors = engine.encode(texts)
+        elapsed = time.perf_counter() - start
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        if reference is None:
+            reference, agreement = vectors, ""
+        else:
+            cosine = (vectors * reference).sum(axis=1)
+            agreement = f"  cosine vs {args.backends[0]}: mean {cosine.mean():.4f} min {cosine.min():.4f}"
+        print(f"{backend:<10} {engine.device:<5} {len(texts) / elapsed:8.1f} chunks/s  {elapsed:7.2f}s{agreement}")
+
+
+def bench_batching(args):
+    """
+    p50/p99 latency and throughput of vector search (query embedding plus FAISS)
+    under concurrent clients, one search per request vs micro-batched. Uses the
+    index in --index-path, or random vectors when there is none. Query embeddings
+    are not cached, so every request is embedded.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from hybrid_search import HybridRetriever
+    from models import get_embeddings
+    from embedding_cache import CachedEmbeddings
+    from mapped_store import load_mapped_vectorstore
+
+    engine = get_embeddings("thenlper/gte-small")
+    vectorstore = load_mapped_vectorstore(args.index_path, engine)
+    if vectorstore is not None:
+        index, store = vectorstore.index, vectorstore.docstore.store
+        questions = [query["question"] for query in sample_retrieval_queries(store, args.requests)]
+    else:
+        import faiss
+        import numpy as np
+        print(f"No memory-mapped index in {args.index_path}, searching {args.vectors} random vectors")
+        index, store = faiss.IndexFlatL2(384), None
+        index.add(np.random.default_rng(0).standard_normal((args.vectors, 384)).astype(np.float32))
+        questions = [f"How to configure OSPF area 0.0.0.{i % 8} on VLAN {i}?" for i in range(args.requests)]
+    questions = [questions[i % len(questions)] for i in range(args.requests)]
+
+    for concurrency in args.concurrency:
+        for label, max_batch in [("unbatched", 1), ("batched", args.max_batch)]:
+            retriever = HybridRetriever(
+                embeddings=CachedEmbeddings(engine, engine.cache_name), index=index, store=store,
+                max_batch=max_batch, max_wait=args.max_wait_ms / 1000
+            )
+            retriever.vector_search(questions[0])  # Warm up
+            latencies = []
+
+            def search(question):
+                start = time.perf_counter()
+                retriever.vector_search(question)
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(search, questions))
+            elapsed = time.perf_counter() - start
+            stats = retriever.batch_stats()
+            batch = f"  mean batch {stats['mean_batch']:5.1f}" if "mean_batch" in stats else ""
+            print(
+                f"{concurrency:4d} clients  {label:<10} p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+                f"p99 {statistics.quantiles(latencies, n=100)[98] * 1000:7.1f} ms  {len(questions) / elapsed:7.1f} req/s{batch}"
+            )
+
+
+def generate_ios_config(interfaces: int, other: float = 0.0, seed: int = 0) -> str:
+    """
+    A Cisco configuration with `interfaces` access ports, one VLAN and SVI per 24
+    ports, and about `other` of the ports configured as trunks (not converted locally).
+    """
+    import random
+    rng = random.Random(seed)
+    vlans = max(1, interfaces // 24)
+    lines = ["Help me convert the following Cisco IOS configuration to Alcatel AOS configuration.", "!"]
+    for vlan in range(1, vlans + 1):
+        lines += [f"vlan {vlan}", f" name \"vlan_{vlan}\"", "!"]
+    for vlan in range(1, vlans + 1):
+        lines += [
+            f"interface Vlan{vlan}", f" ip address 10.{vlan // 256}.{vlan % 256}.1 255.255.255.0",
+            " ip helper-address 192.168.2.254", " no shutdown", "!"
+        ]
+    for port in range(interfaces):
+        lines.append(f"interface GigabitEthernet{port // 48 + 1}/1/{port % 48 + 1}")
+        if rng.random() < other:
+            lines += [" switchport mode trunk", " switchport trunk allowed vlan 1-10"]
+        else:
+            lines += [" switchport mode access", f" switchport access vlan {port // 24 + 1}"]
+        lines.append("!")
+    return "\n".join(lines)
+
+def bench_convert(args):
+    """
+    Speed of the rule-based Cisco to AOS conversion on generated configurations, and
+    the share of the configuration that still has to be sent to the LLM.
+    """
+    from config_converter import convert_local, parse_port_map
+    from context_budget import count_tokens
+
+    for interfaces in args.interfaces:
+        config = generate_ios_config(interfaces, args.other)
+        # Generated ports are on module 1 of each stack member, mapped to slot 1 of the same chassis
+        port_map = parse_port_map(args.port_map or ",".join(f"{n}/1={n}/1" for n in range(1, interfaces // 48 + 2)))
+        seconds = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            conversion = convert_local(config, port_map=port_map)
+            output = conversion.render()
+            seconds.append(time.perf_counter() - start)
+        remote = count_tokens(conversion.remote_question()) if conversion.unrecognised else 0
+        print(
+            f"{interfaces:6d} interfaces  {min(seconds) * 1000:8.1f} ms  {conversion.converted:6d} stanzas converted  "
+            f"{len(conversion.unrecognised):5d} left for the LLM  prompt tokens {count_tokens(config):7d} -> {remote:6d}  "
+            f"output {len(output.splitlines())} lines"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run AIOps benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    classify = subparsers.add_parser("classify", help="Compare document type classifiers.")
+    classify.add_argument("--folders", required=True, nargs='+', help="Folders to sample documents from.")
+    classify.add_argument("--limit", type=int, default=200, help="Number of documents to classify.")
+    classify.add_argument("--batch-size", type=int, default=8, help="Classifier batch size.")
+    classify.set_defaults(func=bench_classify)
+
+    startup = subparsers.add_parser("startup", help="Measure import and server cold start time.")
+    startup.add_argument("--repeat", type=int, default=3, help="Runs per target, the fastest is reported.")
+    startup.add_argument("--question", default="How to configure OSPF?", help="Query timed after a cold start.")
+    startup.set_defaults(func=bench_startup)
+
+    stream = subparsers.add_parser("stream", help="Measure time to first token of /process_input/stream.")
+    stream.add_argument("--url", default="http://127.0.0.1:8000", help="Chat server URL.")
+    stream.add_argument("--question", default="How to configure OSPF?", help="Question to ask.")
+    stream.add_argument("--repeat", type=int, default=5, help="Number of requests.")
+    stream.set_defaults(func=bench_stream)
+
+    loadtest = subparsers.add_parser("loadtest", help="Load test the chat server against a fake OpenAI server.")
+    loadtest.add_argument("--requests", type=int, default=200, help="Total requests per endpoint.")
+    loadtest.add_argument("--concurrency", type=int, default=50, help="Concurrent clients.")
+    loadtest.add_argument("--llm-delay", type=float, default=1.0, help="Fake OpenAI latency per call, in seconds.")
+    loadtest.add_argument("--token-delay", type=float, default=0.01, help="Fake OpenAI delay per streamed token.")
+    loadtest.add_argument("--port", type=int, default=8010, help="Port for the chat server under test.")
+    loadtest.add_argument("--fake-port", type=int, default=9010, help="Port for the fake OpenAI server.")
+    loadtest.set_defaults(func=bench_loadtest)
+
+    intent = subparsers.add_parser("intent", help="Evaluate the local intent router on a labelled test set.")
+    intent.add_argument("--threshold", type=float, default=0.88, help="Router confidence threshold.")
+    intent.add_argument("--with-llm", action="store_true", help="Also evaluate the GPT-4o intent chain.")
+    intent.set_defaults(func=bench_intent)
+
+    ann = subparsers.add_parser("ann", help="Compare IVF/HNSW/IVF-PQ indexes with the flat index.")
+    ann.add_argument("--index-path", default="faiss_index", help="Folder holding the flat index.faiss.")
+    ann.add_argument("--queries", type=int, default=500, help="Number of sampled queries.")
+    ann.add_argument("--k", type=int, default=20, help="Neighbours per query.")
+    ann.add_argument("--train-size", type=int, default=100_000, help="Vectors sampled to train IVF indexes.")
+    ann.set_defaults(func=bench_ann)
+
+    retrieval = subparsers.add_parser("retrieval", help="Compare vector, BM25, hybrid and reranked retrieval.")
+    retrieval.add_argument("--index-path", default="faiss_index", help="Folder holding the index and docstore.sqlite.")
+    retrieval.add_argument("--queries", help="JSON lines file with question, source and page of the expected chunk.")
+    retrieval.add_argument("--samples", type=int, default=200, help="Queries sampled from the index without --queries.")
+    retrieval.add_argument("--top-n", type=int, default=5, help="Chunks kept after fusion or reranking.")
+    retrieval.add_argument("--reranker", default="cross-encoder/ms-marco-MiniLM-L-6-v2", help="Cross-encoder model.")
+    retrieval.set_defaults(func=bench_retrieval)
+
+    filtered = subparsers.add_parser("filter", help="Compare filtered and unfiltered search latency.")
+    filtered.add_argument("--index-path", default="faiss_index", help="Folder holding the index and docstore.sqlite.")
+    filtered.add_argument("--filter", default="only AOS 8.9 guides", help="Filter phrase to apply.")
+    filtered.add_argument("--samples", type=int, default=200, help="Queries sampled from the index.")
+    filtered.set_defaults(func=bench_filter)
+
+    memory = subparsers.add_parser("memory", help="Peak memory of extracting large generated documents.")
+    memory.add_argument("--pages", type=int, nargs="+", default=[500, 3000], help="Pages of each generated PDF.")
+    memory.add_argument("--rows", type=int, nargs="+", default=[20_000, 200_000], help="Rows per sheet of each generated workbook.")
+    memory.add_argument("--sheets", type=int, default=3, help="Sheets per generated workbook.")
+    memory.set_defaults(func=bench_memory)
+
+    sheets = subparsers.add_parser("sheets", help="Spreadsheet row serialisation and extraction speed.")
+    sheets.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="Rows per generated sheet.")
+    sheets.add_argument("--sheets", type=int, default=2, help="Sheets per generated workbook.")
+    sheets.set_defaults(func=bench_sheets)
+
+    formats = subparsers.add_parser("formats", help="Extraction throughput per document format.")
+    formats.add_argument("--formats", nargs="+", default=[".pdf", ".docx", ".txt", ".html", ".pptx", ".xlsx"],
+                         help="File extensions to generate and extract.")
+    formats.add_argument("--sections", type=int, nargs="+", default=[200, 2000], help="Sections per generated document.")
+    formats.set_defaults(func=bench_formats)
+
+    embeddings = subparsers.add_parser("embeddings", help="Embedding throughput per backend.")
+    embeddings.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"], help="Backends to compare, the first is the reference.")
+    embeddings.add_argument("--model", default="thenlper/gte-small", help="Embedding model.")
+    embeddings.add_argument("--device", default="cpu", help="Device for the torch backend.")
+    embeddings.add_argument("--batch-size", type=int, default=32, help="Texts per model call.")
+    embeddings.add_argument("--threads", type=int, default=0, help="CPU threads, 0 for the library default.")
+    embeddings.add_argument("--chunks", type=int, default=2000, help="Chunks to embed.")
+    embeddings.add_argument("--index-path", default="faiss_index", help="Folder holding docstore.sqlite to sample chunks from.")
+    embeddings.set_defaults(func=bench_embeddings)
+
+    batching = subparsers.add_parser("batching", help="Vector search latency under concurrency, with and without micro-batching.")
+    batching.add_argument("--index-path", default="faiss_index", help="Folder holding the memory-mapped index.")
+    batching.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent clients.")
+    batching.add_argument("--requests", type=int, default=500, help="Searches per run.")
+    batching.add_argument("--max-batch", type=int, default=32, help="Largest micro-batch.")
+    batching.add_argument("--max-wait-ms", type=float, default=5, help="Longest wait for a micro-batch to fill.")
+    batching.add_argument("--vectors", type=int, default=100_000, help="Random vectors searched without an index.")
+    batching.set_defaults(func=bench_batching)
+
+    convert = subparsers.add_parser("convert", help="Rule-based Cisco to AOS conversion speed on generated configurations.")
+    convert.add_argument("--interfaces", type=int, nargs="+", default=[10, 100, 1000, 10_000], help="Ports per generated configuration.")
+    convert.add_argument("--other", type=float, default=0.05, help="Share of ports configured as trunks, left for the LLM.")
+    convert.add_argument("--repeat", type=int, default=5, help="Runs per configuration, the fastest is reported.")
+    convert.add_argument("--port-map", default=None, help="Cisco stack/module to AOS chassis/slot, e.g. \"1/1=1/1\" (default: every generated module).")
+    convert.set_defaults(func=bench_convert)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -6,20 +6,228 @@ from datetime import datetime, timezone
 from pathlib import Path
 import hashlib
 import argparse
-import fitz
-from docx import Document as DocxDocument
-import pandas as pd
-from pptx import Presentation
-
-import torch
-from transformers import pipeline
-from langchain_huggingface import HuggingFaceEmbeddings
+import time
+from collections import Counter, deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document  # or use `langchain_core.documents.Document` if using v0.2+
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from hash_registry import load_processed_hashes, is_already_processed, mark_as_processed
-from utilities import process_file, get_text_hash
+from hash_registry import load_processed_hashes, is_legacy, iter_records
+from index_writer import IndexWriter, recover_index
+from ann_index import INDEX_TYPES
+from models import get_embeddings
+from embedding_cache import CachedEmbeddings
+from embedding_engine import EMBEDDING_BACKENDS
+from build_report import BuildReport, StageTimings, REPORT_FILE
+from utilities import process_file, get_file_hash, infer_document_types, set_classifier, CLASSIFIERS, SUPPORTED_EXTENSIONS
 
+EMBEDDING_CACHE_FILE = "embedding_cache.sqlite"
+# Files above this size are extracted page by page in the main process
+STREAM_FILE_SIZE = 16 * 2 ** 20
+# So are smaller files whose extracted text turns out longer than this (compressed
+# workbooks, text-heavy PDFs): workers give up on them instead of holding them whole
+STREAM_TEXT_CHARS = 8 * 2 ** 20
+
+
+def split_into_documents(filename, file_type, document_type, page_chunks):
+    documents = []
+    # start_index lets the server merge neighbouring chunks of a page back together
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, add_start_index=True)
+    for chunk in page_chunks:
+        splits = splitter.create_documents([chunk["text"]])
+        for doc in splits:
+            doc.metadata["source"] = filename                                   # ✅ Add File name
+            doc.metadata["created"] = datetime.now(timezone.utc).isoformat()    # ✅ Add UTC timestamp
+            doc.metadata["document_type"] = document_type                       # ✅ Add Document Type
+            doc.metadata["file_type"] = file_type                               # ✅ Add File Type
+            if chunk["page_number"] is not None:
+                doc.metadata["page"] = chunk["page_number"]                     # ✅ Add Page Number
+            documents.append(doc)
+    return documents
+
+def load_file_documents(file):
+    """Parse, classify and chunk one file."""
+    filename, file_type, document_type, page_chunks = process_file(file)
+    if page_chunks is None:
+        return filename, []
+    return filename, split_into_documents(filename, file_type, document_type, page_chunks)
+
+def iter_file_documents(file, batch_size=256, timings=None):
+    """
+    Parse, classify and chunk one file page by page, yielding lists of about
+    `batch_size` documents so a huge file never sits in memory all at once.
+    Parse and split times of the whole file are added to `timings`.
+    """
+    timings = timings if timings is not None else StageTimings()
+    start = time.perf_counter()
+    filename, file_type, _, pages = process_file(file, classify=False)
+    first = next(pages, None)
+    parse_time = time.perf_counter() - start
+    if first is None:
+        timings.add("parse", parse_time, 0)
+        return
+    with timings.timed("classify"):
+        document_type = infer_document_types([first["text"]])[0]
+    pages = chain([first], pages)
+    documents, page_count, chunk_count, split_time = [], 0, 0, 0.0
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        parse_time += time.perf_counter() - start
+        if page is None:
+            break
+        start = time.perf_counter()
+        page_documents = split_into_documents(filename, file_type, document_type, [page])
+        split_time += time.perf_counter() - start
+        page_count += 1
+        chunk_count += len(page_documents)
+        documents.extend(page_documents)
+        if len(documents) >= batch_size:
+            yield documents
+            documents = []
+    if documents:
+        yield documents
+    timings.add("parse", parse_time, page_count)
+    timings.add("split", split_time, chunk_count)
+
+def load_files_documents(files: list, max_chars: int = STREAM_TEXT_CHARS):
+    """
+    Parse a group of files, classify their first pages in one batch and chunk them.
+    Runs inside the extraction worker processes. Returns (results, timings) where
+    results holds (filename, documents, error) per file; files that fail to parse
+    come back with documents set to None and the reason in error. Files with more
+    than `max_chars` of text come back with both set to None, to be streamed.
+    """
+    timings = StageTimings()
+    extracted = []
+    for file in files:
+        start = time.perf_counter()
+        try:
+            filename, file_type, _, pages = process_file(file, classify=False)
+            if pages is None:
+                raise FileNotFoundError(f"File does not exist: {file}")
+            page_chunks, size = [], 0
+            for page in pages:
+                size += len(page["text"])
+                if size > max_chars:
+                    page_chunks = None
+                    break
+                page_chunks.append(page)
+            if page_chunks is None:
+                extracted.append((filename, None, None, None))
+                continue
+            timings.add("parse", time.perf_counter() - start, len(page_chunks))
+            extracted.append((filename, file_type, page_chunks, None))
+        except Exception as e:
+            extracted.append((Path(file).name, None, None, f"{type(e).__name__}: {e}"))
+
+    heads = [page_chunks[0]["text"] if page_chunks else "" for _, _, page_chunks, _ in extracted]
+    with timings.timed("classify", len(heads)):
+        document_types = infer_document_types(heads)
+
+    results = []
+    for (filename, file_type, page_chunks, error), document_type in zip(extracted, document_types):
+        if error is not None or page_chunks is None:
+            results.append((filename, None, error))
+        elif not page_chunks:
+            results.append((filename, [], None))
+        else:
+            start = time.perf_counter()
+            documents = split_into_documents(filename, file_type, document_type, page_chunks)
+            timings.add("split", time.perf_counter() - start, len(documents))
+            results.append((filename, documents, None))
+    return results, timings
+
+def count_legacy_names(files, registry) -> Counter:
+    """How many of `files` recorded by older builds (a hash of the path only) share each file name."""
+    return Counter(Path(file).name for file in files if is_legacy(file, registry))
+
+def check_file(file, writer, legacy_names=None):
+    """
+    Compare a file with the registry. Returns a new record when the file must be
+    (re-)ingested, or None when it is unchanged, renamed or a duplicate. Chunks of
+    a modified file are removed from the index before its new chunks are added.
+    `legacy_names` comes from count_legacy_names over every file of the build.
+    """
+    stat = os.stat(file)
+    record = writer.get_record(file)
+
+    # Cheap pre-check: same size and mtime means the content was not touched
+    if record and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime:
+        return None
+
+    file_hash = get_file_hash(file)
+    new_record = {"path": file, "hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime, "ids": []}
+
+    if record:
+        if record["hash"] == file_hash:
+            new_record["ids"] = record["ids"]
+            writer.update(new_record)
+            return None
+        print(f"🔄 Modified: removing {len(record['ids'])} old chunks...")
+        release_chunks(record, writer)
+        # Dropped now so the registry stays consistent if re-extraction fails
+        writer.forget(file)
+        return new_record
+
+    if is_legacy(file, writer.registry):
+        # Indexed by an older build that only recorded a hash of the path; its chunks
+        # are found by file name, so they are only taken over when the name is unique
+        name = Path(file).name
+        ids = writer.ids_for_source(name)
+        if legacy_names is None or legacy_names[name] <= 1:
+            new_record["ids"] = ids
+            writer.update(new_record)
+            return None
+        print(f"🔄 Legacy: {name} is shared by {legacy_names[name]} files, re-ingesting...")
+        writer.remove(ids)
+        return new_record
+
+    others = writer.find_by_hash(file_hash)
+    for other in others:
+        if not os.path.exists(other["path"]):
+            print(f"🔀 Renamed: {other['path']}")
+            writer.rename(other, new_record, Path(file).name)
+            return None
+    if others:
+        # Copies recorded by older builds hold no chunks, the original does
+        original = next((other for other in others if other["ids"]), others[0])
+        # While the original is still being extracted its chunks are unknown: ingest the
+        # copy too, identical chunks are then shared by text hash
+        if original["path"] not in writer.in_progress and writer.share(new_record, original["ids"]):
+            print(f"⏩ Skipped: Duplicate of {original['path']}")
+            return None
+
+    return new_record
+
+def release_chunks(record, writer):
+    """
+    Drop a file's references to its chunks. Copies recorded without chunks by older
+    builds are handed the chunks instead, so their content stays indexed.
+    """
+    survivors = [
+        other for other in writer.find_by_hash(record["hash"])
+        if other["path"] != record["path"] and os.path.exists(other["path"]) and not other["ids"]
+    ]
+    if survivors and record["ids"]:
+        writer.update(dict(survivors[0], ids=record["ids"]))
+    else:
+        writer.remove(record["ids"])
+
+def remove_missing_files(folders: list, writer):
+    """Drop the chunks of registered files under `folders` that no longer exist."""
+    roots = [Path(folder).resolve() for folder in folders]
+    for record in list(iter_records(writer.registry)):
+        path = record["path"]
+        if path in writer.pending_removals or os.path.exists(path):
+            continue
+        if not any(root == Path(path) or root in Path(path).parents for root in roots):
+            continue
+
+        print(f"🗑️ Deleted: {path}")
+        release_chunks(record, writer)
+        writer.forget(path)
 
 def add_documents_to_vector_db(
     file=None, 
@@ -28,98 +236,38 @@ def add_documents_to_vector_db(
     vectorstore=None, 
     index_path='faiss_index',
     embeddings=None,
+    writer=None,
     ):
 
     print(f"Processing ...")
     
-    filename = file_type = ""
-    
     if file is None:
         raise ValueError("Argument file cannot be None.")   
 
     # Check if file exist
     if not os.path.exists(file):
         raise ValueError("File does not exist.")        
-    
-    # Generate file hash
-    file_hash = get_text_hash(file)
-    processed_hashes = load_processed_hashes()
 
-    # Check if file has been processed before.
-    if vectorstore:
-        if is_already_processed(file_hash, processed_hashes):
-            print(f"⏩ Skipped: File already processed.")
-            return vectorstore
-        else:
-            documents = []
-            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            filename, file_type, document_type, page_chunks = process_file(file)
-            if page_chunks:
-                if file_type in ["PDF", "Excel"]:
-                    for chunk in page_chunks:
-                        splits = splitter.create_documents([chunk["text"]])
-                        for doc in splits:
-                            doc.metadata["source"] = filename                                   # ✅ Add File name
-                            doc.metadata["created"] = datetime.now(timezone.utc).isoformat()    # ✅ Add UTC timestamp
-                            doc.metadata["document_type"] = document_type                       # ✅ Add Document Type
-                            doc.metadata["file_type"] = file_type                               # ✅ Add File Type
-                            if chunk["page_number"] is not None:
-                                doc.metadata["page"] = chunk["page_number"]                     # ✅ Add Page Number
-                            documents.append(doc)
-                
-                print(f"Adding {filename} to vector database...")                    
-                vectorstore.add_documents(documents)
-
-                # After successful processing
-                mark_as_processed(file_hash, processed_hashes)
-                vectorstore.save_local(index_path)
-                
-            return vectorstore
+    standalone = writer is None
+    if standalone:
+        writer = IndexWriter(vectorstore, embeddings, index_path, load_processed_hashes())
 
+    # Check if file has been processed before.
+    record = check_file(file, writer)
+    if record is None:
+        print(f"⏩ Skipped: File already processed.")
     else:
-        documents = []
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        filename, file_type, document_type, page_chunks = process_file(file)
-        if page_chunks:
-            if file_type in ["PDF", "Excel"]: 
-                for chunk in page_chunks:
-                    splits = splitter.create_documents([chunk["text"]])
-                    for doc in splits:
-                        doc.metadata["source"] = filename                                   # ✅ Add File name
-                        doc.metadata["created"] = datetime.now(timezone.utc).isoformat()    # ✅ Add UTC timestamp
-                        doc.metadata["document_type"] = document_type                       # ✅ Add Document Type
-                        doc.metadata["file_type"] = file_type                               # ✅ Add File Type
-                        if chunk["page_number"] is not None:
-                            doc.metadata["page"] = chunk["page_number"]                    
-                        documents.append(doc)    
-                
-            vectorstore = FAISS.from_documents(documents, embeddings)
-            # After successful processing
-            mark_as_processed(file_hash, processed_hashes)        
-            print(f"Creating vector database...")
+        filename, documents = load_file_documents(file)
+        if documents:
             print(f"Adding {filename} to vector database...")
-        else:
-            # Failed to process doc
-            return vectorstore
+        writer.add([(record, documents)])
 
-    # Step 7: Save the vector database
-    vectorstore.save_local(index_path)
-    return vectorstore
-
-def build_vector_store(folders: list):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    embeddings = HuggingFaceEmbeddings(model_name='thenlper/gte-small', model_kwargs={'device': 'cpu'})
-    index_path = 'faiss_index'
-
-    if os.path.exists(index_path):              
-        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-        print("Vectorstore loaded...")
-    else:
-        print("Vectorstore not found! Building a new vectorstore...")
-        vectorstore = None
-
-    supported_exts = [".pdf", ".docx", ".txt", ".xls", ".xlsx", ".html", ".htm"]
+    if standalone:
+        # Standalone call: commit this file straight away
+        return writer.commit()
+    return writer.vectorstore
 
+def iter_supported_files(folders: list):
     # Iterate over each folder (full path provided in the list)
     for folder_path in folders:
         folder_path = Path(folder_path).resolve()  # Convert string path to Path object and resolve full path
@@ -131,13 +279,181 @@ def build_vector_store(folders: list):
         
         # Use rglob to search for files with supported extensions
         for file in folder_path.rglob("*"):  # Recursively search all files
-            if file.suffix.lower() in supported_exts:
-                vectorstore = add_documents_to_vector_db(
-                    file=rf"{file.parent}/{file.name}",
-                    vectorstore=vectorstore,
-                    index_path=index_path,
-                    embeddings=embeddings
-                    )
+            if file.suffix.lower() in SUPPORTED_EXTENSIONS:
+                yield rf"{file.parent}/{file.name}"
+
+def run_pipeline(files, writer, workers=1, batch_size=256, classify_batch=8, classifier="bart",
+                 stream_size=STREAM_FILE_SIZE, stream_chars=STREAM_TEXT_CHARS):
+    """
+    Staged ingestion: a process pool parses, classifies and chunks groups of files, a
+    bounded window of in-flight groups feeds the main process, which embeds chunks in
+    batches. Results are consumed in submission order so the index content does not
+    depend on the number of workers. With workers=1 the groups are processed inline.
+
+    Files larger than `stream_size` bytes are streamed page by page in the main
+    process instead and embedded every `batch_size` chunks, so peak memory does not
+    grow with the size of a single document. So are smaller files whose text turns
+    out longer than `stream_chars` characters during extraction.
+
+    Stage timings, file counts and failures are recorded in `writer.report`.
+    """
+    report = writer.report
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=set_classifier, initargs=(classifier,))
+    in_flight = deque()
+    max_in_flight = workers * 2 if executor else 1
+    group = []
+    batch = []
+    batch_chunks = 0
+
+    def submit():
+        paths = [record["path"] for record in group]
+        future = executor.submit(load_files_documents, paths, stream_chars) if executor else None
+        in_flight.append((list(group), future))
+        group.clear()
+        # Bounded queue: block on the oldest group before submitting more work
+        if len(in_flight) >= max_in_flight:
+            drain_one()
+
+    def drain_one():
+        nonlocal batch_chunks
+        records, future = in_flight.popleft()
+        try:
+            results, timings = (
+                future.result() if future else load_files_documents([r["path"] for r in records], stream_chars)
+            )
+            report.timings.update(timings)
+        except Exception as e:
+            results = [(None, None, f"{type(e).__name__}: {e}")] * len(records)
+        for record, (filename, documents, error) in zip(records, results):
+            if documents is None and error is None:
+                # Too much text to hand back whole: the files before it go in first
+                flush()
+                stream_file(record)
+                continue
+            if documents is None:
+                # Not recorded, so the file is retried on the next run
+                writer.release(record)
+                report.file_failed(record["path"], error)
+                continue
+            if documents:
+                print(f"Adding {filename} to vector database...")
+            batch.append((record, documents))
+            batch_chunks += len(documents)
+            report.file_done()
+        if batch_chunks >= batch_size:
+            flush()
+
+    def flush():
+        nonlocal batch_chunks
+        if batch:
+            writer.add(list(batch))
+        batch.clear()
+        batch_chunks = 0
+
+    def stream(record):
+        # Everything queued before this file goes in first, keeping the submission order
+        if group:
+            submit()
+        while in_flight:
+            drain_one()
+        flush()
+        stream_file(record)
+
+    def stream_file(record):
+        try:
+            for documents in iter_file_documents(record["path"], batch_size, report.timings):
+                writer.add([(record, documents)], partial=True)
+            print(f"Added {Path(record['path']).name} to vector database")
+            writer.add([(record, [])])
+            report.file_done()
+        except Exception as e:
+            writer.discard_partial(record)
+            report.file_failed(record["path"], f"{type(e).__name__}: {e}")
+
+    legacy_names = count_legacy_names(files, writer.registry)
+    try:
+        for file in files:
+            record = check_file(file, writer, legacy_names)
+            if record is None:
+                report.file_skipped()
+                continue
+            writer.claim(record)
+            if record["size"] > stream_size:
+                stream(record)
+                continue
+            group.append(record)
+            if len(group) >= classify_batch:
+                submit()
+        if group:
+            submit()
+        while in_flight:
+            drain_one()
+        flush()
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+def build_vector_store(folders: list, workers: int = 1, batch_size: int = 256,
+                       commit_every: int = 5000, commit_interval: int = 300,
+                       classifier: str = "bart", classify_batch: int = 8,
+                       index_type: str = "flat", nlist: int = None, hnsw_m: int = 32,
+                       pq_m: int = 16, train_size: int = 100_000, stream_size: int = STREAM_FILE_SIZE,
+                       stream_chars: int = STREAM_TEXT_CHARS,
+                       report_path: str = REPORT_FILE, embedding_backend: str = None,
+                       embedding_device: str = None, embedding_batch: int = None, embedding_threads: int = None):
+    set_classifier(classifier)
+    model_name = 'thenlper/gte-small'
+    engine = get_embeddings(
+        model_name, backend=embedding_backend, device=embedding_device,
+        batch_size=embedding_batch, threads=embedding_threads
+        )
+    print(f"Embedding with {model_name} ({engine.backend} on {engine.device}, batches of {engine.batch_size})")
+    embeddings = CachedEmbeddings(engine, engine.cache_name, disk_path=EMBEDDING_CACHE_FILE)
+    index_path = 'faiss_index'
+    recover_index(index_path)
+
+    if os.path.exists(index_path):              
+        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        print("Vectorstore loaded...")
+    else:
+        print("Vectorstore not found! Building a new vectorstore...")
+        vectorstore = None
+
+    ann_options = {
+        "index_type": index_type, "nlist": nlist, "hnsw_m": hnsw_m,
+        "pq_m": pq_m, "train_size": train_size
+        }
+    # Listed up front so progress lines can show an ETA
+    files = list(iter_supported_files(folders))
+    report = BuildReport(total_files=len(files), options={
+        "folders": folders, "workers": workers, "batch_size": batch_size, "classifier": classifier,
+        "classify_batch": classify_batch, "stream_size": stream_size,
+        "stream_chars": stream_chars, **ann_options,
+        "embedding_backend": engine.backend, "embedding_device": engine.device,
+        "embedding_batch": engine.batch_size, "embedding_threads": engine.threads
+        })
+    writer = IndexWriter(
+        vectorstore, embeddings, index_path, load_processed_hashes(),
+        commit_every=commit_every, commit_interval=commit_interval,
+        ann_options=ann_options, report=report
+        )
+
+    completed = False
+    try:
+        run_pipeline(files, writer, workers, batch_size, classify_batch, classifier, stream_size, stream_chars)
+        # After the scan, so renamed files have already claimed their chunks
+        remove_missing_files(folders, writer)
+        completed = True
+    finally:
+        # Final flush, also on Ctrl+C, so completed files are not re-processed
+        writer.commit(final=True)
+        stats = embeddings.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)")
+        report.print_progress()
+        report.write(report_path, completed=completed, embedding_cache=stats)
+        print(f"📝 Build report written to {report_path}")
   
 
 if __name__ == "__main__":
@@ -145,9 +461,50 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Build a vector KB from documents.")
     parser.add_argument("--folders", required=True, nargs='+', help="Folders to scan.")
+    parser.add_argument("--workers", type=int, default=1, help="Extraction worker processes (1 = serial).")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch.")
+    parser.add_argument("--commit-every", type=int, default=5000, help="Save the index after this many new chunks.")
+    parser.add_argument("--commit-interval", type=int, default=300, help="Save the index at least every N seconds.")
+    parser.add_argument("--classifier", choices=CLASSIFIERS, default="bart", help="Document type classifier.")
+    parser.add_argument("--classify-batch", type=int, default=8, help="Files classified per batch.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="Search index built next to the flat index.")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(chunks)).")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node.")
+    parser.add_argument("--pq-m", type=int, default=16, help="IVF-PQ sub-quantizers (must divide 384).")
+    parser.add_argument("--train-size", type=int, default=100_000, help="Vectors sampled to train IVF indexes.")
+    parser.add_argument("--stream-size", type=float, default=STREAM_FILE_SIZE / 2 ** 20,
+                        help="Files above this many MB are extracted and embedded page by page.")
+    parser.add_argument("--stream-text", type=float, default=STREAM_TEXT_CHARS / 2 ** 20,
+                        help="So are files whose extracted text exceeds this many MB.")
+    parser.add_argument("--report", default=REPORT_FILE, help="JSON file the build report is written to.")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=None,
+                        help="Embedding backend (default AIOPS_EMBEDDING_BACKEND or torch).")
+    parser.add_argument("--embedding-device", default=None, help="cpu, cuda, mps or auto (default AIOPS_EMBEDDING_DEVICE or auto).")
+    parser.add_argument("--embedding-batch", type=int, default=None, help="Texts per model call (default AIOPS_EMBEDDING_BATCH or 32).")
+    parser.add_argument("--embedding-threads", type=int, default=None, help="CPU threads for embedding (default AIOPS_EMBEDDING_THREADS or all).")
     args = parser.parse_args()
 
-    build_vector_store(args.folders)    
+    build_vector_store(
+        args.folders,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        commit_every=args.commit_every,
+        commit_interval=args.commit_interval,
+        classifier=args.classifier,
+        classify_batch=args.classify_batch,
+        index_type=args.index_type,
+        nlist=args.nlist,
+        hnsw_m=args.hnsw_m,
+        pq_m=args.pq_m,
+        train_size=args.train_size,
+        stream_size=int(args.stream_size * 2 ** 20),
+        stream_chars=int(args.stream_text * 2 ** 20),
+        report_path=args.report,
+        embedding_backend=args.embedding_backend,
+        embedding_device=args.embedding_device,
+        embedding_batch=args.embedding_batch,
+        embedding_threads=args.embedding_threads
+        )    
 
     print("Job Completed!")
 
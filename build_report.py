@@ -0,0 +1,195 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+REPORT_FILE = "build_report.json"
+# Upper bounds, in seconds, of the stage duration histogram buckets
+DURATION_BUCKETS = [0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300]
+# Order of the stages in progress lines and the report
+STAGES = ["parse", "classify", "split", "embed", "save"]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def peak_memory_mb() -> dict:
+    """
+    Peak resident memory of the build process and of its largest finished worker,
+    None where the platform does not report it.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows: no rusage, psutil reports the peak working set of this process only
+        try:
+            import psutil
+            return {"main": round(psutil.Process().memory_info().peak_wset / 2 ** 20, 1), "workers": None}
+        except (ImportError, AttributeError):
+            return {"main": None, "workers": None}
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2 ** 20
+    return {"main": round(main, 1), "workers": round(workers, 1) if workers else None}
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class StageTimings:
+    """
+    Durations of the build stages as (seconds, items) observations, one per file for
+    parse and split, per call for classify, embed and save. Picklable, so extraction
+    workers can return theirs with their results.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float, items: int = 1):
+        self.stages.setdefault(stage, []).append((seconds, items))
+
+    @contextmanager
+    def timed(self, stage: str, items: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def update(self, other: "StageTimings"):
+        for stage, observations in other.stages.items():
+            self.stages.setdefault(stage, []).extend(observations)
+
+    def items(self, stage: str) -> int:
+        return sum(items for _, items in self.stages.get(stage, []))
+
+    def summary(self) -> dict:
+        """Per stage: totals, quantiles and a histogram of observations per duration bucket."""
+        summary = {}
+        for stage in sorted(self.stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            seconds = sorted(duration for duration, _ in self.stages[stage])
+            total = sum(seconds)
+            buckets = {str(bound): 0 for bound in DURATION_BUCKETS}
+            buckets["+Inf"] = 0
+            for duration in seconds:
+                bound = next((str(bound) for bound in DURATION_BUCKETS if duration <= bound), "+Inf")
+                buckets[bound] += 1
+            summary[stage] = {
+                "count": len(seconds),
+                "items": self.items(stage),
+                "total_seconds": round(total, 3),
+                "mean_seconds": round(total / len(seconds), 4),
+                "p50_seconds": round(percentile(seconds, 0.5), 4),
+                "p95_seconds": round(percentile(seconds, 0.95), 4),
+                "max_seconds": round(seconds[-1], 4),
+                "histogram": buckets,
+            }
+        return summary
+
+
+class BuildReport:
+    """
+    Progress and statistics of a knowledge base build: file counts, stage timings,
+    throughput, ETA and peak memory. Progress is printed every `progress_interval`
+    seconds and the whole report is written as JSON at the end of the build.
+    """
+
+    def __init__(self, total_files: int = None, options: dict = None, progress_interval: float = 30):
+        self.total_files = total_files
+        self.options = options or {}
+        self.progress_interval = progress_interval
+        self.timings = StageTimings()
+        self.processed = self.skipped = 0
+        self.failed = []
+        self.started = datetime.now(timezone.utc)
+        self.start_time = time.monotonic()
+        self.last_progress = self.start_time
+
+    @property
+    def done(self) -> int:
+        return self.processed + self.skipped + len(self.failed)
+
+    def file_done(self):
+        self.processed += 1
+        self.maybe_print_progress()
+
+    def file_skipped(self):
+        self.skipped += 1
+        self.maybe_print_progress()
+
+    def file_failed(self, path: str, reason: str):
+        self.failed.append({"path": path, "reason": reason})
+        print(f"❌ Error processing {path}: {reason}")
+        self.maybe_print_progress()
+
+    def rates(self) -> dict:
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        return {
+            "files_per_second": round(self.done / elapsed, 3),
+            "chunks_per_second": round(self.timings.items("split") / elapsed, 1),
+            "embedded_per_second": round(self.timings.items("embed") / elapsed, 1),
+        }
+
+    def eta(self):
+        """Seconds left at the average rate so far, None until the total and a rate are known."""
+        if not self.total_files or not self.done:
+            return None
+        elapsed = time.monotonic() - self.start_time
+        return max(self.total_files - self.done, 0) * elapsed / self.done
+
+    def maybe_print_progress(self):
+        if time.monotonic() - self.last_progress >= self.progress_interval:
+            self.print_progress()
+
+    def print_progress(self):
+        self.last_progress = time.monotonic()
+        rates = self.rates()
+        total = f"/{self.total_files}" if self.total_files else ""
+        eta = self.eta()
+        stages = ", ".join(
+            f"{stage} {sum(seconds for seconds, _ in self.timings.stages[stage]):.0f}s"
+            for stage in STAGES if stage in self.timings.stages
+        )
+        memory = peak_memory_mb()["main"]
+        print(
+            f"📊 {self.done}{total} files ({len(self.failed)} failed), {rates['files_per_second']:.2f} files/s, "
+            f"{rates['chunks_per_second']:.0f} chunks/s"
+            + (f", ETA {format_duration(eta)}" if eta is not None else "")
+            + (f", peak {memory:.0f} MB" if memory is not None else "")
+            + (f" | {stages}" if stages else "")
+        )
+
+    def to_dict(self, **extra) -> dict:
+        return {
+            "started": self.started.isoformat(),
+            "finished": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": round(time.monotonic() - self.start_time, 3),
+            "options": self.options,
+            "files": {
+                "total": self.total_files,
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "failed": len(self.failed),
+            },
+            "chunks": {"extracted": self.timings.items("split"), "embedded": self.timings.items("embed")},
+            "rates": self.rates(),
+            "stages": self.timings.summary(),
+            "peak_memory_mb": peak_memory_mb(),
+            "failed_files": self.failed,
+            **extra
+        }
+
+    def write(self, path=REPORT_FILE, **extra) -> dict:
+        """Write the JSON report, with any `extra` top-level fields, and return it."""
+        report = self.to_dict(**extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
@@ -0,0 +1,37 @@
+import sqlite3
+from pathlib import Path
+
+
+class DiskCache:
+    """
+    Small persistent key/value cache on SQLite. Safe to share between the build's
+    worker processes; concurrent writers are serialised by SQLite's own locking.
+    """
+
+    def __init__(self, path, table="cache"):
+        self.path = Path(path)
+        self.table = table
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.conn.commit()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        # Stay below SQLite's host parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", batch)
+            found.update(rows)
+        return found
+
+    def set_many(self, items: dict):
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", list(items.items()))
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set(self, key, value):
+        self.set_many({key: value})
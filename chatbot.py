@@ -1,15 +1,33 @@
 import os
+import time
+import uuid
+import asyncio
 import logging
 import json
 from datetime import datetime
 import pytz
+from typing import Dict, List, Optional, Union
 from fastapi import FastAPI, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse  # Import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse  # Import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from langchain_core.messages import AIMessage
-from search import get_intent_chain, convert_configuration_chain, qa_chain  # import your existing RAG setup
+from search import get_intent_chain, convert_configuration_chain  # import your existing RAG setup
+from search import embedding_model, retriever, answer_chain, format_docs, describe_sources, index_path
+from search import docstore, filters_supported, context_budget, prompt_template, search_batch_stats
+from llm_limiter import LLMLimiter, Overloaded
+from intent_router import IntentRouter
+from answer_cache import SemanticCache
+from metadata_filter import normalize_filter, question_filter, intent_filter
+from context_budget import count_tokens
+from config_converter import convert_local, parse_ios, parse_port_map
+from tracing import metrics, start_trace, span, record_stat, current_trace, Gauge
+
+# Per-request token counts are logged under "aiops"
+logging.basicConfig(format="%(levelname)s:     %(name)s: %(message)s")
+logger = logging.getLogger("aiops")
+logger.setLevel(os.getenv("AIOPS_LOG_LEVEL", "INFO"))
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -25,9 +43,47 @@ mock_intent_response = AIMessage(
     content='{ "result": "[{\\"domain\\": \\"external_knowledge\\", \\"sub_intent\\": \\"convert_configuration\\", \\"feature\\": \\"ospf\\", \\"entities\\": {}}]" }'
 )
 
+# Concurrent LLM calls, and how many requests may wait for one before we answer 429
+llm_limiter = LLMLimiter(
+    max_concurrency=int(os.getenv("AIOPS_LLM_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("AIOPS_LLM_QUEUE", "32"))
+)
+metrics.register(Gauge("aiops_llm_active", "LLM calls in progress.", lambda: llm_limiter.active))
+metrics.register(Gauge("aiops_llm_waiting", "Requests waiting for an LLM slot.", lambda: llm_limiter.waiting))
+
+# Local nearest-neighbour intent router; the LLM is only asked when it is not confident
+intent_router = None
+if os.getenv("AIOPS_INTENT_ROUTER", "1") == "1":
+    intent_router = IntentRouter(embedding_model, threshold=float(os.getenv("AIOPS_INTENT_THRESHOLD", "0.88")))
+
+# Semantic cache for knowledge answers, dropped automatically when faiss_index is rebuilt
+answer_cache = None
+if os.getenv("AIOPS_ANSWER_CACHE", "1") == "1":
+    answer_cache = SemanticCache(
+        index_path,
+        threshold=float(os.getenv("AIOPS_CACHE_THRESHOLD", "0.95")),
+        ttl=float(os.getenv("AIOPS_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("AIOPS_CACHE_SIZE", "1000"))
+    )
+
+
+# Convert VLAN, SVI and access port stanzas locally and only send the rest of a configuration to the LLM
+FAST_CONVERT = os.getenv("AIOPS_FAST_CONVERT", "1") == "1"
+# Cisco stack/module to OmniSwitch chassis/slot, e.g. "1/0=1/1,2/0=2/1"; ports of other modules go to the LLM
+PORT_MAP = parse_port_map(os.getenv("AIOPS_PORT_MAP", ""))
+# The rest is split into requests of about this many tokens, converted this many at a time
+CONVERT_CHUNK_TOKENS = int(os.getenv("AIOPS_CONVERT_CHUNK_TOKENS", "1000"))
+CONVERT_CONCURRENCY = int(os.getenv("AIOPS_CONVERT_CONCURRENCY", "4"))
+
+# Restrict retrieval to the product/release a question names and the document types its intent implies
+AUTO_FILTER = os.getenv("AIOPS_AUTO_FILTER", "1") == "1"
+
 
 class UserInput(BaseModel):
     user_input: str
+    no_cache: bool = False  # Bypass the answer cache for this request
+    # e.g. "only AOS 8.9 guides" or {"product": "AOS", "version": "8.9", "document_type": ["Guide"]}
+    filters: Optional[Union[str, Dict[str, Union[str, List[str]]]]] = None
 
 
 @app.get("/")
@@ -45,9 +101,238 @@ async def get_index():
 #     except Exception as e:
 #         return {"error": str(e)}
 
+def parse_intent(content: str) -> dict:
+    intent_result_json = json.loads(json.loads(content)["result"])
+    return {"domain": intent_result_json[0]["domain"], "sub_intent": intent_result_json[0]["sub_intent"]}
+
+def config_timestamp():
+    timezone = "Asia/Singapore"
+    tz = pytz.timezone(timezone)
+    return datetime.now(tz).strftime("%d %b, %Y, %H:%M:%S"), timezone
+
+def overloaded_response(trace=None):
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": "2"},
+        content={
+            "status": "error",
+            "intent": None,
+            "response": None,
+            "request_id": trace.request_id if trace else None,
+            "error": "The assistant is busy, please retry shortly."
+        }
+    )
+
+def record_tokens(stage: str, response, prompt_tokens: int = None, completion: str = None):
+    """Token counts of an LLM call, from the usage OpenAI reports or counted locally."""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        trace.add_tokens(stage, usage.get("input_tokens"), usage.get("output_tokens"))
+    else:
+        text = completion if completion is not None else getattr(response, "content", "")
+        trace.add_tokens(stage, prompt_tokens, count_tokens(text))
+
+async def ainvoke_llm(chain, inputs):
+    async with llm_limiter.slot():
+        return await chain.ainvoke(inputs)
+
+async def resolve_intent(question: str, on_guess=None) -> dict:
+    """The router's intent when it is confident, else the LLM's; on_guess sees the router's best guess first."""
+    with span("intent"):
+        if intent_router:
+            intent, confidence = await intent_router.aguess(question)
+            if confidence >= intent_router.threshold:
+                record_stat("intent_source", "router")
+                return intent
+            if on_guess:
+                on_guess(intent)
+        intent_res = await ainvoke_llm(get_intent_chain, {"question": question})
+        record_stat("intent_source", "llm")
+        record_tokens("intent", intent_res)
+        return parse_intent(intent_res.content)
+
+def cache_scope(question: str):
+    """The product and release a question names; cached answers only serve questions naming the same."""
+    return tuple(sorted((field, tuple(values)) for field, values in normalize_filter(question_filter(question)).items()))
+
+async def lookup_answer(question: str, bypass: bool):
+    """Returns (cached payload or None, question embedding for store_answer)."""
+    if answer_cache is None or bypass:
+        record_stat("answer_cache", "bypass")
+        return None, None
+    with span("answer_cache"):
+        vector = await asyncio.to_thread(embedding_model.embed_query, question)
+        cached = answer_cache.lookup(vector, cache_scope(question))
+    record_stat("answer_cache", "hit" if cached else "miss")
+    return cached, vector
+
+def store_answer(question: str, vector, payload: dict):
+    if answer_cache is not None and vector is not None:
+        answer_cache.store(vector, payload, cache_scope(question))
+
+def invalid_filter_response(error: ValueError):
+    return JSONResponse(status_code=400, content={"status": "error", "intent": None, "response": None, "error": str(error)})
+
+def request_filter(filters):
+    """The filter sent with a request, normalized; raises ValueError when it cannot be applied."""
+    if not filters:
+        return None
+    if not filters_supported:
+        raise ValueError("Filters need an index rebuilt with build_kb.py (docstore.sqlite with chunk_filters)")
+    return normalize_filter(filters) or None
+
+def auto_filter(question: str, intent: dict = None):
+    """Filter derived from the question (and intent once known), if the corpus has matching chunks."""
+    if not AUTO_FILTER or not filters_supported:
+        return None
+    candidates = [intent_filter(question, intent)] if intent else []
+    candidates.append(question_filter(question))
+    for candidate in candidates:
+        candidate = normalize_filter(candidate)
+        if candidate and len(docstore.filter_positions(candidate)):
+            return candidate
+    return None
+
+async def retrieve(question: str, search_filter=None):
+    with span("retrieval"):
+        if search_filter:
+            docs = await retriever.ainvoke(question, filter=search_filter)
+        else:
+            docs = await retriever.ainvoke(question)
+    record_stat("retrieved", len(docs))
+    return docs
+
+def start_retrieval(question: str, search_filter=None):
+    return asyncio.create_task(retrieve(question, search_filter))
+
+def is_knowledge_question(intent) -> bool:
+    return intent["domain"] == "external_knowledge" and intent["sub_intent"] != "convert_configuration"
+
+def refine_retrieval(question: str, intent: dict, retrieval, search_filter):
+    """Restart the speculative retrieval when the resolved intent narrows the automatic filter."""
+    refined = auto_filter(question, intent)
+    if refined == search_filter:
+        return retrieval, search_filter
+    discard(retrieval)
+    return start_retrieval(question, refined), refined
+
+async def resolve_and_retrieve(question: str, explicit_filter=None):
+    """
+    Returns (intent, retrieval task or None, search filter). Retrieval starts while the
+    LLM resolves the intent only when the question holds no configuration stanza and the
+    router's best guess is a knowledge question; otherwise it waits for the intent, and
+    conversions and other intents never retrieve. Cancelling a task does not stop a
+    search already running in a worker thread, so speculation is kept to likely hits.
+    """
+    speculative = {}
+
+    def speculate(guess):
+        if is_knowledge_question(guess) and not parse_ios(question)[1]:
+            speculative["filter"] = explicit_filter or auto_filter(question)
+            speculative["task"] = start_retrieval(question, speculative["filter"])
+
+    try:
+        intent = await resolve_intent(question, speculate)
+    except BaseException:
+        discard(speculative.get("task"))
+        raise
+    retrieval = speculative.get("task")
+    if not is_knowledge_question(intent):
+        discard(retrieval)
+        return intent, None, explicit_filter
+    if retrieval is None:
+        search_filter = explicit_filter or auto_filter(question, intent)
+        return intent, start_retrieval(question, search_filter), search_filter
+    if explicit_filter is not None:
+        return intent, retrieval, explicit_filter
+    retrieval, search_filter = refine_retrieval(question, intent, retrieval, speculative["filter"])
+    return intent, retrieval, search_filter
+
+def build_context(question: str, docs):
+    """Fit the retrieved chunks to the token budget; returns (docs used, context text)."""
+    with span("prompt"):
+        retrieved = len(docs)
+        docs = context_budget.compress_documents(docs, question)
+        context = format_docs(docs)
+        prompt_tokens = count_tokens(prompt_template.format(context=context, question=question))
+    logger.info("prompt: %d tokens", prompt_tokens)
+    record_stat("context", {"chunks": retrieved, "blocks": len(docs), "prompt_tokens": prompt_tokens})
+    return docs, context
+
+async def convert_with_llm(question: str) -> str:
+    response = await ainvoke_llm(convert_configuration_chain, {"question": question})
+    record_tokens("convert", response)
+    return response.content
+
+def local_conversion(question: str):
+    """The rule-based conversion of a configuration, None when the question holds no stanza."""
+    with span("local_convert"):
+        conversion = convert_local(question, rules=FAST_CONVERT, port_map=PORT_MAP)
+    if not conversion.converted and not conversion.unrecognised:
+        return None
+    record_stat("convert", {"converted": conversion.converted, "unrecognised": len(conversion.unrecognised)})
+    return conversion
+
+async def convert_chunks(conversion):
+    """
+    Convert the unrecognised stanzas of `conversion` with the LLM, in chunks of about
+    CONVERT_CHUNK_TOKENS and at most CONVERT_CONCURRENCY chunks at a time. Yields
+    (done, total) before the first chunk and as each one completes; the answers are
+    then merged in chunk order, so the output does not depend on completion order.
+    """
+    questions = conversion.remote_questions(CONVERT_CHUNK_TOKENS, count_tokens)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.stats["convert"]["chunks"] = len(questions)
+    semaphore = asyncio.Semaphore(CONVERT_CONCURRENCY)
+
+    async def convert(question):
+        async with semaphore:
+            return await convert_with_llm(question)
+
+    tasks = [asyncio.ensure_future(convert(question)) for question in questions]
+    try:
+        yield 0, len(tasks)
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            await task
+            yield done, len(tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    for task in tasks:
+        conversion.merge(task.result())
+
+async def finish_conversion(conversion) -> str:
+    async for _ in convert_chunks(conversion):
+        pass
+    return conversion.render()
+
+def discard(task):
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()  # Mark a failed, unused retrieval as handled
+
 @app.post("/process_input")
-def chat(user_input: UserInput):
+async def chat(user_input: UserInput):
     MOCK = False
+    trace = start_trace("process_input")
+    if llm_limiter.overloaded():
+        trace.finish("overloaded")
+        return overloaded_response(trace)
+    try:
+        explicit_filter = request_filter(user_input.filters)
+    except ValueError as e:
+        trace.finish("error")
+        return invalid_filter_response(e)
+    retrieval = None
+    cached = None
+    search_filter = None
     try:
         question = user_input.user_input
 
@@ -78,54 +363,208 @@ def chat(user_input: UserInput):
             !                
 
             """  # Your mock Cisco config text
-            intent_result_json = json.loads(json.loads(mock_intent_response.content)["result"])
+            intent = parse_intent(mock_intent_response.content)
         else:
-            intent_res = get_intent_chain.invoke({"question": question})
-            intent_result_json = json.loads(json.loads(intent_res.content)["result"])
+            intent, retrieval, search_filter = await resolve_and_retrieve(question, explicit_filter)
+        record_stat("filter", search_filter)
 
-        domain = intent_result_json[0]["domain"]
-        sub_intent = intent_result_json[0]["sub_intent"]
+        domain = intent["domain"]
+        sub_intent = intent["sub_intent"]
 
-        intent = {"domain": domain, "sub_intent": sub_intent}
         response_payload = {"message": "", "answer": "", "timestamp": None, "timezone": None}
 
         if domain == "external_knowledge":
             if sub_intent == "convert_configuration":
-                timezone = "Asia/Singapore"
-                tz = pytz.timezone(timezone)
-                current_time = datetime.now(tz).strftime("%d %b, %Y, %H:%M:%S")
+                current_time, timezone = config_timestamp()
 
-                response = convert_configuration_chain.invoke({"question": question})
+                conversion = local_conversion(question)
+                with span("generation"):
+                    answer = await finish_conversion(conversion) if conversion else await convert_with_llm(question)
                 response_payload = {
                     "message": f"""
                     Here is the response to your question. \n
                     ! AI Generated Alcatel AOS configuration at {current_time} in {timezone}.""",
-                    "answer": response.content,
+                    "answer": answer,
                     "timestamp": current_time,
                     "timezone": timezone
                 }
             else:
-                response = qa_chain.invoke({"query": question})
-                response_payload = {
-                    "message": "Here is the response to your question.\n",
-                    "answer": response["result"],
-                    "timestamp": None,
-                    "timezone": None
-                }
+                # Answers to explicitly filtered requests are neither served from nor stored in the cache
+                cached, question_vector = await lookup_answer(question, user_input.no_cache or explicit_filter is not None)
+                if cached:
+                    response_payload = {key: cached[key] for key in ["message", "answer", "timestamp", "timezone"]}
+                else:
+                    with span("retrieval_wait"):
+                        docs = await retrieval if retrieval else await retrieve(question)
+                    docs, context = build_context(question, docs)
+                    with span("generation"):
+                        response = await ainvoke_llm(answer_chain, {"context": context, "question": question})
+                    record_tokens("answer", response, trace.stats["context"]["prompt_tokens"])
+                    response_payload = {
+                        "message": "Here is the response to your question.\n",
+                        "answer": response.content,
+                        "timestamp": None,
+                        "timezone": None
+                    }
+                    store_answer(question, question_vector, dict(response_payload, sources=describe_sources(docs)))
 
         return {
             "status": "success",
             "intent": intent,
             "response": response_payload,
+            "cached": cached is not None,
+            "filter": search_filter,
+            "request_id": trace.request_id,
+            "trace": trace.finish("success"),
             "error": None
         }
 
+    except Overloaded:
+        trace.finish("overloaded")
+        return overloaded_response(trace)
+
     except Exception as e:
         logging.error(f"Error occurred: {e}")
         return {
             "status": "error",
             "intent": None,
             "response": None,
+            "request_id": trace.request_id,
+            "trace": trace.finish("error"),
             "error": str(e)
         }
 
+    finally:
+        discard(retrieval)
+
+
+
+def ndjson(event: str, **payload) -> str:
+    return json.dumps({"event": event, **payload}) + "\n"
+
+async def astream_llm(chain, inputs):
+    async with llm_limiter.slot():
+        async for chunk in chain.astream(inputs):
+            yield chunk.content
+
+async def replay(answer: str):
+    yield answer
+
+async def stream_chat(question: str, no_cache: bool = False, explicit_filter=None, request_id: str = None):
+    """
+    Yields NDJSON events: intent, sources (knowledge questions only), message,
+    progress while the chunks of a configuration are converted, one token event per
+    answer fragment, then done with the server-side timings and the request trace. `explicit_filter` is a normalized filter from request_filter.
+    """
+    trace = start_trace("process_input/stream", request_id)
+    started = time.perf_counter()
+    first_token_at = None
+    cached = question_vector = retrieval = None
+    answer = []
+    try:
+        intent, retrieval, search_filter = await resolve_and_retrieve(question, explicit_filter)
+        record_stat("filter", search_filter)
+        yield ndjson("intent", intent=intent)
+
+        timestamp = timezone = None
+        tokens = token_stage = None
+        if intent["domain"] != "external_knowledge":
+            pass
+        elif intent["sub_intent"] == "convert_configuration":
+            timestamp, timezone = config_timestamp()
+            yield ndjson("message", message=f"""
+                    Here is the response to your question. \n
+                    ! AI Generated Alcatel AOS configuration at {timestamp} in {timezone}.""")
+            conversion = local_conversion(question)
+            if conversion:
+                # Chunks are converted in parallel and merged in order, so only progress can be streamed
+                with span("convert_chunks"):
+                    async for done, total in convert_chunks(conversion):
+                        yield ndjson("progress", stage="convert", done=done, total=total, converted=conversion.converted)
+                tokens = replay(conversion.render())
+            else:
+                tokens = astream_llm(convert_configuration_chain, {"question": question})
+                token_stage = "convert"
+        else:
+            cached, question_vector = await lookup_answer(question, no_cache or explicit_filter is not None)
+            if cached:
+                yield ndjson("sources", sources=cached["sources"])
+                yield ndjson("message", message=cached["message"])
+                tokens = replay(cached["answer"])
+            else:
+                with span("retrieval_wait"):
+                    docs = await retrieval
+                docs, context = build_context(question, docs)
+                yield ndjson("sources", sources=describe_sources(docs), filter=search_filter)
+                yield ndjson("message", message="Here is the response to your question.\n")
+                tokens = astream_llm(answer_chain, {"context": context, "question": question})
+                token_stage = "answer"
+
+        if tokens is not None:
+            # Time spent yielding to a slow client is included, as the client sees it
+            with span("generation" if not cached else "cached_replay"):
+                async for token in tokens:
+                    if not token:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        trace.mark_first_token()
+                    answer.append(token)
+                    yield ndjson("token", token=token)
+            if token_stage:
+                prompt_tokens = trace.stats["context"]["prompt_tokens"] if token_stage == "answer" else None
+                record_tokens(token_stage, None, prompt_tokens, "".join(answer))
+
+        if question_vector is not None and not cached:
+            store_answer(question, question_vector, {
+                "message": "Here is the response to your question.\n",
+                "answer": "".join(answer),
+                "timestamp": None,
+                "timezone": None,
+                "sources": describe_sources(docs)
+            })
+
+        yield ndjson(
+            "done",
+            timestamp=timestamp,
+            timezone=timezone,
+            cached=cached is not None,
+            ttft_ms=round((first_token_at - started) * 1000) if first_token_at else None,
+            total_ms=round((time.perf_counter() - started) * 1000),
+            request_id=trace.request_id,
+            trace=trace.finish("success")
+        )
+
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
+        yield ndjson("error", error=str(e), request_id=trace.request_id, trace=trace.finish("error"))
+
+    finally:
+        discard(retrieval)
+
+@app.post("/process_input/stream")
+async def chat_stream(user_input: UserInput):
+    if llm_limiter.overloaded():
+        return overloaded_response()
+    try:
+        explicit_filter = request_filter(user_input.filters)
+    except ValueError as e:
+        return invalid_filter_response(e)
+    request_id = uuid.uuid4().hex
+    return StreamingResponse(
+        stream_chat(user_input.user_input, user_input.no_cache, explicit_filter, request_id),
+        media_type="application/x-ndjson",
+        headers={"X-Request-ID": request_id}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "answers": answer_cache.stats() if answer_cache else {"enabled": False},
+        "query_embeddings": embedding_model.stats(),
+        "vector_search_batches": search_batch_stats(),
+    }
@@ -0,0 +1,366 @@
+import re
+import ipaddress
+
+# Output groups of a converted configuration, in the order of convert_configuration_template
+GROUPS = [
+    ("vlan", "VLAN configuration"),
+    ("members", "Port Membership"),
+    ("ip", "IP Interface"),
+    ("other", "Other"),
+]
+DEFAULT_REQUEST = "Help me convert the following Cisco IOS configuration to Alcatel AOS configuration."
+
+VLAN_HEADER = re.compile(r"^vlan\s+(\d[\d,\-\s]*)$", re.I)
+INTERFACE_HEADER = re.compile(r"^interface\s+(.+)$", re.I)
+# Global commands that start a new stanza even when a pasted config lost its indentation
+TOP_LEVEL = re.compile(
+    r"^(hostname|router|line|spanning-tree|snmp-server|ntp|username|enable|aaa|access-list|banner|service|"
+    r"logging|version|boot|end|clock|control-plane|crypto|class-map|policy-map|vtp|errdisable|monitor|"
+    r"archive|track|radius|radius-server|tacacs-server|lldp|cdp|no\s+ip|"
+    r"ip\s+(route|access-list|domain|domain-name|name-server|routing|http|ssh|default-gateway))\b",
+    re.I,
+)
+SVI_NAME = re.compile(r"^vlan\s*(\d+)$", re.I)
+# Ethernet ports numbered stack/module/port (incl. the "GigibitEthernet" typo)
+PORT_NAME = re.compile(r"^(?:[a-z]*ethernet|gi|fa|te|tw|fo|hu|eth?)\s*(\d+/\d+)/(\d+)$", re.I)
+IP_ADDRESS = re.compile(r"^ip\s+address\s+(\S+)\s+(\S+)$", re.I)
+HELPER_ADDRESS = re.compile(r"^ip\s+helper-address\s+(\S+)$", re.I)
+ACCESS_VLAN = re.compile(r"^switchport\s+access\s+vlan\s+(\d+)$", re.I)
+VLAN_NAME = re.compile(r'^name\s+"?([^"]*?)"?$', re.I)
+# Sub-commands with nothing to emit: AOS ports and IP interfaces are enabled by default
+NO_OP = {"exit", "no shutdown", "switchport", "switchport mode access"}
+# AOS lines go to the group of their first matching pattern, "other" otherwise
+AOS_GROUPS = [
+    ("members", re.compile(r"^vlan\s+\d+\s+members?\s", re.I)),
+    ("vlan", re.compile(r"^vlan\s+\d+", re.I)),
+    ("ip", re.compile(r"^ip\s+(interface|dhcp|helper)", re.I)),
+]
+GROUP_HEADERS = {title.lower() for _, title in GROUPS}
+# Names a line defines or uses. Stanzas sharing one (a port-channel and its members, an
+# ACL and the interfaces applying it, ...) are sent to the LLM in the same request
+REFERENCE_PATTERNS = [
+    (re.compile(r"^interface\s+(?:port-channel|po)\s*(\d+)$", re.I), "port-channel"),
+    (re.compile(r"^channel-group\s+(\d+)\b", re.I), "port-channel"),
+    (re.compile(r"^ip\s+access-list\s+(?:standard\s+|extended\s+)?(\S+)", re.I), "acl"),
+    (re.compile(r"^access-list\s+(\S+)", re.I), "acl"),
+    (re.compile(r"\b(?:access-group|access-class)\s+(\S+)", re.I), "acl"),
+    (re.compile(r"^match\s+(?:ip\s+)?(?:access-group\s+name\s+|address\s+(?!prefix-list))(\S+)", re.I), "acl"),
+    (re.compile(r"\bprefix-list\s+(\S+)", re.I), "prefix-list"),
+    (re.compile(r"\broute-map\s+(\S+)", re.I), "route-map"),
+    (re.compile(r"^class-map\s+(?:type\s+\S+\s+)?(?:match-(?:any|all)\s+)?(\S+)", re.I), "class-map"),
+    (re.compile(r"^class\s+(?:type\s+\S+\s+)?(?!class-default\b)(\S+)", re.I), "class-map"),
+    (re.compile(r"^policy-map\s+(?:type\s+\S+\s+)?(\S+)", re.I), "policy-map"),
+    (re.compile(r"^service-policy\s+(?:type\s+\S+\s+)?(?:(?:input|output)\s+)?(\S+)", re.I), "policy-map"),
+    (re.compile(r"^(?:ip\s+)?vrf\s+(?:definition\s+|forwarding\s+)?(\S+)", re.I), "vrf"),
+    # Routing processes, static routes and redistribution depend on each other as a whole
+    (re.compile(r"^(?:router\s+\S+|ip\s+route\b)()", re.I), "routing"),
+]
+
+
+class Stanza:
+    """A global configuration command and the sub-commands under it."""
+
+    def __init__(self, header: str):
+        self.header = header
+        self.lines = []
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + [" " + line for line in self.lines])
+
+
+def is_stanza_start(line: str) -> bool:
+    return bool(VLAN_HEADER.match(line) or INTERFACE_HEADER.match(line) or TOP_LEVEL.match(line))
+
+def parse_ios(text: str):
+    """
+    Split an IOS configuration into stanzas. Returns (preamble, stanzas), where the
+    preamble is any prose before the configuration (the user's request). A stanza ends
+    at "!", at a line indented no deeper than its header when the configuration is
+    indented, or at a global command at the header's level; "--" lines are comments.
+    """
+    preamble = []
+    stanzas = []
+    current = None
+    header_indent = body_indent = None
+    started = False
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("--"):
+            continue
+        if not started and not (line.startswith("!") or is_stanza_start(line)):
+            preamble.append(line)
+            continue
+        started = True
+        if line.startswith("!"):
+            current = None
+            continue
+        indent = len(raw) - len(raw.lstrip())
+        # Lines indented deeper than the header are its sub-commands, even those that look
+        # global ("no ip redirects", "spanning-tree portfast"). Global commands are only
+        # recognised by name at the header's level, which matters when nothing is indented
+        nested = current is not None and indent > header_indent
+        indented = body_indent is not None and body_indent > header_indent
+        if current is None or not nested and (indented or is_stanza_start(line)):
+            current = Stanza(line)
+            stanzas.append(current)
+            header_indent, body_indent = indent, None
+        else:
+            current.lines.append(line)
+            if body_indent is None:
+                body_indent = indent
+    return "\n".join(preamble), stanzas
+
+
+def vlan_ids(spec: str):
+    """VLAN IDs of a "10,20-22" list, None if any is out of range."""
+    ids = []
+    for part in spec.replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        ids.extend(range(int(first), int(last or first) + 1))
+    return ids if ids and all(1 <= vlan <= 4094 for vlan in ids) else None
+
+def valid_ipv4(*addresses) -> bool:
+    try:
+        for address in addresses:
+            ipaddress.IPv4Address(address)
+    except ValueError:
+        return False
+    return True
+
+
+class ConfigConversion:
+    """
+    Rule-based conversion of the IOS constructs of convert_configuration_template:
+    VLAN names, SVI addresses, DHCP helper addresses and access ports of the modules
+    in `port_map`. A stanza is converted only if every one of its lines is understood;
+    the others are kept in `unrecognised` for the LLM, whose answer is merged back
+    with `merge`.
+    """
+
+    def __init__(self, preamble: str = "", port_map: dict = None):
+        self.preamble = preamble
+        self.port_map = port_map or {}
+        self.vlans = {}
+        self.members = []
+        self.interfaces = {}
+        self.relays = []  # (vlan, DHCP server) pairs
+        self.extra = {name: [] for name, _ in GROUPS}
+        self.converted = 0
+        self.unrecognised = []
+
+    def add(self, stanza: Stanza) -> bool:
+        vlan = VLAN_HEADER.match(stanza.header)
+        interface = INTERFACE_HEADER.match(stanza.header)
+        if vlan:
+            converted = self.add_vlans(vlan_ids(vlan.group(1)), stanza.lines)
+        elif interface and SVI_NAME.match(interface.group(1).strip()):
+            converted = self.add_svi(int(SVI_NAME.match(interface.group(1).strip()).group(1)), stanza.lines)
+        elif interface and PORT_NAME.match(interface.group(1).strip()):
+            converted = self.add_port(*PORT_NAME.match(interface.group(1).strip()).groups(), stanza.lines)
+        else:
+            converted = False
+        if converted:
+            self.converted += 1
+        else:
+            self.unrecognised.append(stanza)
+        return converted
+
+    def add_vlans(self, ids, lines) -> bool:
+        if ids is None:
+            return False
+        name = None
+        for line in lines:
+            match = VLAN_NAME.match(line)
+            if match and len(ids) == 1:
+                name = match.group(1)
+            elif line.lower() not in NO_OP:
+                return False
+        for vlan in ids:
+            self.vlans[vlan] = name if name is not None else self.vlans.get(vlan)
+        return True
+
+    def add_svi(self, vlan: int, lines) -> bool:
+        if not 1 <= vlan <= 4094:
+            return False
+        address = None
+        helpers = []
+        for line in lines:
+            ip, helper = IP_ADDRESS.match(line), HELPER_ADDRESS.match(line)
+            if ip and address is None and valid_ipv4(*ip.groups()):
+                address = ip.groups()
+            elif helper and valid_ipv4(helper.group(1)):
+                helpers.append(helper.group(1))
+            elif line.lower() not in NO_OP:
+                return False
+        self.vlans.setdefault(vlan, None)
+        if address:
+            self.interfaces[vlan] = address
+        for helper in helpers:
+            if (vlan, helper) not in self.relays:
+                self.relays.append((vlan, helper))
+        return True
+
+    def add_port(self, prefix: str, number: str, lines) -> bool:
+        # Cisco stack/module numbers say nothing about OmniSwitch chassis/slot numbers
+        if prefix not in self.port_map:
+            return False
+        port = f"{self.port_map[prefix]}/{number}"
+        vlan = None
+        for line in lines:
+            access = ACCESS_VLAN.match(line)
+            if access and 1 <= int(access.group(1)) <= 4094:
+                vlan = int(access.group(1))
+            elif line.lower() not in NO_OP:
+                return False
+        if vlan is not None:
+            # IOS creates the access VLAN implicitly, AOS needs it declared
+            self.vlans.setdefault(vlan, None)
+            self.members.append((vlan, port))
+        return True
+
+    def remote_question(self, stanzas=None) -> str:
+        """The request to send the LLM: the user's prose plus `stanzas`, all unrecognised stanzas by default."""
+        text = "\n!\n".join(stanza.text for stanza in (self.unrecognised if stanzas is None else stanzas))
+        return f"{self.preamble or DEFAULT_REQUEST}\n\n!\n{text}\n!"
+
+    def remote_questions(self, max_tokens: int, count_tokens) -> list:
+        """The unrecognised stanzas as independent requests of about `max_tokens` each."""
+        return [self.remote_question(group) for group in split_stanzas(self.unrecognised, max_tokens, count_tokens)]
+
+    def merge(self, answer: str):
+        """Add the lines of an AOS configuration to their groups."""
+        for name, lines in group_aos_lines(answer).items():
+            self.extra[name].extend(lines)
+
+    def groups(self) -> dict:
+        groups = {
+            "vlan": [f'vlan {vlan} name "{name}"' if name else f"vlan {vlan}" for vlan, name in sorted(self.vlans.items())],
+            "members": [
+                f"vlan {vlan} member port {port} untagged"
+                for vlan, port in sorted(self.members, key=lambda member: member[0])
+            ],
+            "ip": [
+                f'ip interface "int_vlan_{vlan}" address {address} mask {mask} vlan {vlan}'
+                for vlan, (address, mask) in sorted(self.interfaces.items())
+            ] + self.relay_lines(),
+            "other": [],
+        }
+        for name, lines in self.extra.items():
+            seen = set(groups[name])
+            for line in lines:
+                if line not in seen:
+                    seen.add(line)
+                    groups[name].append(line)
+        return groups
+
+    def relay_lines(self) -> list:
+        # Per-VLAN mode keeps each helper-address on its own VLAN, as IOS scopes it to the SVI
+        if not self.relays:
+            return []
+        return ["ip helper per-vlan only"] + [
+            f"ip helper address {helper} vlan {vlan}" for vlan, helper in sorted(self.relays, key=lambda relay: relay[0])
+        ]
+
+    def render(self) -> str:
+        return render_groups(self.groups())
+
+
+def stanza_references(stanza: Stanza) -> set:
+    references = set()
+    for line in [stanza.header] + stanza.lines:
+        for pattern, kind in REFERENCE_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                references.add((kind, match.group(1).lower()))
+    return references
+
+def related_groups(stanzas) -> list:
+    """Stanzas joined when they share a reference (see REFERENCE_PATTERNS), in order of first appearance."""
+    parent = list(range(len(stanzas)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owners = {}
+    for i, stanza in enumerate(stanzas):
+        for reference in stanza_references(stanza):
+            if reference in owners:
+                parent[find(i)] = find(owners[reference])
+            else:
+                owners[reference] = i
+    groups = {}
+    for i, stanza in enumerate(stanzas):
+        groups.setdefault(find(i), []).append(stanza)
+    return list(groups.values())
+
+def split_stanzas(stanzas, max_tokens: int, count_tokens) -> list:
+    """
+    Stanzas packed into requests of at most `max_tokens`. Related stanzas always go in
+    the same request, even when that makes it larger.
+    """
+    requests = []
+    size = 0
+    for group in related_groups(stanzas):
+        tokens = sum(count_tokens(stanza.text) for stanza in group)
+        if requests and size + tokens <= max_tokens:
+            requests[-1].extend(group)
+            size += tokens
+        else:
+            requests.append(list(group))
+            size = tokens
+    return requests
+
+def group_aos_lines(text: str) -> dict:
+    """Sort the lines of an AOS configuration into GROUPS, dropping "!" separators and group headings."""
+    groups = {name: [] for name, _ in GROUPS}
+    for raw in text.splitlines():
+        line = raw.strip().strip("`")
+        if not line or line == "!" or line.startswith(("```", "--")):
+            continue
+        if line.startswith("!") and line.lstrip("! ").lower() in GROUP_HEADERS:
+            continue
+        name = next((name for name, pattern in AOS_GROUPS if pattern.match(line)), "other")
+        groups[name].append(line)
+    return groups
+
+def render_groups(groups: dict) -> str:
+    sections = []
+    for name, title in GROUPS:
+        if groups.get(name):
+            sections.append(f"!\n! {title}\n!\n" + "\n".join(groups[name]))
+    return "\n".join(sections) + "\n!" if sections else ""
+
+
+def parse_port_map(spec: str) -> dict:
+    """
+    "1/0=1/1,2/0=2/1" -> {"1/0": "1/1", "2/0": "2/1"}: Cisco stack/module prefixes and
+    the OmniSwitch chassis/slot their ports are converted to, keeping the port number.
+    """
+    port_map = {}
+    for pair in filter(None, (part.strip() for part in spec.split(","))):
+        cisco, separator, aos = (side.strip() for side in pair.partition("="))
+        if not separator or not re.fullmatch(r"\d+/\d+", cisco) or not re.fullmatch(r"\d+/\d+", aos):
+            raise ValueError(f"Invalid port mapping {pair!r}, expected <stack>/<module>=<chassis>/<slot>")
+        port_map[cisco] = aos
+    return port_map
+
+def convert_local(text: str, rules: bool = True, port_map: dict = None) -> ConfigConversion:
+    """
+    Parse a question holding an IOS configuration and convert the stanzas the rules
+    understand. Access ports are only converted on modules listed in `port_map`
+    (see parse_port_map); with `rules` off every stanza is left for the LLM.
+    """
+    preamble, stanzas = parse_ios(text)
+    conversion = ConfigConversion(preamble, port_map)
+    for stanza in stanzas:
+        if rules:
+            conversion.add(stanza)
+        else:
+            conversion.unrecognised.append(stanza)
+    return conversion
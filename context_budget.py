@@ -0,0 +1,148 @@
+import re
+import logging
+from typing import List, Optional, Sequence
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import Document, BaseDocumentCompressor
+
+logger = logging.getLogger("aiops.context")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """GPT-4o tokens in `text`; roughly 4 characters per token when tiktoken is unavailable."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model("gpt-4o")
+        except (ImportError, KeyError):
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if _encoding:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens])
+    return text[:max_tokens * 4]
+
+def text_overlap(first: str, second: str, min_overlap: int = 20, max_overlap: int = 200) -> int:
+    """Length of the longest suffix of `first` that starts `second`, 0 below `min_overlap`."""
+    for size in range(min(max_overlap, len(first), len(second)), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+def shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w[\w-]*", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+class Block:
+    """Consecutive text of one page assembled from one or more retrieved chunks."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.text = doc.page_content
+        self.metadata = dict(doc.metadata)
+        self.rank = rank
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(self.text) if self.start is not None else None
+        self.chunks = 1
+
+    @property
+    def page(self):
+        return self.metadata.get("source"), self.metadata.get("page")
+
+    def join(self, other: "Block", max_gap: int) -> bool:
+        """Append or prepend `other` when the two are contiguous on the page."""
+        if self.start is not None and other.start is not None:
+            first, second = (self, other) if self.start <= other.start else (other, self)
+            if second.start > first.end + max_gap:
+                return False
+            if second.end <= first.end:
+                text = first.text
+            else:
+                overlap = first.end - second.start
+                text = first.text + second.text[overlap:] if overlap >= 0 else first.text + "\n" + second.text
+            self.start, self.end = first.start, max(first.end, second.end)
+            self.metadata["start_index"] = self.start
+        elif other.text in self.text:
+            text = self.text
+        elif self.text in other.text:
+            text = other.text
+        elif text_overlap(self.text, other.text):
+            text = self.text + other.text[text_overlap(self.text, other.text):]
+        elif text_overlap(other.text, self.text):
+            text = other.text + self.text[text_overlap(other.text, self.text):]
+        else:
+            return False
+        self.text = text
+        self.rank = min(self.rank, other.rank)
+        self.chunks += other.chunks
+        return True
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.text, metadata=self.metadata)
+
+
+class ContextBudget(BaseDocumentCompressor):
+    """
+    Assembles retrieved chunks into the prompt context: chunks that overlap or touch
+    on the same page are merged (the splitter overlaps chunks by 50 characters),
+    near-duplicates are dropped, and the rest are kept in relevance order until
+    `max_tokens` is reached. Input documents are expected best first.
+    """
+
+    max_tokens: int = 3000
+    max_gap: int = 2
+    duplicate_threshold: float = 0.9
+
+    def merge(self, documents: Sequence[Document]) -> List[Block]:
+        blocks = []
+        for rank, doc in enumerate(documents):
+            block = Block(doc, rank)
+            # A chunk can bridge two blocks, so keep merging until nothing joins
+            merged = True
+            while merged:
+                merged = False
+                for other in blocks:
+                    if other.page == block.page and other.join(block, self.max_gap):
+                        blocks.remove(other)
+                        block = other
+                        merged = True
+                        break
+            blocks.append(block)
+        return sorted(blocks, key=lambda block: block.rank)
+
+    def drop_duplicates(self, blocks: List[Block]) -> List[Block]:
+        kept, kept_shingles = [], []
+        for block in blocks:
+            block_shingles = shingles(block.text)
+            if any(len(block_shingles & other) >= self.duplicate_threshold * len(block_shingles) for other in kept_shingles):
+                continue
+            kept.append(block)
+            kept_shingles.append(block_shingles)
+        return kept
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        merged = self.merge(documents)
+        blocks = self.drop_duplicates(merged)
+        selected, used = [], 0
+        for block in blocks:
+            tokens = count_tokens(block.text) + 2  # "\n\n" separator in format_docs
+            if used + tokens > self.max_tokens:
+                if selected:
+                    continue
+                block.text = truncate_tokens(block.text, self.max_tokens - 2)
+                tokens = self.max_tokens
+            selected.append(block)
+            used += tokens
+
+        logger.info(
+            "context: %d chunks, %d tokens -> %d blocks, %d tokens (budget %d, %d near-duplicates, %d over budget)",
+            len(documents), sum(count_tokens(doc.page_content) + 2 for doc in documents),
+            len(selected), used, self.max_tokens, len(merged) - len(blocks), len(blocks) - len(selected)
+        )
+        return [block.to_document() for block in selected]
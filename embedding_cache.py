@@ -0,0 +1,145 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from cache import DiskCache
+from micro_batch import MicroBatcher
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a cache keyed by SHA256 of model name plus text:
+    an SQLite file on disk for builds (`disk_path`) and/or an in-memory LRU for
+    queries (`memory_size`). Texts repeated within one call are embedded once.
+    """
+
+    def __init__(self, embeddings, model_name: str, disk_path=None, memory_size: int = 0):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.disk_path = disk_path
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self._disk = None
+        self.hits = self.misses = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def disk(self):
+        # One connection per process
+        if self.disk_path is None:
+            return None
+        if self._disk is None or self._disk[0] != os.getpid():
+            self._disk = (os.getpid(), DiskCache(self.disk_path, table="embeddings"))
+        return self._disk[1]
+
+    def lookup(self, keys: list) -> dict:
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+        missing = [key for key in keys if key not in found]
+        disk = self.disk()
+        if disk and missing:
+            for key, blob in disk.get_many(missing).items():
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def remember(self, vectors: dict, persist: bool):
+        if self.memory_size:
+            with self.lock:
+                for key, vector in vectors.items():
+                    self.memory[key] = vector
+                    self.memory.move_to_end(key)
+                while len(self.memory) > self.memory_size:
+                    self.memory.popitem(last=False)
+        disk = self.disk()
+        if disk and persist and vectors:
+            disk.set_many({key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in vectors.items()})
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [self.key(text) for text in texts]
+        unique = dict(zip(keys, texts))
+        found = self.lookup(list(unique))
+
+        todo = {key: text for key, text in unique.items() if key not in found}
+        if todo:
+            computed = dict(zip(todo, self.embeddings.embed_documents(list(todo.values()))))
+            self.remember(computed, persist=True)
+            found.update(computed)
+        else:
+            computed = {}
+        self.remember({key: found[key] for key in unique if key not in computed}, persist=False)
+
+        self.hits += len(texts) - len(todo)
+        self.misses += len(todo)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        key = self.key(f"query:{text}")
+        found = self.lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.misses += 1
+        self.remember({key: vector}, persist=False)
+        return vector
+
+    def embed_queries(self, texts: list) -> list:
+        """
+        embed_query for many texts, with the misses embedded in one batch. Assumes the
+        model embeds queries like documents, without an instruction prefix (gte-small).
+        """
+        keys = [self.key(f"query:{text}") for text in texts]
+        unique = dict(zip(keys, texts))
+        found = self.lookup(list(unique))
+
+        todo = {key: text for key, text in unique.items() if key not in found}
+        if todo:
+            computed = dict(zip(todo, self.embeddings.embed_documents(list(todo.values()))))
+            self.remember(computed, persist=False)
+            found.update(computed)
+
+        self.hits += len(texts) - len(todo)
+        self.misses += len(todo)
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so embed_query calls from concurrent threads are
+    micro-batched into one embed_queries call (see MicroBatcher). Used by the plain
+    FAISS retriever, which embeds each query on its own.
+    """
+
+    def __init__(self, embeddings, max_batch: int = 32, max_wait: float = 0.005):
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(self.embed_queries, max_batch, max_wait, name="query-embedding")
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        return self.batcher(text)
+
+    def embed_queries(self, texts: list) -> list:
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        return embed_queries(texts) if embed_queries else [self.embeddings.embed_query(text) for text in texts]
+
+    def batch_stats(self) -> dict:
+        return self.batcher.stats()
@@ -0,0 +1,120 @@
+import os
+import platform
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+# Quantised ONNX models are exported here on first use
+EMBEDDING_MODEL_DIR = Path("embedding_models")
+
+
+def resolve_device(device: str) -> str:
+    if device != "auto":
+        return device
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def engine_options(backend: str = None, device: str = None, batch_size: int = None, threads: int = None) -> dict:
+    """
+    Embedding engine options, read from AIOPS_EMBEDDING_BACKEND (torch),
+    AIOPS_EMBEDDING_DEVICE (auto), AIOPS_EMBEDDING_BATCH (32) and
+    AIOPS_EMBEDDING_THREADS (0, the library default) when not given.
+    """
+    options = {
+        "backend": backend or os.getenv("AIOPS_EMBEDDING_BACKEND", "torch"),
+        "device": device or os.getenv("AIOPS_EMBEDDING_DEVICE", "auto"),
+        "batch_size": batch_size or int(os.getenv("AIOPS_EMBEDDING_BATCH", "32")),
+        "threads": threads if threads is not None else int(os.getenv("AIOPS_EMBEDDING_THREADS", "0")),
+    }
+    if options["backend"] not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {options['backend']}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return options
+
+def quantization_config() -> str:
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    A sentence-transformers model (gte-small by default) with explicit batching:
+    texts are sorted by length so each batch is padded to similar lengths, encoded
+    `batch_size` at a time and returned in input order. Vectors match LangChain's
+    HuggingFaceEmbeddings, which the index was built with.
+
+    Backends: "torch", "onnx" (ONNX Runtime) and "onnx-int8", a dynamically
+    quantised ONNX model for CPUs, exported once into `model_dir`. int8 vectors
+    differ slightly, so they are cached under their own `cache_name`.
+    """
+
+    def __init__(self, model_name: str = "thenlper/gte-small", backend: str = "torch", device: str = "auto",
+                 batch_size: int = 32, threads: int = 0, model_dir: Path = EMBEDDING_MODEL_DIR):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.threads = threads
+        self.model_dir = Path(model_dir)
+        # ONNX Runtime runs on the CPU here, except for the fp32 model on CUDA
+        self.device = resolve_device(device) if backend == "torch" else ("cuda" if device == "cuda" else "cpu")
+        self.model = self.load()
+
+    @property
+    def cache_name(self) -> str:
+        return f"{self.model_name}:int8" if self.backend == "onnx-int8" else self.model_name
+
+    def onnx_kwargs(self) -> dict:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        provider = "CUDAExecutionProvider" if self.device == "cuda" else "CPUExecutionProvider"
+        return {"session_options": options, "provider": provider}
+
+    def load(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            if self.threads:
+                import torch
+                torch.set_num_threads(self.threads)
+            return SentenceTransformer(self.model_name, device=self.device)
+        if self.backend == "onnx":
+            return SentenceTransformer(self.model_name, device=self.device, backend="onnx", model_kwargs=self.onnx_kwargs())
+
+        config = quantization_config()
+        path = self.model_dir / self.model_name.replace("/", "--")
+        file_name = f"onnx/model_qint8_{config}.onnx"
+        if not (path / file_name).exists():
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            print(f"⚙️ Exporting {self.model_name} to int8 ONNX in {path}...")
+            model = SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+            model.save(str(path))
+            export_dynamic_quantized_onnx_model(model, config, str(path))
+        return SentenceTransformer(
+            str(path), device="cpu", backend="onnx", model_kwargs={"file_name": file_name, **self.onnx_kwargs()}
+        )
+
+    def encode(self, texts: list) -> np.ndarray:
+        # HuggingFaceEmbeddings replaces newlines before encoding; keep vectors identical
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        vectors = None
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.model.encode(
+                [texts[i] for i in batch], batch_size=len(batch), convert_to_numpy=True, show_progress_bar=False
+            )
+            if vectors is None:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=encoded.dtype)
+            vectors[batch] = encoded
+        return vectors if vectors is not None else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: list) -> list:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.encode([text])[0].tolist()
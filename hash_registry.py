@@ -1,21 +1,173 @@
+import os
 import json
+import sqlite3
+import hashlib
+from datetime import datetime, timezone
 from pathlib import Path
 
-HASH_REGISTRY_FILE = Path("processed_hashes.json")
+HASH_REGISTRY_DB = Path("processed_hashes.sqlite")
+HASH_REGISTRY_FILE = Path("processed_hashes.json")  # Legacy JSON registry, imported on first use
 
-def load_processed_hashes():
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path        TEXT PRIMARY KEY,
+    hash        TEXT NOT NULL,
+    size        INTEGER,
+    mtime       REAL,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    vector_ids  TEXT NOT NULL DEFAULT '[]',
+    updated     TEXT
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+CREATE TABLE IF NOT EXISTS legacy_hashes (
+    hash TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    vector_id TEXT PRIMARY KEY,
+    text_hash TEXT NOT NULL UNIQUE,
+    refs      INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def path_hash(path: str) -> str:
+    return hashlib.sha256(path.encode('utf-8')).hexdigest()
+
+def row_to_record(row) -> dict:
+    return {
+        "path": row["path"],
+        "hash": row["hash"],
+        "size": row["size"],
+        "mtime": row["mtime"],
+        "ids": json.loads(row["vector_ids"]),
+    }
+
+def import_json_registry(conn):
+    """Import a processed_hashes.json written by earlier builds, then move it aside."""
+    with open(HASH_REGISTRY_FILE, "r") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        # Oldest format: a list of SHA256 hashes of file paths, vector IDs unknown
+        files, legacy = {}, data
+    else:
+        files, legacy = data.get("files", {}), data.get("legacy", [])
+
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO legacy_hashes (hash) VALUES (?)", [(h,) for h in legacy])
+        save_records(conn, list(files.values()))
+    os.replace(HASH_REGISTRY_FILE, HASH_REGISTRY_FILE.with_suffix(".json.imported"))
+    print(f"📥 Imported {len(files) + len(legacy)} entries from {HASH_REGISTRY_FILE}")
+
+def load_processed_hashes(db_path=None):
+    """
+    Open the registry of ingested files. Each record holds the content hash, size
+    and mtime seen at ingestion time and the docstore IDs of the file's chunks.
+    """
+    conn = sqlite3.connect(db_path or HASH_REGISTRY_DB)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
     if HASH_REGISTRY_FILE.exists():
-        with open(HASH_REGISTRY_FILE, "r") as f:
-            return set(json.load(f))
-    return set()
+        import_json_registry(conn)
+    return conn
+
+def save_records(conn, records: list):
+    now = datetime.now(timezone.utc).isoformat()
+    conn.executemany(
+        "INSERT OR REPLACE INTO files (path, hash, size, mtime, chunk_count, vector_ids, updated) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (r["path"], r["hash"], r["size"], r["mtime"], len(r["ids"]), json.dumps(r["ids"]), now)
+            for r in records
+        ]
+    )
+    conn.executemany("DELETE FROM legacy_hashes WHERE hash = ?", [(path_hash(r["path"]),) for r in records])
+
+def get_record(path: str, registry):
+    row = registry.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+    return row_to_record(row) if row else None
+
+def find_by_hash(file_hash: str, registry) -> list:
+    return [row_to_record(row) for row in registry.execute("SELECT * FROM files WHERE hash = ?", (file_hash,))]
+
+def iter_records(registry):
+    for row in registry.execute("SELECT * FROM files"):
+        yield row_to_record(row)
+
+def is_legacy(path: str, registry) -> bool:
+    return registry.execute("SELECT 1 FROM legacy_hashes WHERE hash = ?", (path_hash(path),)).fetchone() is not None
+
+def is_already_processed(file_hash: str, registry) -> bool:
+    return registry.execute("SELECT 1 FROM files WHERE hash = ? LIMIT 1", (file_hash,)).fetchone() is not None
+
+def find_chunks(text_hashes: list, registry) -> dict:
+    """Vector IDs of already indexed chunks with these text hashes."""
+    found = {}
+    for start in range(0, len(text_hashes), 500):
+        batch = text_hashes[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        found.update(registry.execute(
+            f"SELECT text_hash, vector_id FROM chunks WHERE text_hash IN ({placeholders})", batch
+        ))
+    return found
+
+def get_chunk_refs(ids: list, registry) -> dict:
+    """Number of files sharing each chunk. IDs indexed before deduplication have no entry."""
+    refs = {}
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        refs.update(registry.execute(f"SELECT vector_id, refs FROM chunks WHERE vector_id IN ({placeholders})", batch))
+    return refs
+
+def save_chunks(conn, new_chunks: dict, refs_delta: dict, dropped: set):
+    # Dropped rows go first: a text dropped and re-added in the same commit has a new
+    # vector ID, whose row would otherwise be ignored on the UNIQUE text_hash
+    conn.executemany("DELETE FROM chunks WHERE vector_id = ?", [(vector_id,) for vector_id in dropped])
+    conn.executemany(
+        "INSERT OR IGNORE INTO chunks (vector_id, text_hash, refs) VALUES (?, ?, 0)",
+        [(vector_id, text_hash) for text_hash, vector_id in new_chunks.items()]
+    )
+    conn.executemany(
+        "UPDATE chunks SET refs = refs + ? WHERE vector_id = ?",
+        [(delta, vector_id) for vector_id, delta in refs_delta.items() if delta]
+    )
+    conn.execute("DELETE FROM chunks WHERE refs <= 0")
+
+def get_generation(registry) -> int:
+    """Number of the last index commit written to the registry."""
+    row = registry.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return row[0] if row else 0
 
-def save_processed_hashes(hashes: set):
-    with open(HASH_REGISTRY_FILE, "w") as f:
-        json.dump(list(hashes), f, indent=2)
+def mark_as_processed(record: dict, registry):
+    mark_many_as_processed([record], registry)
 
-def is_already_processed(file_hash: str, hashes: set) -> bool:
-    return file_hash in hashes
+def mark_many_as_processed(records: list, registry, removed_paths: list = (), chunks: dict = None, generation: int = None):
+    """
+    `chunks` optionally carries the chunk bookkeeping of the same commit:
+    {"new": {text_hash: vector_id}, "refs_delta": {vector_id: delta}, "dropped": {vector_id}}.
+    `generation` numbers the index commit these changes belong to.
+    """
+    # One transaction per commit: either every record of the batch is stored or none
+    with registry:
+        registry.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed_paths])
+        registry.executemany("DELETE FROM legacy_hashes WHERE hash = ?", [(path_hash(path),) for path in removed_paths])
+        save_records(registry, records)
+        if chunks:
+            save_chunks(registry, chunks["new"], chunks["refs_delta"], chunks["dropped"])
+        if generation is not None:
+            registry.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (generation,))
 
-def mark_as_processed(file_hash: str, hashes: set):
-    hashes.add(file_hash)
-    save_processed_hashes(hashes)
+def apply_commit(commit: dict, registry) -> bool:
+    """
+    Write the registry changes of an index commit, {"generation", "records", "removed",
+    "chunks"}, unless the registry already holds that generation. Returns whether they
+    were written.
+    """
+    if commit["generation"] <= get_generation(registry):
+        return False
+    mark_many_as_processed(commit["records"], registry, commit["removed"], commit["chunks"], commit["generation"])
+    return True
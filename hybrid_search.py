@@ -0,0 +1,126 @@
+import json
+import time
+from typing import Any, List
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, PrivateAttr
+from ann_index import search_parameters
+from micro_batch import MicroBatcher
+from tracing import span, record_span, record_stat
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list:
+    """Merge several ranked lists of positions, scoring each by sum(1 / (k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Vector search and BM25 keyword search over the memory-mapped index, fused with
+    reciprocal rank fusion and reranked by a cross-encoder down to `top_n` chunks.
+    Without a reranker the `top_n` best fused chunks are returned.
+
+    With `max_batch` > 1, vector searches from concurrent requests are micro-batched:
+    the queries collected within `max_wait` seconds are embedded in one call and
+    searched with one FAISS call per filter, then handed back to their callers.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    embeddings: Any
+    index: Any
+    store: Any
+    reranker: Any = None
+    exact_index: Any = None
+    exact_limit: int = 50_000
+    vector_k: int = 20
+    keyword_k: int = 20
+    top_n: int = 5
+    max_batch: int = 1
+    max_wait: float = 0.005
+
+    _batcher: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.max_batch > 1:
+            self._batcher = MicroBatcher(self.search_batch, self.max_batch, self.max_wait, name="vector-search")
+
+    def search_target(self, search_filter=None):
+        """(index, search parameters) for a filter; index is None when no chunk matches it."""
+        if not search_filter:
+            return self.index, None
+        positions = self.store.filter_positions(search_filter)
+        if not len(positions):
+            return None, None
+        index = self.index
+        if self.exact_index is not None and len(positions) <= self.exact_limit:
+            index = self.exact_index
+        return index, search_parameters(index, positions)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        vectors = embed_queries(queries) if embed_queries else [self.embeddings.embed_query(query) for query in queries]
+        return np.array(vectors, dtype=np.float32)
+
+    def search_batch(self, requests: list) -> list:
+        """
+        Vector search for (query, filter) pairs: one embedding call, one FAISS search per
+        distinct filter. Returns (positions, timings) per request, where timings holds the
+        seconds spent embedding the batch and searching the request's group.
+        """
+        start = time.perf_counter()
+        vectors = self.embed_queries([query for query, _ in requests])
+        embedding = time.perf_counter() - start
+        groups = {}
+        for row, (_, search_filter) in enumerate(requests):
+            key = json.dumps(search_filter, sort_keys=True) if search_filter else None
+            groups.setdefault(key, []).append(row)
+
+        results = [None] * len(requests)
+        for rows in groups.values():
+            start = time.perf_counter()
+            index, params = self.search_target(requests[rows[0]][1])
+            found = index.search(vectors[rows], self.vector_k, params=params)[1] if index is not None else [[]] * len(rows)
+            timings = {"embedding": embedding, "search": time.perf_counter() - start, "batch_size": len(requests)}
+            for row, positions in zip(rows, found):
+                results[row] = ([int(position) for position in positions if position != -1], timings)
+        return results
+
+    def vector_search(self, query: str, search_filter=None) -> list:
+        request = (query, search_filter)
+        positions, timings = self._batcher(request) if self._batcher is not None else self.search_batch([request])[0]
+        record_span("embedding", timings["embedding"])
+        record_span("search", timings["search"])
+        record_stat("search_batch_size", timings["batch_size"])
+        return positions
+
+    def batch_stats(self) -> dict:
+        return self._batcher.stats() if self._batcher is not None else {"enabled": False}
+
+    def candidates(self, query: str, search_filter=None) -> List[Document]:
+        """Fused vector and keyword results, best first, before reranking."""
+        vector_positions = self.vector_search(query, search_filter)
+        with span("keyword_search"):
+            keyword_positions = self.store.keyword_search(query, self.keyword_k, search_filter)
+        positions = reciprocal_rank_fusion([vector_positions, keyword_positions])
+        documents = self.store.get_documents(positions)
+        record_stat("candidates", {"vector": len(vector_positions), "keyword": len(keyword_positions), "fused": len(positions)})
+        return [documents[position] for position in positions if position in documents]
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        if self.reranker is None or len(docs) <= 1:
+            return docs[:self.top_n]
+        with span("rerank"):
+            scores = self.reranker.predict([(query, doc.page_content) for doc in docs])
+        order = np.argsort(-np.asarray(scores), kind="stable")
+        return [docs[i] for i in order[:self.top_n]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter=None) -> List[Document]:
+        return self.rerank(query, self.candidates(query, filter))
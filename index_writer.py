@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import uuid
+import shutil
+from collections import Counter
+from langchain_community.vectorstores import FAISS
+from hash_registry import get_record, find_by_hash, find_chunks, get_chunk_refs, get_generation, apply_commit
+from utilities import get_text_hash
+from ann_index import save_ann_index, ANN_META_FILE
+from mapped_store import export_docstore, SqliteStore, DOCSTORE_FILE, DOCSTORE_VERSION
+from build_report import BuildReport
+
+# Registry changes of the commit an index was saved by, replayed if the registry missed them
+PENDING_FILE = "pending.json"
+
+def fsync_dir(path):
+    for name in os.listdir(path):
+        with open(os.path.join(path, name), "rb") as f:
+            os.fsync(f.fileno())
+
+def save_index(vectorstore, index_path, ann_options=None, mapped=False, pending=None):
+    """
+    Write the index to a sibling directory and swap it in, so a crash mid-save
+    never leaves a half-written index.faiss / index.pkl pair behind. With
+    `ann_options` an approximate search index is built next to the flat one, and
+    `mapped` adds the docstore.sqlite the server reads chunks from lazily.
+    `pending` is the registry commit saved in the same swap (see replay_pending).
+    """
+    tmp_path = f"{index_path}.tmp"
+    old_path = f"{index_path}.old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    vectorstore.save_local(tmp_path)
+    if pending is not None:
+        with open(os.path.join(tmp_path, PENDING_FILE), "w") as f:
+            json.dump(pending, f)
+    if ann_options and ann_options["index_type"] != "flat":
+        print(f"🧭 Building {ann_options['index_type']} search index...")
+        save_ann_index(vectorstore.index, tmp_path, **ann_options)
+    if mapped:
+        export_docstore(vectorstore, tmp_path)
+    fsync_dir(tmp_path)
+
+    if os.path.exists(index_path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(index_path, old_path)
+    os.replace(tmp_path, index_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def recover_index(index_path):
+    """Finish or roll back a swap interrupted by a crash in save_index."""
+    tmp_path = f"{index_path}.tmp"
+    old_path = f"{index_path}.old"
+    if os.path.exists(index_path):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.rmtree(old_path, ignore_errors=True)
+    elif os.path.exists(old_path):
+        # The old index is only moved aside once the new one is fully written
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, index_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.replace(old_path, index_path)
+
+def replay_pending(index_path, registry):
+    """
+    Write the registry changes of the last index commit if a crash after the index
+    swap kept them from the registry, then drop the pending file.
+    """
+    pending_path = os.path.join(index_path, PENDING_FILE)
+    if not os.path.exists(pending_path):
+        return
+    with open(pending_path) as f:
+        pending = json.load(f)
+    if apply_commit(pending, registry):
+        print(f"♻️ Replayed {len(pending['records'])} registry records of an interrupted commit")
+    os.remove(pending_path)
+
+
+def search_files_current(index_path, ann_options):
+    docstore_path = os.path.join(index_path, DOCSTORE_FILE)
+    if not os.path.exists(docstore_path) or SqliteStore(docstore_path).version() < DOCSTORE_VERSION:
+        return False
+    meta_path = os.path.join(index_path, ANN_META_FILE)
+    if ann_options["index_type"] == "flat":
+        return not os.path.exists(meta_path)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        return json.load(f)["type"] == ann_options["index_type"]
+
+
+class IndexWriter:
+    """
+    Applies file additions, removals and renames to the in-memory vectorstore and
+    commits them to disk every `commit_every` changed chunks or `commit_interval`
+    seconds. Registry records are only written after the commit that contains their
+    chunks, so an interrupted build re-processes them without duplicating chunks.
+    Each commit also saves its registry changes inside the index, and they are
+    replayed when a crash came between the two writes.
+
+    Chunks with identical text are stored once and shared between files; a shared
+    vector is only deleted when the last file referencing it goes away.
+    """
+
+    def __init__(self, vectorstore, embeddings, index_path, registry,
+                 commit_every=5000, commit_interval=300, ann_options=None, report=None):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.index_path = index_path
+        self.registry = registry
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.ann_options = ann_options
+        # Embed and save timings are recorded here
+        self.report = report if report is not None else BuildReport()
+        self.pending_records = {}
+        self.pending_removals = set()
+        self.in_progress = {}
+        self.partial_ids = {}
+        self.pending_changes = 0
+        self.index_dirty = False
+        self.source_ids = None
+        self.new_chunks = {}
+        self.refs_delta = Counter()
+        self.dropped_chunks = set()
+        self.last_commit = time.monotonic()
+        replay_pending(index_path, registry)
+
+    def get_record(self, path):
+        if path in self.pending_records:
+            return self.pending_records[path]
+        if path in self.pending_removals:
+            return None
+        return get_record(path, self.registry)
+
+    def find_by_hash(self, file_hash):
+        records = {
+            record["path"]: record for record in find_by_hash(file_hash, self.registry)
+            if record["path"] not in self.pending_removals
+        }
+        for record in list(self.pending_records.values()) + list(self.in_progress.values()):
+            if record["hash"] == file_hash:
+                records[record["path"]] = record
+        return list(records.values())
+
+    def claim(self, record):
+        """Mark a record as being extracted so duplicates found meanwhile are not ingested twice."""
+        self.in_progress[record["path"]] = record
+
+    def release(self, record):
+        self.in_progress.pop(record["path"], None)
+
+    def ids_for_source(self, filename):
+        """Docstore IDs of chunks whose `source` metadata is `filename` (each name is handed out once)."""
+        if self.vectorstore is None:
+            return []
+        if self.source_ids is None:
+            self.source_ids = {}
+            for doc_id in self.vectorstore.index_to_docstore_id.values():
+                doc = self.vectorstore.docstore.search(doc_id)
+                self.source_ids.setdefault(doc.metadata.get("source"), []).append(doc_id)
+        return self.source_ids.pop(filename, [])
+
+    def find_chunks(self, text_hashes):
+        known = {
+            text_hash: vector_id for text_hash, vector_id in find_chunks(text_hashes, self.registry).items()
+            if vector_id not in self.dropped_chunks
+        }
+        known.update((h, self.new_chunks[h]) for h in text_hashes if h in self.new_chunks)
+        return known
+
+    def add(self, files, partial=False):
+        """
+        Embed and add the chunks of several files; `files` is a list of (record, documents).
+        With `partial` more chunks of the same files follow in later calls: their records
+        are only completed by the first call without it, and no commit happens meanwhile.
+        """
+        hashes = [[get_text_hash(doc.page_content) for doc in file_documents] for _, file_documents in files]
+        known = self.find_chunks(list({h for file_hashes in hashes for h in file_hashes}))
+
+        documents, ids = [], []
+        for (record, file_documents), file_hashes in zip(files, hashes):
+            record_ids = self.partial_ids.pop(record["path"], [])
+            seen = set(record_ids)
+            for doc, text_hash in zip(file_documents, file_hashes):
+                vector_id = known.get(text_hash)
+                if vector_id is None:
+                    # First occurrence of this text: embed it
+                    vector_id = str(uuid.uuid4())
+                    known[text_hash] = self.new_chunks[text_hash] = vector_id
+                    documents.append(doc)
+                    ids.append(vector_id)
+                if vector_id not in seen:
+                    seen.add(vector_id)
+                    record_ids.append(vector_id)
+                    self.refs_delta[vector_id] += 1
+            if partial:
+                self.partial_ids[record["path"]] = record_ids
+                continue
+            record["ids"] = record_ids
+            self.release(record)
+            self.update(record)
+
+        if documents:
+            with self.report.timings.timed("embed", len(documents)):
+                if self.vectorstore is None:
+                    print(f"Creating vector database...")
+                    self.vectorstore = FAISS.from_documents(documents, self.embeddings, ids=ids)
+                else:
+                    self.vectorstore.add_documents(documents, ids=ids)
+            self.pending_changes += len(documents)
+            self.index_dirty = True
+        if not self.partial_ids:
+            self.maybe_commit()
+
+    def discard_partial(self, record):
+        """Drop the chunks added so far for a file whose extraction failed midway."""
+        self.remove(self.partial_ids.pop(record["path"], []))
+        self.release(record)
+
+    def update(self, record):
+        self.pending_removals.discard(record["path"])
+        self.pending_records[record["path"]] = record
+
+    def rename(self, old_record, record, filename):
+        """Move the chunks of `old_record` to a new path and update their `source` metadata."""
+        record["ids"] = old_record["ids"]
+        for doc_id in record["ids"]:
+            doc = self.vectorstore.docstore.search(doc_id)
+            if not isinstance(doc, str):
+                doc.metadata["source"] = filename
+        self.index_dirty = bool(record["ids"]) or self.index_dirty
+        self.forget(old_record["path"])
+        self.update(record)
+
+    def share(self, record, ids) -> bool:
+        """
+        Record a duplicate file as one more reference to the chunks `ids` of the file it
+        copies, so either can change or go away without taking the other's chunks.
+        Returns False when a chunk cannot be refcounted, and the copy must be ingested.
+        """
+        if self.vectorstore is None:
+            return not ids
+        docs = {doc_id: self.vectorstore.docstore.search(doc_id) for doc_id in ids}
+        ids = [doc_id for doc_id in ids if not isinstance(docs[doc_id], str)]
+        refs = get_chunk_refs(ids, self.registry)
+        new_ids = set(self.new_chunks.values())
+        unregistered = {
+            get_text_hash(docs[doc_id].page_content): doc_id for doc_id in ids
+            if doc_id not in refs and doc_id not in new_ids
+        }
+        # Chunks indexed before deduplication have one owner and no registry row yet
+        if any(vector_id != unregistered[text_hash] for text_hash, vector_id in self.find_chunks(list(unregistered)).items()):
+            return False
+        for text_hash, doc_id in unregistered.items():
+            self.new_chunks[text_hash] = doc_id
+            self.refs_delta[doc_id] += 1
+        for doc_id in ids:
+            self.refs_delta[doc_id] += 1
+        record["ids"] = ids
+        self.update(record)
+        return True
+
+    def remove(self, ids):
+        """Release one file's references to `ids`, deleting vectors no other file uses."""
+        if self.vectorstore is None:
+            return
+        # Skip IDs already gone, e.g. removed by a run that failed before re-adding the file
+        ids = [doc_id for doc_id in ids if not isinstance(self.vectorstore.docstore.search(doc_id), str)]
+        refs = get_chunk_refs(ids, self.registry)
+        new_ids = set(self.new_chunks.values())
+
+        unused = []
+        for doc_id in ids:
+            self.refs_delta[doc_id] -= 1
+            # Chunks indexed before deduplication belong to exactly one file
+            base = refs.get(doc_id, 0 if doc_id in new_ids else 1)
+            if base + self.refs_delta[doc_id] <= 0:
+                unused.append(doc_id)
+
+        if unused:
+            self.vectorstore.delete(unused)
+            self.dropped_chunks.update(unused)
+            self.new_chunks = {h: i for h, i in self.new_chunks.items() if i not in self.dropped_chunks}
+            self.pending_changes += len(unused)
+            self.index_dirty = True
+
+    def forget(self, path):
+        self.pending_records.pop(path, None)
+        self.pending_removals.add(path)
+
+    def maybe_commit(self):
+        if self.pending_changes >= self.commit_every:
+            self.commit()
+        elif time.monotonic() - self.last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self, final=False):
+        """
+        Intermediate commits only save the flat index. The approximate search index
+        and docstore.sqlite are rebuilt on the final commit, also when only the
+        requested type changed.
+        """
+        if final:
+            # A file interrupted mid-stream is not recorded, so drop what it added
+            for path in list(self.partial_ids):
+                self.remove(self.partial_ids.pop(path))
+        if final and self.ann_options and self.vectorstore is not None:
+            if not search_files_current(self.index_path, self.ann_options):
+                self.index_dirty = True
+        pending = {
+            "generation": get_generation(self.registry) + 1,
+            "records": list(self.pending_records.values()),
+            "removed": sorted(self.pending_removals),
+            "chunks": {"new": self.new_chunks, "refs_delta": self.refs_delta, "dropped": sorted(self.dropped_chunks)},
+        }
+        if self.index_dirty:
+            print(f"💾 Saving {self.pending_changes} changed chunks to {self.index_path}...")
+            with self.report.timings.timed("save", self.pending_changes):
+                save_index(self.vectorstore, self.index_path, self.ann_options if final else None, mapped=final, pending=pending)
+        if self.index_dirty or self.pending_records or self.pending_removals or self.refs_delta:
+            apply_commit(pending, self.registry)
+            pending_path = os.path.join(self.index_path, PENDING_FILE)
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
+        self.new_chunks = {}
+        self.refs_delta = Counter()
+        self.dropped_chunks = set()
+        self.pending_records = {}
+        self.pending_removals = set()
+        self.pending_changes = 0
+        self.index_dirty = False
+        self.last_commit = time.monotonic()
+        return self.vectorstore
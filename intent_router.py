@@ -0,0 +1,89 @@
+import asyncio
+import numpy as np
+
+# Labelled examples for the local router: (question, domain, sub_intent)
+INTENT_EXAMPLES = [
+    ("Configure VLAN 10 on all switches.", "live_network", "config_vlan"),
+    ("Create vlan 20 and add port 1/1/5 to it on switch core-1.", "live_network", "config_vlan"),
+    ("Enable OSPF on the distribution switches now.", "live_network", "config"),
+    ("Shut down port 1/1/12 on the access switch.", "live_network", "config"),
+    ("Show me the current CPU usage of switch 10.1.1.1.", "live_network", "monitoring"),
+    ("Which ports are down on my OmniSwitch right now?", "live_network", "monitoring"),
+    ("Why is the uplink on switch B flapping?", "live_network", "troubleshooting"),
+    ("Ping 192.168.1.1 from the core switch.", "live_network", "troubleshooting"),
+    ("Reboot the switch in the server room tonight.", "live_network", "maintenance"),
+    ("What is the maximum number of OSPF routes supported by OmniSwitch 9900?", "external_knowledge", "specification"),
+    ("How many VLANs can an OmniSwitch 6900 support?", "external_knowledge", "specification"),
+    ("What is the MAC address table size of the OS6860?", "external_knowledge", "specification"),
+    ("What are the power supply options for OmniSwitch 6560?", "external_knowledge", "specification"),
+    ("How to configure OSPF?", "external_knowledge", "configuration_guide"),
+    ("How do I configure link aggregation on AOS 8?", "external_knowledge", "configuration_guide"),
+    ("Explain the steps to set up 802.1X authentication on an OmniSwitch.", "external_knowledge", "configuration_guide"),
+    ("What is the CLI command to enable BFD for OSPF?", "external_knowledge", "configuration_guide"),
+    ("What is the difference between ERP and spanning tree?", "external_knowledge", "concept"),
+    ("What does Virtual Chassis do?", "external_knowledge", "concept"),
+    ("Which AOS release added support for SPB?", "external_knowledge", "release_notes"),
+    ("Is the OmniAccess Stellar AP1301 Wi-Fi 6 certified?", "external_knowledge", "specification"),
+    ("Help me convert Cisco configuration to Alcatel configuration", "external_knowledge", "convert_configuration"),
+    ("Convert the following Cisco IOS configuration to Alcatel AOS configuration.", "external_knowledge", "convert_configuration"),
+    ("Translate this Cisco running-config into OmniSwitch commands: interface vlan 1 ip address 10.1.1.1 255.255.255.0", "external_knowledge", "convert_configuration"),
+    ("What is the AOS equivalent of this Cisco config? vlan 2 name HR", "external_knowledge", "convert_configuration"),
+    ("Audit all switch configurations to ensure they comply with security policies.", "hybrid_intelligence", "audit"),
+    ("Check whether every switch has SSH enabled and telnet disabled.", "hybrid_intelligence", "compliance"),
+    ("Analyse last week's traffic and suggest QoS optimizations.", "hybrid_intelligence", "optimization"),
+    ("Which switches are running an AOS version with known vulnerabilities?", "hybrid_intelligence", "audit"),
+    ("Give me a capacity report of port utilisation across the campus.", "hybrid_intelligence", "analytics"),
+    ("Schedule firmware upgrades and backup all configurations across all data centers.", "automation", "firmware"),
+    ("Back up the configuration of every switch every night.", "automation", "backup"),
+    ("Upgrade all OS6860 switches to AOS 8.9 R2 during the maintenance window.", "automation", "firmware"),
+    ("Onboard the 20 new access switches and apply the standard template.", "automation", "provisioning"),
+]
+
+
+class IntentRouter:
+    """
+    Classifies questions locally by nearest neighbours over labelled examples in the
+    gte-small embedding space. A prediction is only returned when the best match is
+    similar enough and the top neighbours agree; otherwise the caller falls back to
+    the LLM intent chain.
+    """
+
+    def __init__(self, embeddings, examples=INTENT_EXAMPLES, threshold: float = 0.88, k: int = 3):
+        self.embeddings = embeddings
+        self.examples = examples
+        self.threshold = threshold
+        self.k = k
+        self.example_vectors = None
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.array(vectors, dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def guess(self, question: str):
+        """Returns (best matching intent, confidence), however low the confidence."""
+        if self.example_vectors is None:
+            self.example_vectors = self.normalize(self.embeddings.embed_documents([q for q, _, _ in self.examples]))
+
+        # Long inputs (pasted configurations) are classified on their opening lines
+        scores = self.example_vectors @ self.normalize(self.embeddings.embed_query(question[:500]))
+        top = np.argsort(-scores)[:self.k]
+
+        votes = {}
+        for i in top:
+            _, domain, sub_intent = self.examples[i]
+            votes[(domain, sub_intent)] = votes.get((domain, sub_intent), 0.0) + float(scores[i])
+        (domain, sub_intent), weight = max(votes.items(), key=lambda item: item[1])
+
+        confidence = float(scores[top[0]]) * weight / float(scores[top].sum())
+        return {"domain": domain, "sub_intent": sub_intent}, confidence
+
+    def route(self, question: str):
+        """Returns (intent or None, confidence)."""
+        intent, confidence = self.guess(question)
+        if confidence < self.threshold:
+            return None, confidence
+        return intent, confidence
+
+    async def aguess(self, question: str):
+        return await asyncio.to_thread(self.guess, question)
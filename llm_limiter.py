@@ -0,0 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """Raised when too many requests are already waiting for an LLM slot."""
+
+
+class LLMLimiter:
+    """
+    Caps concurrent LLM calls with a semaphore and rejects new work once `max_queue`
+    callers are already waiting, so the server sheds load instead of piling up requests.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.active = 0
+
+    def overloaded(self) -> bool:
+        return self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.overloaded():
+            raise Overloaded(f"{self.waiting} requests already waiting for the LLM")
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
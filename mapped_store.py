@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from ann_index import load_ann_index
+from metadata_filter import parse_source, normalize_filter, FILTER_FIELDS
+
+DOCSTORE_FILE = "docstore.sqlite"
+KEYWORD_TABLE = "chunks_fts"
+# Bumped when export_docstore adds tables, so build_kb.py rewrites older docstores
+DOCSTORE_VERSION = 2
+
+
+class ReadOnlyDocstoreError(PermissionError):
+    """Raised on attempts to change the memory-mapped index, which only build_kb.py writes."""
+
+    def __init__(self):
+        super().__init__("The memory-mapped index is read-only, rebuild it with build_kb.py")
+
+
+def keyword_query(text: str):
+    """FTS5 query matching any of the words in `text`, or None when it has none."""
+    tokens = dict.fromkeys(re.findall(r"\w[\w-]*", text.lower()))
+    if not tokens:
+        return None
+    return " OR ".join(f'"{token}"' for token in tokens)
+
+
+def export_docstore(vectorstore, index_path: str, batch_size: int = 10000):
+    """
+    Write chunk text and metadata to docstore.sqlite, keyed by FAISS position and
+    docstore ID, so the server can read them lazily instead of unpickling index.pkl.
+    An FTS5 index over the chunk text serves BM25 keyword search, and chunk_filters
+    holds the lower-cased metadata fields search filters select on.
+    """
+    db_path = os.path.join(index_path, DOCSTORE_FILE)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("""
+            CREATE TABLE chunks (
+                position INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        conn.execute(f"""
+            CREATE TABLE chunk_filters (
+                position INTEGER PRIMARY KEY,
+                {", ".join(f"{field} TEXT" for field in FILTER_FIELDS)}
+            )
+        """)
+        rows, filter_rows = [], []
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            rows.append((position, doc_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+            fields = dict(doc.metadata, **parse_source(doc.metadata.get("source")))
+            filter_rows.append((position, *(str(fields.get(field, "")).lower() for field in FILTER_FIELDS)))
+            if len(rows) >= batch_size:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+                conn.executemany(f"INSERT INTO chunk_filters VALUES ({', '.join('?' * (len(FILTER_FIELDS) + 1))})", filter_rows)
+                rows, filter_rows = [], []
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.executemany(f"INSERT INTO chunk_filters VALUES ({', '.join('?' * (len(FILTER_FIELDS) + 1))})", filter_rows)
+        for field in FILTER_FIELDS:
+            conn.execute(f"CREATE INDEX idx_chunk_filters_{field} ON chunk_filters ({field})")
+        # Hyphens and underscores are part of a token so CLI keywords like bfd-state match whole
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE {KEYWORD_TABLE} USING fts5(
+                page_content, content='chunks', content_rowid='position',
+                tokenize="unicode61 tokenchars '-_'"
+            )
+        """)
+        conn.execute(f"INSERT INTO {KEYWORD_TABLE}({KEYWORD_TABLE}) VALUES ('rebuild')")
+        conn.execute(f"PRAGMA user_version = {DOCSTORE_VERSION}")
+    conn.close()
+
+
+class SqliteStore:
+    """Read-only access to docstore.sqlite with one connection per thread."""
+
+    def __init__(self, db_path: str, filter_cache_size: int = 256):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.filter_cache = OrderedDict()
+        self.filter_cache_size = filter_cache_size
+        self.filter_lock = threading.Lock()
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self.local.conn = conn
+        return conn
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def version(self) -> int:
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def has_keyword_index(self) -> bool:
+        row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (KEYWORD_TABLE,)).fetchone()
+        return row is not None
+
+    def has_filters(self) -> bool:
+        return self.version() >= 2
+
+    @staticmethod
+    def filter_clause(search_filter: dict, column_prefix: str = ""):
+        """SQL condition and parameters for a normalized filter (AND across fields, OR within one)."""
+        conditions, params = [], []
+        for field, values in search_filter.items():
+            conditions.append(f"{column_prefix}{field} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        return " AND ".join(conditions), params
+
+    def filter_positions(self, search_filter) -> np.ndarray:
+        """
+        Sorted FAISS positions of the chunks matching `search_filter` (see
+        normalize_filter). The index is read-only, so results are cached per filter.
+        """
+        search_filter = normalize_filter(search_filter)
+        key = tuple(sorted((field, tuple(values)) for field, values in search_filter.items()))
+        with self.filter_lock:
+            if key in self.filter_cache:
+                self.filter_cache.move_to_end(key)
+                return self.filter_cache[key]
+        condition, params = self.filter_clause(search_filter)
+        rows = self.conn.execute(f"SELECT position FROM chunk_filters WHERE {condition} ORDER BY position", params)
+        positions = np.fromiter((row[0] for row in rows), dtype=np.int64)
+        with self.filter_lock:
+            self.filter_cache[key] = positions
+            while len(self.filter_cache) > self.filter_cache_size:
+                self.filter_cache.popitem(last=False)
+        return positions
+
+    def keyword_search(self, text: str, k: int = 20, search_filter=None) -> list:
+        """FAISS positions of the `k` best BM25 matches for `text`, optionally filtered."""
+        query = keyword_query(text)
+        if query is None:
+            return []
+        search_filter = normalize_filter(search_filter)
+        if not search_filter:
+            rows = self.conn.execute(
+                f"SELECT rowid FROM {KEYWORD_TABLE} WHERE {KEYWORD_TABLE} MATCH ? ORDER BY rank LIMIT ?",
+                (query, k)
+            ).fetchall()
+            return [row[0] for row in rows]
+        condition, params = self.filter_clause(search_filter, "m.")
+        rows = self.conn.execute(
+            f"SELECT {KEYWORD_TABLE}.rowid FROM {KEYWORD_TABLE} JOIN chunk_filters m ON m.position = {KEYWORD_TABLE}.rowid "
+            f"WHERE {KEYWORD_TABLE} MATCH ? AND {condition} ORDER BY {KEYWORD_TABLE}.rank LIMIT ?",
+            (query, *params, k)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_documents(self, positions) -> dict:
+        """Position -> Document for the given FAISS positions."""
+        positions = [int(position) for position in positions]
+        documents = {}
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(positions), 500):
+            batch = positions[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT position, page_content, metadata FROM chunks WHERE position IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for position, page_content, metadata in rows:
+                documents[position] = Document(page_content=page_content, metadata=json.loads(metadata))
+        return documents
+
+
+class SqliteDocstore(Docstore):
+    """Docstore that fetches a chunk from docstore.sqlite when a search returns it."""
+
+    def __init__(self, store: SqliteStore):
+        self.store = store
+
+    def search(self, search: str):
+        row = self.store.conn.execute(
+            "SELECT page_content, metadata FROM chunks WHERE doc_id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def delete(self, ids):
+        raise ReadOnlyDocstoreError()
+
+
+class PositionMap(Mapping):
+    """FAISS position -> docstore ID, looked up in docstore.sqlite on demand."""
+
+    def __init__(self, store: SqliteStore, size: int):
+        self.store = store
+        self.size = size
+
+    def __getitem__(self, position):
+        row = self.store.conn.execute(
+            "SELECT doc_id FROM chunks WHERE position = ?", (int(position),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        for (position,) in self.store.conn.execute("SELECT position FROM chunks ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return self.size
+
+
+class MappedFAISS(FAISS):
+    """FAISS over the memory-mapped index, refusing deletes before they reach the mapped vectors."""
+
+    def delete(self, ids=None, **kwargs):
+        raise ReadOnlyDocstoreError()
+
+
+def load_flat_index(index_path: str):
+    """index.faiss memory-mapped read-only; mapping it twice shares the same pages."""
+    import faiss
+
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(os.path.join(index_path, "index.faiss"), flags)
+
+def load_mapped_index(index_path: str, nprobe: int = 16, ef_search: int = 64):
+    """
+    The search index with its vectors memory-mapped rather than copied into the
+    process, so every server worker shares the same pages of the OS page cache.
+    Prefers the approximate index when build_kb.py wrote one.
+    """
+    index = load_flat_index(index_path)
+    ann = load_ann_index(index_path, index.ntotal, nprobe=nprobe, ef_search=ef_search, mmap=True)
+    return ann if ann is not None else index
+
+def load_mapped_vectorstore(index_path: str, embeddings, nprobe: int = 16, ef_search: int = 64):
+    """
+    A read-only FAISS vectorstore over the on-disk layout, or None when the index has
+    no docstore.sqlite yet (written on the final commit of build_kb.py) or it does
+    not match index.faiss.
+    """
+    db_path = os.path.join(index_path, DOCSTORE_FILE)
+    if not os.path.exists(db_path):
+        return None
+    index = load_mapped_index(index_path, nprobe=nprobe, ef_search=ef_search)
+    store = SqliteStore(db_path)
+    count = store.count()
+    if count != index.ntotal:
+        print(f"⚠️ Ignoring stale {DOCSTORE_FILE}: {count} chunks, expected {index.ntotal}")
+        return None
+    return MappedFAISS(embeddings, index, SqliteDocstore(store), PositionMap(store, count))
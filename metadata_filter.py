@@ -0,0 +1,92 @@
+import os
+import re
+from utilities import labels
+
+FILTER_FIELDS = ["document_type", "file_type", "source", "product", "version"]
+
+# Product families as they appear in ALE file names, e.g. "AOS 8.9 R02 Advanced Routing Guide.pdf".
+# Letter boundaries rather than \b, since file names often use underscores as separators.
+PRODUCTS = {
+    "AOS": r"(?<![a-z])AOS(?![a-z])",
+    "OmniSwitch": r"(?<![a-z])Omni-?Switch(?![a-z])|(?<![a-z])OS\d{4}",
+    "OmniVista": r"(?<![a-z])Omni-?Vista(?![a-z])|(?<![a-z])OV\d{4}",
+    "OmniAccess Stellar": r"(?<![a-z])Stellar(?![a-z])",
+    "OmniPCX": r"(?<![a-z])(OmniPCX|OXE)(?![a-z])",
+    "Rainbow": r"(?<![a-z])Rainbow(?![a-z])",
+}
+# Names of one product line. File names say "AOS" or "OmniSwitch" for the same switches,
+# so a filter on either name matches both.
+PRODUCT_FAMILIES = [
+    {"AOS", "OmniSwitch"},
+]
+VERSION_PATTERN = r"(?<![\d.])(\d{1,2}\.\d{1,2})(?:\.\d{1,3})?(?!\.?\d)"
+
+# Document types searched for knowledge sub-intents that clearly call for one kind of document
+SUB_INTENT_DOCUMENT_TYPES = {
+    "specification": ["Datasheet", "Specification"],
+}
+
+
+def parse_product_version(text: str) -> dict:
+    """Product family and release (e.g. AOS / 8.9) mentioned in a file name or question."""
+    parsed = {}
+    for product, pattern in PRODUCTS.items():
+        if re.search(pattern, text, re.IGNORECASE):
+            parsed["product"] = product
+            break
+    version = re.search(VERSION_PATTERN, text)
+    if version:
+        parsed["version"] = version.group(1)
+    return parsed
+
+def parse_source(source: str) -> dict:
+    return parse_product_version(os.path.basename(source or ""))
+
+def parse_filter_text(text: str) -> dict:
+    """
+    Turn a phrase such as "only AOS 8.9 guides" into a filter: product and release,
+    plus the document types named in it (singular or plural).
+    """
+    parsed = parse_product_version(text)
+    lowered = text.lower()
+    named = {label for label in labels if re.search(rf"\b{re.escape(label.lower())}s?\b", lowered)}
+    # "guides" also covers the more specific "Technical Guide"
+    document_types = [label for label in labels if label in named or label.split()[-1] in named]
+    if document_types:
+        parsed["document_type"] = document_types
+    return parsed
+
+def normalize_filter(search_filter) -> dict:
+    """
+    Accepts a filter phrase or a dict of field -> value or list of values, and returns
+    a dict of field -> list of lower-case values. A product also matches the other names
+    of its family. Unknown fields raise ValueError.
+    """
+    if not search_filter:
+        return {}
+    if isinstance(search_filter, str):
+        search_filter = parse_filter_text(search_filter)
+    normalized = {}
+    for field, values in search_filter.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter field: {field}, expected one of {', '.join(FILTER_FIELDS)}")
+        if isinstance(values, str):
+            values = [values]
+        values = {str(value).lower() for value in values}
+        if field == "product":
+            values |= {name.lower() for family in PRODUCT_FAMILIES for name in family
+                       if values & {member.lower() for member in family}}
+        normalized[field] = sorted(values)
+    return normalized
+
+def question_filter(question: str) -> dict:
+    """Automatic filter from the product and release a question names, e.g. "on AOS 8.9"."""
+    return parse_product_version(question)
+
+def intent_filter(question: str, intent: dict) -> dict:
+    """`question_filter` plus the document types implied by the detected sub-intent."""
+    search_filter = question_filter(question)
+    document_types = SUB_INTENT_DOCUMENT_TYPES.get(intent.get("sub_intent"))
+    if document_types:
+        search_filter["document_type"] = document_types
+    return search_filter
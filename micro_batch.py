@@ -0,0 +1,72 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Runs `process(items) -> results` on batches of items submitted from many threads.
+    The first waiting item opens a batch, which closes after `max_wait` seconds or
+    `max_batch` items, whichever comes first. Items arriving while a batch is being
+    processed wait for the next one. Each caller gets its own result, or the exception
+    the whole batch failed with.
+    """
+
+    def __init__(self, process, max_batch: int = 32, max_wait: float = 0.005, name: str = "micro-batcher"):
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.batches = self.items = self.largest = 0
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self.queue.put((item, future))
+        # The worker starts with the first item, so creating a batcher costs nothing
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                    self.thread.start()
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            try:
+                results = self.process([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest,
+        }
@@ -0,0 +1,47 @@
+import threading
+
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def get_model(name: str, factory):
+    """
+    Return the model registered under `name`, creating it with `factory()` on first
+    use. Thread-safe: concurrent callers wait for a single load, and loading one
+    model does not block callers of another.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _models:
+            _models[name] = factory()
+    return _models[name]
+
+def get_embeddings(model_name: str = "thenlper/gte-small", **options):
+    """
+    Shared EmbeddingEngine; `backend`, `device`, `batch_size` and `threads` that are
+    not given come from the AIOPS_EMBEDDING_* environment variables.
+    """
+    from embedding_engine import EmbeddingEngine, engine_options
+    options = engine_options(**options)
+    def factory():
+        return EmbeddingEngine(model_name, **options)
+    key = ":".join(str(options[name]) for name in sorted(options))
+    return get_model(f"embeddings:{model_name}:{key}", factory)
+
+def get_zero_shot_classifier(model_name: str = "facebook/bart-large-mnli"):
+    def factory():
+        from transformers import pipeline
+        return pipeline("zero-shot-classification", model=model_name)
+    return get_model(f"zero-shot:{model_name}", factory)
+
+def get_cross_encoder(model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", device: str = "cpu"):
+    def factory():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device=device)
+    return get_model(f"cross-encoder:{model_name}:{device}", factory)
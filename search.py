@@ -3,10 +3,11 @@ import json
 import logging
 from datetime import datetime
 import pytz
+import httpx
 # from langchain_ollama import OllamaLLM
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.chains import RetrievalQA
+from langchain.retrievers import ContextualCompressionRetriever
 from langchain_core.prompts import PromptTemplate
 from langchain_core.prompts.chat import (
     ChatPromptTemplate,
@@ -15,28 +16,107 @@ from langchain_core.prompts.chat import (
 )
 from langchain_core.messages import AIMessage
 from langchain_openai import ChatOpenAI
-from config import OPENAI_API_KEY
+from models import get_embeddings, get_cross_encoder
+from embedding_cache import CachedEmbeddings, BatchedEmbeddings
+from ann_index import load_ann_index
+from mapped_store import load_mapped_vectorstore, load_flat_index
+from hybrid_search import HybridRetriever
+from context_budget import ContextBudget
 
 # Setup logging
 #logging.basicConfig(level=logging.INFO)
 
 # Embedding model
-embedding_model = HuggingFaceEmbeddings(model_name="thenlper/gte-small")
+# Queries repeat (intent routing, answer cache, retrieval), so keep recent ones in memory
+embedding_engine = get_embeddings("thenlper/gte-small")
+embedding_model = CachedEmbeddings(
+    embedding_engine,
+    embedding_engine.cache_name,
+    memory_size=int(os.getenv("AIOPS_QUERY_CACHE_SIZE", "4096"))
+)
 
 # Load FAISS vectorstore
 index_path = "faiss_index"
 if not os.path.exists(index_path):
     raise FileNotFoundError(f"Index path not found: {index_path}")
 
-vectorstore = FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
-retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
-
-# LLM setup using LangChain wrapper
-llm = ChatOpenAI(
-    api_key=OPENAI_API_KEY, 
-    model="gpt-4o", 
-    temperature=0.7
+nprobe = int(os.getenv("AIOPS_NPROBE", "16"))
+ef_search = int(os.getenv("AIOPS_EF_SEARCH", "64"))
+
+# Memory-mapped vectors and lazily read chunks (docstore.sqlite) unless AIOPS_MMAP_INDEX=0;
+# falls back to unpickling index.pkl for indexes built before the on-disk layout existed
+vectorstore = None
+if os.getenv("AIOPS_MMAP_INDEX", "1") == "1":
+    vectorstore = load_mapped_vectorstore(index_path, embedding_model, nprobe=nprobe, ef_search=ef_search)
+
+if vectorstore is None:
+    vectorstore = FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
+
+    # Use the IVF/HNSW/IVF-PQ index built with `build_kb.py --index-type` when there is one
+    ann = load_ann_index(index_path, vectorstore.index.ntotal, nprobe=nprobe, ef_search=ef_search)
+    if ann is not None:
+        vectorstore.index = ann
+
+# Vector + BM25 keyword search fused and reranked to a few chunks, when the index has a
+# keyword table (docstore.sqlite); AIOPS_HYBRID=0 keeps the plain 20-chunk vector retriever
+docstore = getattr(vectorstore.docstore, "store", None)
+batch_size = int(os.getenv("AIOPS_BATCH_SIZE", "32"))
+batch_wait = float(os.getenv("AIOPS_BATCH_WAIT_MS", "5")) / 1000
+if os.getenv("AIOPS_HYBRID", "1") == "1" and docstore is not None and docstore.has_keyword_index():
+    reranker = None
+    if os.getenv("AIOPS_RERANKER", "1") == "1":
+        reranker = get_cross_encoder(os.getenv("AIOPS_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+    retriever = HybridRetriever(
+        embeddings=embedding_model,
+        index=vectorstore.index,
+        store=docstore,
+        reranker=reranker,
+        exact_index=load_flat_index(index_path),
+        top_n=int(os.getenv("AIOPS_RERANK_TOP_N", "5")),
+        # Concurrent requests share one embedding call and one FAISS search
+        max_batch=batch_size,
+        max_wait=batch_wait
     )
+else:
+    # Concurrent requests still share one embedding call, then search on their own
+    if batch_size > 1:
+        vectorstore.embedding_function = BatchedEmbeddings(embedding_model, batch_size, batch_wait)
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
+
+def search_batch_stats() -> dict:
+    """Micro-batching stats of the retriever's searches, or of its query embeddings without hybrid search."""
+    batched = retriever if isinstance(retriever, HybridRetriever) else vectorstore.embedding_function
+    return batched.batch_stats() if hasattr(batched, "batch_stats") else {"enabled": False}
+
+# Retrieved chunks are merged, deduplicated and cut to a token budget before prompting
+context_budget = ContextBudget(max_tokens=int(os.getenv("AIOPS_CONTEXT_TOKENS", "3000")))
+
+# Metadata filters need the chunk_filters table of docstore.sqlite (DOCSTORE_VERSION 2)
+filters_supported = isinstance(retriever, HybridRetriever) and docstore.has_filters()
+
+# LLM setup using LangChain wrapper. AIOPS_STUB_LLM=1 swaps in an offline stub.
+USE_STUB_LLM = os.getenv("AIOPS_STUB_LLM") == "1"
+if USE_STUB_LLM:
+    from stub_llm import StubChatModel
+    llm = StubChatModel()
+else:
+    try:
+        from config import OPENAI_API_KEY
+    except ImportError:
+        OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+    # One keep-alive connection pool shared by every request
+    http_pool_size = int(os.getenv("AIOPS_HTTP_POOL_SIZE", "32"))
+    http_limits = httpx.Limits(max_connections=http_pool_size, max_keepalive_connections=http_pool_size)
+
+    llm = ChatOpenAI(
+        api_key=OPENAI_API_KEY, 
+        model="gpt-4o", 
+        temperature=0.7,
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        http_client=httpx.Client(limits=http_limits, timeout=120),
+        http_async_client=httpx.AsyncClient(limits=http_limits, timeout=120),
+        )
 
 # Custom prompt
 intent_template = """
@@ -261,11 +341,29 @@ convert_configuration_chain = config_conversion_system_prompt | llm
 
 qa_chain = RetrievalQA.from_chain_type(
     llm=llm,
-    retriever=retriever,
+    retriever=ContextualCompressionRetriever(base_compressor=context_budget, base_retriever=retriever),
     return_source_documents=True,
     chain_type_kwargs={"prompt": prompt_template}
 )
 
+# Same prompt as qa_chain, with retrieval done by the caller so the answer can be streamed
+answer_chain = prompt_template | llm
+
+
+def format_docs(docs) -> str:
+    # Matches the "stuff" chain used by qa_chain
+    return "\n\n".join(doc.page_content for doc in docs)
+
+def describe_sources(docs) -> list:
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "document_type": doc.metadata.get("document_type"),
+        }
+        for doc in docs
+    ]
+
 
 # Main Loop
 if __name__ == "__main__":
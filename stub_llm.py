@@ -0,0 +1,48 @@
+import json
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOpenAI, enabled with AIOPS_STUB_LLM=1. Answers the intent
+    prompt with a fixed classification and streams a canned answer word by word, with
+    configurable latencies so streaming and time-to-first-token can be exercised locally.
+    """
+
+    first_token_delay: float = 0.5
+    token_delay: float = 0.02
+    answer: str = (
+        "This is a stub answer generated without calling OpenAI. "
+        "It streams one word at a time so the client can render it incrementally."
+    )
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def reply(self, messages) -> str:
+        system = messages[0].content if messages else ""
+        question = messages[-1].content if messages else ""
+        if "classify user input" in system:
+            sub_intent = "convert_configuration" if "convert" in question.lower() else "specification"
+            result = [{"domain": "external_knowledge", "sub_intent": sub_intent, "feature": "", "entities": {}}]
+            return json.dumps({"result": json.dumps(result)})
+        return self.answer
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay)
+        for i, word in enumerate(self.reply(messages).split(" ")):
+            if i:
+                time.sleep(self.token_delay)
+            token = word if i == 0 else f" {word}"
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
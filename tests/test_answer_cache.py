@@ -0,0 +1,13 @@
+from answer_cache import SemanticCache
+
+
+def test_lookup_requires_same_scope(tmp_path):
+    cache = SemanticCache(str(tmp_path / "faiss_index"))
+    aos_89 = (("product", ("aos", "omniswitch")), ("version", ("8.9",)))
+    aos_810 = (("product", ("aos", "omniswitch")), ("version", ("8.10",)))
+    cache.store([1.0, 0.0], {"answer": "8.9"}, aos_89)
+
+    # Identical embeddings, but the question names another release
+    assert cache.lookup([1.0, 0.0], aos_810) is None
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.01], aos_89) == {"answer": "8.9"}
@@ -0,0 +1,72 @@
+from config_converter import convert_local, parse_ios, split_stanzas
+
+
+def count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def test_vlans_and_svis_convert_locally():
+    conversion = convert_local(
+        "Convert this configuration please\n"
+        "vlan 10\n name USERS\n!\n"
+        "interface Vlan10\n ip address 10.0.10.1 255.255.255.0\n!\n"
+        "router ospf 1\n network 10.0.0.0 0.255.255.255 area 0\n"
+    )
+
+    assert conversion.preamble == "Convert this configuration please"
+    assert conversion.converted == 2
+    assert [stanza.header for stanza in conversion.unrecognised] == ["router ospf 1"]
+    assert 'vlan 10 name "USERS"' in conversion.render()
+    assert 'ip interface "int_vlan_10" address 10.0.10.1 mask 255.255.255.0 vlan 10' in conversion.render()
+
+def test_indented_sub_commands_stay_in_their_stanza():
+    _, stanzas = parse_ios(
+        "interface Vlan10\n ip address 10.0.0.1 255.255.255.0\n no ip redirects\n"
+        "interface GigabitEthernet1/0/1\n switchport access vlan 10\n spanning-tree portfast\n"
+    )
+
+    assert [stanza.header for stanza in stanzas] == ["interface Vlan10", "interface GigabitEthernet1/0/1"]
+    assert stanzas[1].lines == ["switchport access vlan 10", "spanning-tree portfast"]
+
+def test_ports_need_a_module_mapping():
+    config = "interface GigabitEthernet1/0/5\n switchport access vlan 3\ninterface GigabitEthernet2/0/5\n switchport access vlan 3\n"
+
+    conversion = convert_local(config, port_map={"1/0": "1/1"})
+
+    assert "vlan 3 member port 1/1/5 untagged" in conversion.render()
+    assert [stanza.header for stanza in conversion.unrecognised] == ["interface GigabitEthernet2/0/5"]
+
+def test_related_stanzas_share_a_request():
+    _, stanzas = parse_ios(
+        "interface Port-channel1\n switchport mode trunk\n!\n"
+        "ip access-list extended BLOCK\n deny ip any any\n!\n"
+        "interface GigabitEthernet1/0/1\n channel-group 1 mode active\n!\n"
+        "interface GigabitEthernet1/0/2\n ip access-group BLOCK in\n!\n"
+        "class-map match-any VOICE\n match dscp ef\n!\n"
+        "policy-map QOS\n class VOICE\n  priority percent 10\n!\n"
+        "interface GigabitEthernet1/0/3\n service-policy input QOS\n!\n"
+        "router ospf 1\n network 10.0.0.0 0.255.255.255 area 0\n!\n"
+        "ip route 0.0.0.0 0.0.0.0 10.0.0.254\n"
+    )
+
+    requests = split_stanzas(stanzas, 1, count_tokens)
+
+    assert [[stanza.header for stanza in request] for request in requests] == [
+        ["interface Port-channel1", "interface GigabitEthernet1/0/1"],
+        ["ip access-list extended BLOCK", "interface GigabitEthernet1/0/2"],
+        ["class-map match-any VOICE", "policy-map QOS", "interface GigabitEthernet1/0/3"],
+        ["router ospf 1", "ip route 0.0.0.0 0.0.0.0 10.0.0.254"],
+    ]
+
+def test_helper_addresses_stay_on_their_vlan():
+    conversion = convert_local(
+        "interface Vlan1\n ip address 10.0.1.1 255.255.255.0\n ip helper-address 192.168.2.254\n!\n"
+        "interface Vlan2\n ip address 10.0.2.1 255.255.255.0\n ip helper-address 192.168.3.254\n!\n"
+        "interface Vlan3\n ip address 10.0.3.1 255.255.255.0\n"
+    )
+
+    assert conversion.groups()["ip"][3:] == [
+        "ip helper per-vlan only",
+        "ip helper address 192.168.2.254 vlan 1",
+        "ip helper address 192.168.3.254 vlan 2",
+    ]
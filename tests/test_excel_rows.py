@@ -0,0 +1,49 @@
+import datetime
+
+import pandas as pd
+from openpyxl import Workbook
+
+from utilities import iter_sheet_slices, serialize_rows
+
+
+def iterrows_lines(file) -> dict:
+    """Rows serialised the way extraction did before sheets were streamed."""
+    lines = {}
+    for sheet_name, df in pd.read_excel(file, sheet_name=None).items():
+        df = df.dropna(how="all").reset_index(drop=True)
+        lines[sheet_name] = [
+            "; ".join(f"{col}: {row[col]}" for col in df.columns if pd.notna(row[col])) for _, row in df.iterrows()
+        ]
+    return lines
+
+def sliced_lines(file, rows_per_slice: int) -> dict:
+    lines = {}
+    for sheet_name, df in iter_sheet_slices(file, rows_per_slice):
+        lines.setdefault(sheet_name, []).extend(serialize_rows(df.dropna(how="all")))
+    return lines
+
+
+def test_slices_serialise_like_iterrows(tmp_path):
+    workbook = Workbook()
+    numbers = workbook.active
+    numbers.title = "Numbers"
+    numbers.append(["Part", "Qty", "Price", "Spare"])
+    for i in range(7000):
+        # A single blank Qty makes the whole column float in read_excel
+        numbers.append([f"OS6860-{i}", None if i == 6500 else i, i + 0.5 if i % 3 else i, None])
+    numbers.append([None, None, None, None])
+    numbers.append(["OS9900", 1, 2.0, None])
+
+    mixed = workbook.create_sheet("Mixed")
+    mixed.append(["Name", "Count", "Enabled", "Released", "Note"])
+    for i in range(1200):
+        mixed.append([
+            f"item {i}", i, i % 2 == 0, datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i),
+            "N/A" if i == 3 else (i if i % 7 == 0 else f"note {i}"),
+        ])
+    mixed.append([None] * 5)  # Trailing empty rows are dropped by read_excel
+
+    path = tmp_path / "bom.xlsx"
+    workbook.save(path)
+
+    assert sliced_lines(path, 500) == iterrows_lines(path)
@@ -0,0 +1,28 @@
+from hash_registry import load_processed_hashes, mark_many_as_processed, get_chunk_refs, find_chunks, get_record, apply_commit
+
+
+def test_chunk_dropped_and_readded_in_one_commit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = load_processed_hashes(tmp_path / "registry.sqlite")
+    mark_many_as_processed([], registry, chunks={"new": {"shared": "old-id"}, "refs_delta": {"old-id": 1}, "dropped": set()})
+
+    # The last file using "shared" is edited: its vector is dropped, then the text is embedded again
+    chunks = {"new": {"shared": "new-id"}, "refs_delta": {"old-id": -1, "new-id": 2}, "dropped": {"old-id"}}
+    mark_many_as_processed([], registry, chunks=chunks)
+
+    assert find_chunks(["shared"], registry) == {"shared": "new-id"}
+    assert get_chunk_refs(["old-id", "new-id"], registry) == {"new-id": 2}
+
+
+def test_commit_replayed_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = load_processed_hashes(tmp_path / "registry.sqlite")
+    record = {"path": "guide.pdf", "hash": "h", "size": 1, "mtime": 1.0, "ids": ["id-1"]}
+    # As saved next to index.faiss by a commit that crashed before writing the registry
+    commit = {"generation": 1, "records": [record], "removed": [],
+              "chunks": {"new": {"text": "id-1"}, "refs_delta": {"id-1": 1}, "dropped": []}}
+
+    assert apply_commit(commit, registry)
+    assert not apply_commit(commit, registry)
+    assert get_record("guide.pdf", registry)["ids"] == ["id-1"]
+    assert get_chunk_refs(["id-1"], registry) == {"id-1": 1}
@@ -0,0 +1,21 @@
+from utilities import iter_html_pages
+
+
+def test_head_without_end_tag(tmp_path):
+    path = tmp_path / "guide.html"
+    path.write_text(
+        "<html><head><title>OSPF guide</title><meta charset='utf-8'>"
+        "<body><h1>OSPF</h1><p>Enable OSPF with ip load ospf.</p></body></html>"
+    )
+
+    pages = list(iter_html_pages(path))
+
+    assert [page["page_number"] for page in pages] == ["Section 1: OSPF"]
+    assert "ip load ospf" in pages[0]["text"]
+    assert "OSPF guide" not in pages[0]["text"]
+
+def test_head_is_skipped(tmp_path):
+    path = tmp_path / "guide.html"
+    path.write_text("<html><head><title>Title</title><style>p {}</style></head><body><p>Body text</p></body></html>")
+
+    assert [page["text"] for page in iter_html_pages(path)] == ["Body text"]
@@ -0,0 +1,14 @@
+import pytest
+
+pytest.importorskip("langchain_community")
+pytest.importorskip("faiss")
+
+from mapped_store import MappedFAISS, SqliteDocstore, PositionMap, ReadOnlyDocstoreError
+
+
+def test_mapped_vectorstore_refuses_delete():
+    vectorstore = MappedFAISS(None, None, SqliteDocstore(None), PositionMap(None, 0))
+    with pytest.raises(ReadOnlyDocstoreError):
+        vectorstore.delete(["id-1"])
+    with pytest.raises(ReadOnlyDocstoreError):
+        vectorstore.docstore.delete(["id-1"])
@@ -0,0 +1,8 @@
+from metadata_filter import normalize_filter, question_filter
+
+
+def test_product_family_names_match_each_other():
+    # Guides named "AOS ..." must stay searchable when a question says "OmniSwitch"
+    assert normalize_filter(question_filter("VRRP on an OmniSwitch 6900")) == {"product": ["aos", "omniswitch"]}
+    assert normalize_filter({"product": "AOS", "version": "8.9"}) == {"product": ["aos", "omniswitch"], "version": ["8.9"]}
+    assert normalize_filter({"product": ["Rainbow"]}) == {"product": ["rainbow"]}
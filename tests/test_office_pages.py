@@ -0,0 +1,63 @@
+import zipfile
+from utilities import iter_docx_pages, iter_pptx_pages
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+PML = ('xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+       'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+       'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"')
+RELS = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+
+
+def write_zip(path, parts: dict):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, xml)
+    return path
+
+def paragraph(text, style=None):
+    properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{properties}<w:r><w:t>{text}</w:t></w:r></w:p>"
+
+def cell(text, merge=""):
+    return f"<w:tc><w:tcPr>{merge}</w:tcPr>{paragraph(text)}</w:tc>"
+
+def test_docx_sections_and_tables(tmp_path):
+    body = (
+        paragraph("OSPF", "Heading1")
+        + paragraph("Enable OSPF first.")
+        + '<w:p><w:hyperlink><w:r><w:t>See the </w:t></w:r><w:r><w:t>guide</w:t></w:r></w:hyperlink></w:p>'
+        + "<w:tbl><w:tr>" + cell("Area", '<w:vMerge w:val="restart"/>') + cell("ip ospf area 0") + "</w:tr>"
+        + "<w:tr>" + cell("", "<w:vMerge/>") + cell("ip ospf area 1") + "</w:tr></w:tbl>"
+        + paragraph("BGP", "Heading1")
+        + paragraph("Enable BGP.")
+    )
+    path = write_zip(tmp_path / "guide.docx", {
+        "word/document.xml": f"<w:document {W}><w:body>{body}<w:sectPr/></w:body></w:document>",
+        "word/styles.xml": f'<w:styles {W}><w:style w:styleId="Heading1"><w:name w:val="heading 1"/></w:style></w:styles>',
+    })
+
+    pages = list(iter_docx_pages(path))
+
+    assert [page["page_number"] for page in pages] == ["Section 1: OSPF", "Section 2: BGP"]
+    assert pages[0]["text"] == "OSPF\nEnable OSPF first.\nSee the guide\nArea | ip ospf area 0\nArea | ip ospf area 1"
+
+def test_pptx_slides_in_presentation_order(tmp_path):
+    def slide(text):
+        return (f"<p:sld {PML}><p:cSld><p:spTree><p:grpSp><p:sp><p:txBody><a:p><a:r><a:t>{text}</a:t></a:r></a:p>"
+                "</p:txBody></p:sp></p:grpSp></p:spTree></p:cSld></p:sld>")
+
+    path = write_zip(tmp_path / "deck.pptx", {
+        "ppt/presentation.xml": f'<p:presentation {PML}><p:sldIdLst><p:sldId r:id="rId3"/><p:sldId r:id="rId2"/></p:sldIdLst></p:presentation>',
+        "ppt/_rels/presentation.xml.rels": f'<Relationships {RELS}><Relationship Id="rId2" Type="x/slide" Target="slides/slide1.xml"/>'
+                                           f'<Relationship Id="rId3" Type="x/slide" Target="/ppt/slides/slide2.xml"/></Relationships>',
+        "ppt/slides/slide1.xml": slide("VLANs"),
+        "ppt/slides/slide2.xml": slide("Agenda"),
+        "ppt/slides/_rels/slide1.xml.rels": f'<Relationships {RELS}><Relationship Id="rId1" Type="x/notesSlide" Target="../notesSlides/notesSlide1.xml"/></Relationships>',
+        "ppt/notesSlides/notesSlide1.xml": f'<p:notes {PML}><p:cSld><p:spTree><p:sp><p:nvSpPr><p:nvPr><p:ph type="body"/></p:nvPr></p:nvSpPr>'
+                                           "<p:txBody><a:p><a:r><a:t>Mention vlan 10</a:t></a:r></a:p></p:txBody></p:sp></p:spTree></p:cSld></p:notes>",
+    })
+
+    assert list(iter_pptx_pages(path)) == [
+        {"text": "Agenda", "page_number": "Slide 1"},
+        {"text": "VLANs\nNotes: Mention vlan 10", "page_number": "Slide 2"},
+    ]
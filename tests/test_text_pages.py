@@ -0,0 +1,24 @@
+from utilities import iter_text_pages
+
+
+def test_text_without_blank_lines_is_paged(tmp_path):
+    path = tmp_path / "switch.log"
+    path.write_text("".join(f"Jan 1 00:00:{i % 60:02d} swlogd: port 1/1/{i % 48 + 1} link up\n" for i in range(20000)))
+
+    pages = list(iter_text_pages(path, max_chars=4000))
+
+    assert len(pages) > 1
+    assert all(len(page["text"]) <= 8000 for page in pages)
+    assert pages[0]["page_number"].startswith("lines 1-")
+    assert pages[-1]["page_number"].endswith("-20000")
+    assert sum(len(page["text"].splitlines()) for page in pages) == 20000
+
+def test_long_line_is_read_in_pieces(tmp_path):
+    path = tmp_path / "minified.txt"
+    path.write_text("x" * 50000 + "\nlast line\n")
+
+    pages = list(iter_text_pages(path, max_chars=4000))
+
+    assert all(len(page["text"]) <= 8000 for page in pages)
+    assert "".join(page["text"] for page in pages[:-1]) + pages[-1]["text"].split("\n")[0] == "x" * 50000
+    assert pages[-1]["page_number"].endswith("-2")
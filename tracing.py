@@ -0,0 +1,228 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger("aiops.trace")
+
+# Upper bounds of the Prometheus histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60]
+TOKEN_BUCKETS = [16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = list(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.series[key] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{format_labels(self.labels, key, le)} {count}"
+            yield f"{self.name}_sum{format_labels(self.labels, key)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, key)} {counts[-1]}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            series = dict(self.series)
+        for key, value in sorted(series.items()):
+            yield f"{self.name}{format_labels(self.labels, key)} {value}"
+
+
+class Gauge:
+    """Value read from `function` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        yield f"{self.name} {self.function()}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+request_duration = metrics.register(Histogram(
+    "aiops_request_duration_seconds", "End-to-end request latency.", ["endpoint", "status"]
+))
+stage_duration = metrics.register(Histogram(
+    "aiops_stage_duration_seconds", "Latency of each request stage.", ["stage"]
+))
+first_token = metrics.register(Histogram(
+    "aiops_time_to_first_token_seconds", "Time to the first streamed answer token.", ["endpoint"]
+))
+llm_tokens = metrics.register(Histogram(
+    "aiops_llm_tokens", "Tokens per LLM call.", ["stage", "kind"], buckets=TOKEN_BUCKETS
+))
+requests_total = metrics.register(Counter(
+    "aiops_requests_total", "Requests handled.", ["endpoint", "status"]
+))
+answer_cache_total = metrics.register(Counter(
+    "aiops_answer_cache_total", "Answer cache lookups.", ["result"]
+))
+
+# The trace of the request being handled; retrieval threads inherit it from the task that started them
+current_trace: ContextVar = ContextVar("aiops_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Timing spans, LLM token counts and cache/retrieval stats of one request. Spans may
+    be added from worker threads. `finish` feeds the Prometheus metrics and logs the
+    trace as one JSON line under "aiops.trace".
+    """
+
+    def __init__(self, endpoint: str, request_id: str = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = []
+        self.tokens = {}
+        self.stats = {}
+        self.first_token = None
+        self.finished = False
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(stage, time.perf_counter() - start, start)
+
+    def add_span(self, stage: str, seconds: float, start: float = None):
+        offset = (start if start is not None else time.perf_counter() - seconds) - self.started
+        self.spans.append({"stage": stage, "start_ms": round(offset * 1000, 1), "ms": round(seconds * 1000, 1)})
+        if not self.finished:
+            stage_duration.observe(seconds, stage=stage)
+
+    def add_tokens(self, stage: str, prompt: int = None, completion: int = None):
+        """Token counts of one LLM call, summed per stage when a stage makes several calls."""
+        tokens = self.tokens.setdefault(stage, {})
+        for kind, count in [("prompt", prompt), ("completion", completion)]:
+            if count is not None:
+                tokens[kind] = tokens.get(kind, 0) + count
+                llm_tokens.observe(count, stage=stage, kind=kind)
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.started
+            first_token.observe(self.first_token, endpoint=self.endpoint)
+
+    def to_dict(self) -> dict:
+        trace = {
+            "request_id": self.request_id,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": list(self.spans),
+            "tokens": self.tokens,
+            "stats": self.stats,
+        }
+        if self.first_token is not None:
+            trace["ttft_ms"] = round(self.first_token * 1000, 1)
+        return trace
+
+    def finish(self, status: str = "success") -> dict:
+        self.finished = True
+        trace = self.to_dict()
+        request_duration.observe(trace["duration_ms"] / 1000, endpoint=self.endpoint, status=status)
+        requests_total.inc(endpoint=self.endpoint, status=status)
+        if "answer_cache" in self.stats:
+            answer_cache_total.inc(result=self.stats["answer_cache"])
+        logger.info(json.dumps({"endpoint": self.endpoint, "status": status, **trace}, default=str))
+        return trace
+
+
+def start_trace(endpoint: str, request_id: str = None) -> RequestTrace:
+    """Start the trace of a request; tasks and retrieval threads started afterwards inherit it."""
+    trace = RequestTrace(endpoint, request_id)
+    current_trace.set(trace)
+    return trace
+
+@contextmanager
+def span(stage: str):
+    """Time a stage of the current request, if there is one."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+def record_span(stage: str, seconds: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, seconds)
+
+def record_stat(name: str, value):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.stats[name] = value
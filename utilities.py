@@ -6,13 +6,35 @@ from datetime import datetime, timezone
 from pathlib import Path
 import hashlib
 import argparse
-import fitz
-from docx import Document as DocxDocument
-import pandas as pd
-from pptx import Presentation
-from transformers import pipeline
+import itertools
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+from html.parser import HTMLParser
+import numpy as np
+from cache import DiskCache
+from models import get_model, get_embeddings, get_zero_shot_classifier
 
-classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")     
+# Parsers and models are imported on first use, so importing this module stays cheap
+
+DOC_TYPE_CACHE_FILE = Path("doc_type_cache.sqlite")
+CLASSIFIERS = ["bart", "embedding"]
+CLASSIFIER_NAME = "bart"
+# Spreadsheet rows read at a time, so huge sheets are never held in memory at once
+SHEET_SLICE_ROWS = 5000
+# Sheets with more non-empty rows than this are split into row-range pages
+SHEET_PAGE_ROWS = 500
+# Text, Word and HTML pages are cut at paragraph boundaries once they exceed this many characters
+TEXT_PAGE_CHARS = 4000
+# HTML is fed to the parser in blocks of this many characters
+HTML_READ_CHARS = 1 << 16
+# OOXML namespaces, for reading Word and PowerPoint parts without loading the whole package
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+P_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+SUPPORTED_EXTENSIONS = [".pdf", ".docx", ".txt", ".xls", ".xlsx", ".html", ".htm", ".pptx"]
 
 # Candidate labels (you can customize these)
 labels = [
@@ -26,6 +48,14 @@ def get_text_hash(text):
     """Generate a SHA256 hash of the full text."""
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
+def get_file_hash(path, block_size=1 << 20):
+    """Generate a SHA256 hash of the file content, reading it in blocks."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
 def get_document_type(filename: str) -> str:
     extension_map = {
         '.pdf': 'PDF',
@@ -50,77 +80,624 @@ def get_document_type(filename: str) -> str:
     extension = Path(filename).suffix.lower()
     return extension_map.get(extension, 'Unknown Document Type')   
 
+class EmbeddingClassifier:
+    """
+    Cheaper alternative to BART: picks the label whose description is closest to the
+    text in gte-small embedding space. Scores are cosine similarities, not probabilities.
+    """
+
+    def __init__(self):
+        # On the CPU: the classifier runs in every extraction worker
+        self.embeddings = get_embeddings(device="cpu")
+        self.label_vectors = self.normalize(self.embeddings.embed_documents([f"This document is a {label}." for label in labels]))
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.array(vectors)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def __call__(self, texts, batch_size=8):
+        scores = self.normalize(self.embeddings.embed_documents(texts)) @ self.label_vectors.T
+        best = scores.argmax(axis=1)
+        return [(labels[i], float(scores[row, i])) for row, i in enumerate(best)]
+
+def bart_classify(texts, batch_size=8):
+    results = get_zero_shot_classifier()(texts, labels, batch_size=batch_size)
+    if isinstance(results, dict):
+        results = [results]
+    return [(result['labels'][0], result['scores'][0]) for result in results]
+
+_doc_type_cache = None
+
+def set_classifier(name: str):
+    global CLASSIFIER_NAME
+    if name not in CLASSIFIERS:
+        raise ValueError(f"Unknown classifier: {name}")
+    CLASSIFIER_NAME = name
+
+def get_classifier(name: str):
+    if name == "bart":
+        return bart_classify
+    return get_model("embedding-classifier", EmbeddingClassifier)
+
+def get_doc_type_cache():
+    # One connection per process, the build's workers must not share the parent's
+    global _doc_type_cache
+    if _doc_type_cache is None or _doc_type_cache[0] != os.getpid():
+        _doc_type_cache = (os.getpid(), DiskCache(DOC_TYPE_CACHE_FILE, table="doc_types"))
+    return _doc_type_cache[1]
+
+def infer_document_types(texts: list, threshold: float = 0, batch_size: int = 8, use_cache: bool = True) -> list:
+    """
+    Classify many document heads at once. Results are cached on disk by classifier
+    and text hash, so re-runs and duplicate documents skip inference.
+    """
+    heads = [text[:1000] if isinstance(text, str) else "" for text in texts]
+    keys = [f"{CLASSIFIER_NAME}:{get_text_hash(head)}" for head in heads]
+    cache = get_doc_type_cache() if use_cache else None
+    cached = cache.get_many(list(set(keys))) if cache else {}
+
+    results = {}
+    todo = {}
+    for key, head in zip(keys, heads):
+        if not head.strip():
+            results[key] = ("Unknown", 1.0)
+        elif key in cached:
+            label, score = json.loads(cached[key])
+            results[key] = (label, score)
+        else:
+            todo[key] = head
+
+    if todo:
+        predictions = get_classifier(CLASSIFIER_NAME)(list(todo.values()), batch_size=batch_size)
+        results.update(zip(todo.keys(), predictions))
+        if cache:
+            cache.set_many({key: json.dumps(results[key]) for key in todo})
+
+    return [
+        results[key][0] if results[key][1] >= threshold else "Unknown"
+        for key in keys
+    ]
+
 def infer_document_type(text: str, threshold: float = 0) -> str:
     if not isinstance(text, str) or not text.strip():
         return "Unknown"
-    # Ensure the text is wrapped in a list for the classifier
-    result = classifier(text[:1000], labels)  # Pass the text in a list format
-    if result['scores'][0] >= threshold:
-        return result['labels'][0]
-    return "Unknown"     
+    return infer_document_types([text], threshold=threshold)[0]
 
-def extract_text_with_page_numbers(pdf_path) -> list[dict]:
-    results = []
+def iter_pdf_pages(pdf_path):
+    """
+    Yield {"page", "text"} for each non-empty page, reading one page at a time.
+    A page that cannot be read raises, so the file is reported as failed rather
+    than indexed without its remaining pages.
+    """
+    import fitz
+    doc = fitz.open(pdf_path)
     try:
-        doc = fitz.open(pdf_path)
-        for i, page in enumerate(doc, start=1):
-            text = page.get_text()
+        for i in range(doc.page_count):
+            try:
+                text = doc.load_page(i).get_text()
+            except Exception as e:
+                raise RuntimeError(f"Cannot read page {i + 1}: {e}") from e
             if text.strip():  # Avoid empty pages
-                results.append({
-                    "page": i,
-                    "text": text
-                })
-    except Exception as e:
-        print(f"❌ Error reading PDF {pdf_path}: {e}")
-    return results    
+                yield {"page": i + 1, "text": text}
+    finally:
+        doc.close()
+
+def extract_text_with_page_numbers(pdf_path) -> list[dict]:
+    return list(iter_pdf_pages(pdf_path))
+
+def excel_columns(header) -> list:
+    """Column names as pandas.read_excel would give them: blanks become "Unnamed: i", duplicates get ".n"."""
+    columns, seen = [], {}
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None or (isinstance(name, str) and not name.strip()) else name
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def excel_cell(value):
+    """A cell as pandas.read_excel reads it: integral numbers become ints, NA strings such as "" or "N/A" None."""
+    from pandas._libs.parsers import STR_NA_VALUES
+
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in STR_NA_VALUES:
+        return None
+    return value
+
+def cell_kind(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "datetime" if isinstance(value, datetime) else "object"
+
+def sheet_dtypes(rows, width: int):
+    """
+    The dtype pandas.read_excel gives each column of a whole sheet, from one pass
+    over its rows, and the number of rows up to the last one with data: trailing
+    empty rows are ignored, like read_excel does.
+    """
+    count = 0
+    kinds = [set() for _ in range(width)]
+    missing = [False] * width
+    pending = [False] * width  # Blanks of rows that only count once a later row has data
+    for number, row in enumerate(rows, 1):
+        cells = [excel_cell(value) for value in row[:width]] + [None] * (width - len(row))
+        for j, value in enumerate(cells):
+            if value is None:
+                pending[j] = True
+            else:
+                kinds[j].add(cell_kind(value))
+        if any(value is not None for value in cells):
+            missing = [m or p for m, p in zip(missing, pending)]
+            pending = [False] * width
+            count = number
+
+    dtypes = []
+    for column_kinds, column_missing in zip(kinds, missing):
+        if not column_kinds or column_kinds <= {"int", "float"} and (column_missing or "float" in column_kinds):
+            dtypes.append("float64")
+        elif column_kinds == {"int"}:
+            dtypes.append("int64")
+        elif column_kinds == {"bool"} and not column_missing:
+            dtypes.append("bool")
+        elif column_kinds == {"datetime"}:
+            dtypes.append("datetime64[ns]")
+        else:
+            dtypes.append("object")
+    return dtypes, count
+
+def iter_sheet_slices(file, rows_per_slice: int = SHEET_SLICE_ROWS):
+    """
+    Yield (sheet_name, DataFrame) slices of at most `rows_per_slice` rows, indexed by
+    data row (0 = the row below the header). .xlsx rows are streamed with openpyxl in
+    read-only mode, twice: column dtypes are inferred over the whole sheet first, so
+    every slice prints its values like pandas.read_excel would. .xls sheets are read
+    one at a time.
+    """
+    import pandas as pd
+
+    if Path(file).suffix.lower() == ".xls":
+        with pd.ExcelFile(file) as xls:
+            for sheet_name in xls.sheet_names:
+                df = xls.parse(sheet_name)
+                for start in range(0, len(df), rows_per_slice):
+                    yield sheet_name, df.iloc[start:start + rows_per_slice]
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = excel_columns(header)
+            width = len(columns)
+            dtypes, count = sheet_dtypes(rows, width)
+            dtypes = dict(zip(columns, dtypes))
+
+            def frame(block, start):
+                df = pd.DataFrame(block, columns=columns, index=range(start, start + len(block)), dtype=object)
+                return df.astype(dtypes)
+
+            rows = itertools.islice(sheet.iter_rows(min_row=2, values_only=True), count)
+            block, start = [], 0
+            for row in rows:
+                block.append(tuple(excel_cell(value) for value in row[:width]) + (None,) * (width - len(row)))
+                if len(block) >= rows_per_slice:
+                    yield sheet.title, frame(block, start)
+                    start += len(block)
+                    block = []
+            if block:
+                yield sheet.title, frame(block, start)
+    finally:
+        workbook.close()
+
+def serialize_rows(df) -> list:
+    """
+    "col: value; ..." for every row of `df`, skipping missing values, built column by
+    column. The text is identical to formatting the rows of df.iterrows(), which take
+    the common dtype of the frame (e.g. ints print as floats when all columns are numeric).
+    """
+    import pandas as pd
+
+    values = df.values  # The same interleaved array iterrows reads its rows from
+    lines = np.full(len(df), "", dtype=object)
+    for j, col in enumerate(df.columns):
+        column = values[:, j]
+        present = np.asarray(pd.notna(column), dtype=bool)
+        if not present.any():
+            continue
+        if column.dtype.kind in "biuf":
+            strings = column.astype(str).astype(object)
+        elif column.dtype.kind == "O":
+            strings = pd.Series(column, dtype=object).astype(str).to_numpy(dtype=object)
+        else:
+            # datetime64/timedelta64: iterrows hands out Timestamps/Timedeltas
+            strings = np.array([str(value) for value in pd.Series(column)], dtype=object)
+        piece = f"{col}: " + np.where(present, strings, "")
+        lines = np.where(present, np.where(lines != "", lines + "; " + piece, piece), lines)
+    return lines.tolist()
+
+def iter_row_pages(slices, rows_per_page: int):
+    """Group the non-empty rows of a sheet's slices into (lines, first_row, last_row, columns) pages."""
+    lines, numbers, columns = [], [], None
+    for _, df in slices:
+        columns = df.columns
+        df = df.dropna(how="all")
+        # Excel row numbers: the header is row 1
+        for number, row_str in zip(df.index + 2, serialize_rows(df)):
+            if row_str.strip():
+                lines.append(f"- {row_str}")
+                numbers.append(int(number))
+        while len(lines) >= rows_per_page:
+            yield lines[:rows_per_page], numbers[0], numbers[rows_per_page - 1], columns
+            del lines[:rows_per_page], numbers[:rows_per_page]
+    if lines:
+        yield lines, numbers[0], numbers[-1], columns
 
-    return cleaned_bom  # structured dictionary of BoM data per sheet    
+def iter_excel_pages(file, rows_per_page: int = SHEET_PAGE_ROWS):
+    """
+    Yield the rows of each sheet serialised as "- col: value; ...". A sheet that fits on
+    one page keeps its name as page_number. Larger sheets are split into pages of
+    `rows_per_page` rows, referenced as "<sheet> rows <first>-<last>" (Excel row
+    numbers), each repeating the column header.
+    """
+    for sheet_name, slices in itertools.groupby(iter_sheet_slices(file), key=lambda item: item[0]):
+        pages = iter_row_pages(slices, rows_per_page)
+        first = next(pages, None)
+        if first is None:
+            continue
+        second = next(pages, None)
+        if second is None:
+            yield {"text": f"Sheet: {sheet_name}\n" + "\n".join(first[0]), "page_number": sheet_name}
+            continue
+        for lines, first_row, last_row, columns in itertools.chain([first, second], pages):
+            yield {
+                "text": f"Sheet: {sheet_name}, rows {first_row}-{last_row}\n"
+                        f"Columns: {'; '.join(str(col) for col in columns)}\n" + "\n".join(lines),
+                "page_number": f"{sheet_name} rows {first_row}-{last_row}"
+            }
 
-def process_file(file=None):
+def section_title(text: str, max_chars: int = 80) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+def iter_sections(blocks, max_chars: int = TEXT_PAGE_CHARS):
+    """
+    Group (is_heading, text) blocks into one page per heading section, referenced as
+    "Section <n>: <heading>". Consecutive headings open a single section named after
+    the last one. Sections longer than `max_chars` continue on "(part <n>)" pages that
+    repeat the heading.
+    """
+    number, title, part, lines, size, has_body = 1, None, 1, [], 0, False
+
+    def page():
+        reference = f"Section {number}: {title}" if title else f"Section {number}"
+        if part > 1:
+            reference += f" (part {part})"
+            if title:
+                lines.insert(0, title)
+        return {"text": "\n".join(lines), "page_number": reference}
+
+    for is_heading, text in blocks:
+        text = text.strip()
+        if not text:
+            continue
+        if is_heading and has_body:
+            yield page()
+            number, part, lines, size, has_body = number + 1, 1, [], 0, False
+        elif not is_heading and has_body and size + len(text) > max_chars:
+            yield page()
+            part, lines, size = part + 1, [], 0
+        if is_heading:
+            title = section_title(text)
+        else:
+            has_body = True
+        lines.append(text)
+        size += len(text) + 1
+    if has_body:
+        yield page()
+
+def iter_text_pages(file, max_chars: int = TEXT_PAGE_CHARS):
+    """
+    Yield pages of a plain text file, read line by line and cut at blank lines once
+    they exceed `max_chars`, referenced as "lines <first>-<last>". Text without blank
+    lines (logs, CLI dumps) is cut at the first line boundary past twice that, and
+    longer lines are read in pieces, so a page never grows with the file.
+    """
+    hard_chars = 2 * max_chars
+    lines, size, first, number = [], 0, None, 1
+    with open(file, encoding="utf-8", errors="replace") as f:
+        for piece in iter(lambda: f.readline(hard_chars), ""):
+            current = number
+            if piece.endswith("\n"):
+                number += 1
+            line = piece.rstrip()
+            if not line:
+                if size >= max_chars:
+                    yield {"text": "\n".join(lines).rstrip(), "page_number": f"lines {first}-{last}"}
+                    lines, size, first = [], 0, None
+                elif lines and lines[-1]:
+                    lines.append("")
+                continue
+            if size + len(line) > hard_chars and lines:
+                yield {"text": "\n".join(lines).rstrip(), "page_number": f"lines {first}-{last}"}
+                lines, size, first = [], 0, None
+            if first is None:
+                first = current
+            lines.append(line)
+            size += len(line) + 1
+            last = current
+    if lines:
+        yield {"text": "\n".join(lines).rstrip(), "page_number": f"lines {first}-{last}"}
+
+def docx_heading_styles(archive) -> set:
+    """Style ids of the Title and Heading styles in word/styles.xml."""
+    try:
+        styles = ElementTree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return set()
+    return {
+        style.get(f"{W_NS}styleId") for style in styles.iter(f"{W_NS}style")
+        if (style.find(f"{W_NS}name") is not None
+            and style.find(f"{W_NS}name").get(f"{W_NS}val", "").lower().startswith(("heading", "title")))
+    }
+
+def docx_text(element) -> str:
+    """Text of a paragraph's runs, including those in hyperlinks and tracked insertions."""
+    parts = []
+    for child in element:
+        if child.tag == f"{W_NS}r":
+            for node in child:
+                if node.tag == f"{W_NS}t":
+                    parts.append(node.text or "")
+                elif node.tag == f"{W_NS}tab":
+                    parts.append("\t")
+                elif node.tag in (f"{W_NS}br", f"{W_NS}cr"):
+                    parts.append("\n")
+        elif child.tag != f"{W_NS}pPr":
+            parts.append(docx_text(child))
+    return "".join(parts)
+
+def docx_table_rows(table):
+    """A table's rows as "cell | cell" text; vertically merged cells repeat the text above."""
+    above = {}
+    for row in table.findall(f"{W_NS}tr"):
+        cells, column = [], 0
+        for cell in row.findall(f"{W_NS}tc"):
+            properties = cell.find(f"{W_NS}tcPr")
+            span = properties.find(f"{W_NS}gridSpan") if properties is not None else None
+            merge = properties.find(f"{W_NS}vMerge") if properties is not None else None
+            span = int(span.get(f"{W_NS}val", 1)) if span is not None else 1
+            if merge is not None and merge.get(f"{W_NS}val", "continue") == "continue":
+                text = above.get(column, "")
+            else:
+                text = "\n".join(docx_text(paragraph) for paragraph in cell.findall(f"{W_NS}p"))
+            for offset in range(span):
+                above[column + offset] = text
+            column += span
+            if not cells or text != cells[-1]:
+                cells.append(text)
+        yield " | ".join(cells)
+
+def iter_docx_blocks(file):
+    """
+    (is_heading, text) for the paragraphs and table rows of a .docx, in document order.
+    word/document.xml is parsed incrementally and each block is freed once read, so
+    memory does not grow with the document.
+    """
+    with zipfile.ZipFile(file) as archive:
+        headings = docx_heading_styles(archive)
+        with archive.open("word/document.xml") as xml:
+            depth, body = 0, None
+            for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if depth == 2 and element.tag == f"{W_NS}body":
+                        body = element
+                    continue
+                depth -= 1
+                # Blocks are the children of <w:body>, itself a child of <w:document>
+                if depth != 2 or body is None:
+                    continue
+                if element.tag == f"{W_NS}p":
+                    style = element.find(f"{W_NS}pPr/{W_NS}pStyle")
+                    yield style is not None and style.get(f"{W_NS}val") in headings, docx_text(element)
+                elif element.tag == f"{W_NS}tbl":
+                    for row in docx_table_rows(element):
+                        yield False, row
+                body.remove(element)
+
+def iter_docx_pages(file, max_chars: int = TEXT_PAGE_CHARS):
+    """Yield one page per heading section of a Word document, see iter_sections."""
+    yield from iter_sections(iter_docx_blocks(file), max_chars)
+
+class HTMLBlockParser(HTMLParser):
+    """
+    Collects the visible text of an HTML document as (is_heading, text) blocks,
+    breaking at block-level tags. h1-h3 open a new section, scripts, styles and
+    the <head> are skipped.
+    """
+
+    BLOCK_TAGS = {
+        "p", "div", "br", "li", "ul", "ol", "dl", "dt", "dd", "tr", "table", "pre", "blockquote",
+        "section", "article", "header", "footer", "nav", "aside", "main", "form", "hr",
+        "h1", "h2", "h3", "h4", "h5", "h6", "caption", "figcaption"
+    }
+    HEADING_TAGS = {"h1", "h2", "h3"}
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg"}
+    # Tags allowed in <head>; any other start tag implicitly closes it, as </head> may be omitted
+    HEAD_TAGS = {"title", "meta", "link", "base", "style", "script", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__()
+        self.blocks = []
+        self.text = []
+        self.skipping = 0
+        self.in_head = False
+        self.heading = False
+
+    def flush(self):
+        text = " ".join("".join(self.text).split())
+        if text:
+            self.blocks.append((self.heading, text))
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "head":
+            self.in_head = True
+            return
+        if self.in_head and tag not in self.HEAD_TAGS:
+            self.in_head = False
+        if tag in self.SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            self.heading = tag in self.HEADING_TAGS
+        elif tag in ("td", "th") and self.text:
+            self.text.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.in_head = False
+        elif tag in self.SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            self.heading = False
+
+    def handle_data(self, data):
+        if not self.skipping and not self.in_head:
+            self.text.append(data)
+
+def iter_html_blocks(file, read_chars: int = HTML_READ_CHARS):
+    parser = HTMLBlockParser()
+    with open(file, encoding="utf-8", errors="replace") as f:
+        for data in iter(lambda: f.read(read_chars), ""):
+            parser.feed(data)
+            yield from parser.blocks
+            parser.blocks = []
+    parser.close()
+    parser.flush()
+    yield from parser.blocks
+
+def iter_html_pages(file, max_chars: int = TEXT_PAGE_CHARS):
+    """Yield one page per h1-h3 section of an HTML file, parsed incrementally."""
+    yield from iter_sections(iter_html_blocks(file), max_chars)
+
+def pptx_paragraphs(text_body):
+    if text_body is None:
+        return
+    for paragraph in text_body.findall(f"{A_NS}p"):
+        yield "".join(run.findtext(f"{A_NS}t", "") for run in paragraph.findall(f"{A_NS}r"))
+
+def shape_texts(shape):
+    """Text of a slide shape: text frames, table rows and the shapes of groups."""
+    if shape.tag == f"{P_NS}grpSp":
+        for child in shape:
+            yield from shape_texts(child)
+    elif shape.tag == f"{P_NS}sp":
+        yield from pptx_paragraphs(shape.find(f"{P_NS}txBody"))
+    elif shape.tag == f"{P_NS}graphicFrame":
+        for row in shape.iter(f"{A_NS}tr"):
+            yield " | ".join("\n".join(pptx_paragraphs(cell.find(f"{A_NS}txBody"))) for cell in row.findall(f"{A_NS}tc"))
+
+def pptx_relationships(archive, part: str) -> dict:
+    """Relationship id -> (type, part name) of an OOXML part."""
+    folder, name = posixpath.split(part)
+    try:
+        rels = ElementTree.fromstring(archive.read(posixpath.join(folder, "_rels", f"{name}.rels")))
+    except KeyError:
+        return {}
+    return {
+        rel.get("Id"): (rel.get("Type", "").rsplit("/", 1)[-1], posixpath.normpath(posixpath.join(folder, rel.get("Target", ""))).lstrip("/"))
+        for rel in rels.iter(f"{REL_NS}Relationship") if rel.get("TargetMode") != "External"
+    }
+
+def pptx_notes(archive, part: str) -> str:
+    notes = ElementTree.fromstring(archive.read(part))
+    for shape in notes.iter(f"{P_NS}sp"):
+        placeholder = shape.find(f"{P_NS}nvSpPr/{P_NS}nvPr/{P_NS}ph")
+        if placeholder is not None and placeholder.get("type") == "body":
+            return "\n".join(pptx_paragraphs(shape.find(f"{P_NS}txBody"))).strip()
+    return ""
+
+def iter_pptx_pages(file):
+    """
+    Yield one page per slide, with its speaker notes, referenced as "Slide <n>". Slide
+    parts are read one at a time, so images and other slides are never held in memory.
+    """
+    with zipfile.ZipFile(file) as archive:
+        presentation = ElementTree.fromstring(archive.read("ppt/presentation.xml"))
+        slides = pptx_relationships(archive, "ppt/presentation.xml")
+        slide_ids = presentation.findall(f"{P_NS}sldIdLst/{P_NS}sldId")
+        for number, slide_id in enumerate(slide_ids, start=1):
+            part = slides[slide_id.get(f"{R_NS}id")][1]
+            slide = ElementTree.fromstring(archive.read(part))
+            tree = slide.find(f"{P_NS}cSld/{P_NS}spTree")
+            lines = [text.strip() for shape in (tree if tree is not None else []) for text in shape_texts(shape)]
+            for kind, target in pptx_relationships(archive, part).values():
+                if kind == "notesSlide":
+                    notes = pptx_notes(archive, target)
+                    if notes:
+                        lines.append(f"Notes: {notes}")
+            text = "\n".join(line for line in lines if line)
+            if text:
+                yield {"text": text, "page_number": f"Slide {number}"}
+
+def iter_pages(file):
+    """Lazily extract {"text", "page_number"} pages of a supported file."""
+    ext = Path(file).suffix.lower()
+    if ext == ".pdf":
+        for page in iter_pdf_pages(file):
+            yield {"text": page["text"], "page_number": page["page"]}
+    elif ext == ".docx":
+        yield from iter_docx_pages(file)
+    elif ext in [".xls", ".xlsx"]:
+        yield from iter_excel_pages(file)
+    elif ext == ".txt":
+        yield from iter_text_pages(file)
+    elif ext in [".html", ".htm"]:
+        yield from iter_html_pages(file)
+    elif ext == ".pptx":
+        yield from iter_pptx_pages(file)
+    else:
+        raise ValueError(f"Unsupported file extension: {ext}")
+
+def process_file(file=None, classify=True):
+    """
+    Returns (filename, file_type, doc_type, pages) where pages is an iterator that
+    extracts one page or sheet slice at a time, so memory stays bounded however large
+    the file is. The first page is read up front to classify the document; with
+    classify=False the document type is left as None so callers can classify many
+    files in one batch.
+    """
     if os.path.exists(file):
         ext = Path(file).suffix.lower()
         filename = Path(file).name
         file_type = get_document_type(filename)
-
-        if ext == ".pdf":
-            pages = extract_text_with_page_numbers(file)
-            doc_type = infer_document_type(pages[0]['text'])
-            cleaned_pages = [
-                {"text": page["text"], "page_number": page["page"]} 
-                for page in pages if page["text"].strip()
-            ]
-        elif ext in [".doc", ".docx"]:
-            from docx import Document
-            doc = Document(file)
-            cleaned_pages = "\n".join(para.text for para in doc.paragraphs)
-            return filename, file_type, doc_type, cleaned_pages   
-        elif ext in [".xls", ".xlsx"]:
-            xls = pd.read_excel(file, sheet_name=None)  # Load all sheets
-            cleaned_pages = []
-
-            for sheet_name, df in xls.items():
-                df = df.dropna(how="all").reset_index(drop=True)
-
-                # Collect each row as a "key: value" string
-                rows = []
-                for _, row in df.iterrows():
-                    row_str = "; ".join(f"{col}: {row[col]}" for col in df.columns if pd.notna(row[col]))
-                    if row_str.strip():
-                        rows.append(f"- {row_str}")
-
-                # Add structured content per sheet
-                if rows:
-                    cleaned_pages.append({
-                        "text": f"Sheet: {sheet_name}\n" + "\n".join(rows),
-                        "page_number": sheet_name
-                    })
-                    
-                doc_type = infer_document_type(cleaned_pages[0]['text'])
-
-        else:
+        if ext not in SUPPORTED_EXTENSIONS:
             raise ValueError(f"Unsupported file extension: {ext}")
 
-        return filename, file_type, doc_type, cleaned_pages
+        pages = iter_pages(file)
+        doc_type = None
+        if classify:
+            first = next(pages, None)
+            if first is not None:
+                doc_type = infer_document_type(first["text"])
+                pages = itertools.chain([first], pages)
+
+        return filename, file_type, doc_type, pages
     else:
         #print("File does not exist!")
         return None, None, None, None